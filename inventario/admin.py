@@ -1,6 +1,10 @@
 from django.contrib import admin
-from .models import LogAdmin, Venta, EstadisticaVenta
+from .models import LogAdmin, Venta, EstadisticaVenta, VentaDiariaProducto, VentaDiariaCliente, PosicionRanking, VentanaRanking
 
 admin.site.register(LogAdmin)
 admin.site.register(Venta)
-admin.site.register(EstadisticaVenta)
\ No newline at end of file
+admin.site.register(EstadisticaVenta)
+admin.site.register(VentaDiariaProducto)
+admin.site.register(VentaDiariaCliente)
+admin.site.register(PosicionRanking)
+admin.site.register(VentanaRanking)
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:57
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+import django.db.models.deletion
+
+
+def unificar_fechas(apps, schema_editor):
+    # fecha pasa a ser única: las filas repetidas de un día se suman en la primera y se borran las demás
+    # (recalcular_estadisticas reconstruye luego los acumulados desde los pedidos)
+    EstadisticaVenta = apps.get_model("inventario", "EstadisticaVenta")
+    repetidas = (
+        EstadisticaVenta.objects.order_by()
+        .values("fecha")
+        .annotate(filas=Count("pk"), primera=Min("pk"), ventas=Sum("total_ventas"), ingresos=Sum("total_ingresos"))
+        .filter(filas__gt=1)
+    )
+    for fila in repetidas:
+        EstadisticaVenta.objects.filter(pk=fila["primera"]).update(total_ventas=fila["ventas"], total_ingresos=fila["ingresos"])
+        EstadisticaVenta.objects.filter(fecha=fila["fecha"]).exclude(pk=fila["primera"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0014_movimientos_inventario"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("inventario", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_fechas, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="estadisticaventa",
+            name="unidades",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="estadisticaventa",
+            name="fecha",
+            field=models.DateField(unique=True),
+        ),
+        migrations.CreateModel(
+            name="VentaDiariaProducto",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField()),
+                ("unidades", models.PositiveIntegerField(default=0)),
+                (
+                    "ingresos",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "producto",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventas_diarias",
+                        to="tienda.producto",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["producto", "fecha"], name="venta_dia_producto_idx"
+                    )
+                ],
+                "unique_together": {("fecha", "producto")},
+            },
+        ),
+        migrations.CreateModel(
+            name="VentaDiariaCliente",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateField()),
+                ("pedidos", models.PositiveIntegerField(default=0)),
+                (
+                    "total",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ventas_diarias",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["usuario", "fecha"], name="venta_dia_cliente_idx"
+                    )
+                ],
+                "unique_together": {("fecha", "usuario")},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventario", "0003_acumulados_diarios"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VentanaRanking",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dias", models.PositiveIntegerField(unique=True)),
+                ("hasta", models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PosicionRanking",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tablero", models.CharField(max_length=30)),
+                ("objeto_id", models.PositiveIntegerField()),
+                (
+                    "valor",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["tablero", "-valor", "objeto_id"],
+                        name="ranking_tablero_valor_idx",
+                    )
+                ],
+                "unique_together": {("tablero", "objeto_id")},
+            },
+        ),
+    ]
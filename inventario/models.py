@@ -19,10 +19,59 @@ class Venta(models.Model):
     def __str__(self):
         return f"Venta de {self.pedido.usuario} - Estado: {self.estado}"
 
+# Acumulados diarios de ventas (día local de la tienda); los mantiene tienda.acumulados en cada pedido
 class EstadisticaVenta(models.Model):
-    fecha = models.DateField()
+    fecha = models.DateField(unique=True)
     total_ventas = models.PositiveIntegerField(default=0)
     total_ingresos = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    unidades = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.fecha}: {self.total_ventas} ventas, ${self.total_ingresos}"
+
+class VentaDiariaProducto(models.Model):
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='ventas_diarias')
+    unidades = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('fecha', 'producto')
+        indexes = [models.Index(fields=['producto', 'fecha'], name='venta_dia_producto_idx')]
+
+    def __str__(self):
+        return f"{self.fecha}: {self.unidades} x {self.producto_id}"
+
+class VentaDiariaCliente(models.Model):
+    fecha = models.DateField()
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='ventas_diarias')
+    pedidos = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('fecha', 'usuario')
+        indexes = [models.Index(fields=['usuario', 'fecha'], name='venta_dia_cliente_idx')]
+
+    def __str__(self):
+        return f"{self.fecha}: {self.pedidos} pedidos de {self.usuario_id}"
+
+# Rankings de ventas (ver tienda.rankings): una fila por objeto y tablero, leída por el índice (tablero, valor)
+class PosicionRanking(models.Model):
+    tablero = models.CharField(max_length=30)
+    objeto_id = models.PositiveIntegerField()
+    valor = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('tablero', 'objeto_id')
+        indexes = [models.Index(fields=['tablero', '-valor', 'objeto_id'], name='ranking_tablero_valor_idx')]
+
+    def __str__(self):
+        return f"{self.tablero}: {self.objeto_id} = {self.valor}"
+
+class VentanaRanking(models.Model):
+    """Último día local hasta el que se deslizaron los tableros de los últimos `dias` días."""
+    dias = models.PositiveIntegerField(unique=True)
+    hasta = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.dias} días hasta {self.hasta}"
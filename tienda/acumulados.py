@@ -0,0 +1,199 @@
+"""
+Acumulados diarios de ventas (app inventario): EstadisticaVenta por día, VentaDiariaProducto por día y
+producto y VentaDiariaCliente por día y cliente.
+
+Se mantienen de forma incremental en la misma transacción que el pedido: crear, cambiar de estado,
+desactivar o borrar un pedido (o sus detalles) suma o resta su aporte con un upsert por tabla (INSERT de
+las filas que faltan + un UPDATE con F()), sin recorrer el historial. El día de un pedido es la fecha
+local de la tienda (TIME_ZONE) de `creado`. Un pedido cuenta si está activo y su estado no es de
+anulación (ESTADOS_ANULADOS). recalcular() reconstruye los acumulados desde Pedido/DetallePedido.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q, Sum, Count, Case, When, Value, DecimalField, IntegerField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from inventario.models import EstadisticaVenta, VentaDiariaProducto, VentaDiariaCliente
+from .models import Pedido, DetallePedido, EstadoVenta
+from . import analitica, rankings
+import logging
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_ANULADOS = ('cancelado', 'cancelada', 'anulado', 'anulada', 'rechazado', 'rechazada')
+LOTE = 1000
+
+_DINERO = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _sumar(modelo, clave, filas):
+    """
+    filas: {(fecha, id de `clave`): {campo: delta}} (clave=None: {fecha: {...}}). Crea las filas que faltan
+    en cero y aplica todos los deltas con un único UPDATE.
+    """
+    filas = {llave: deltas for llave, deltas in filas.items() if any(deltas.values())}
+    if not filas:
+        return
+    def filtro(llave):
+        return {'fecha': llave} if clave is None else {'fecha': llave[0], clave: llave[1]}
+    modelo.objects.bulk_create([modelo(**filtro(llave)) for llave in filas], ignore_conflicts=True)
+    condicion = Q()
+    for llave in filas:
+        condicion |= Q(**filtro(llave))
+    campos = {campo for deltas in filas.values() for campo in deltas}
+    cambios = {}
+    for campo in campos:
+        tipo = _DINERO if isinstance(modelo._meta.get_field(campo), DecimalField) else IntegerField()
+        cambios[campo] = F(campo) + Case(
+            *[When(**filtro(llave), then=Value(deltas.get(campo, 0))) for llave, deltas in filas.items()],
+            default=Value(0), output_field=tipo,
+        )
+    modelo.objects.filter(condicion).update(**cambios)
+
+
+def dia(fecha_hora):
+    return timezone.localdate(fecha_hora)
+
+
+def cuenta(activo, estado_nombre):
+    return bool(activo) and (estado_nombre or '').lower() not in ESTADOS_ANULADOS
+
+
+def _dia_cambiado(fecha):
+    # Los períodos de días pasados están en la caché de la analítica; el día en curso nunca se guarda
+    if fecha < timezone.localdate():
+        analitica.invalidar([fecha])
+
+
+def _aporte_pedido(fecha, usuario_id, total, signo):
+    _dia_cambiado(fecha)
+    total = Decimal(total or 0) * signo
+    _sumar(EstadisticaVenta, None, {fecha: {'total_ventas': signo, 'total_ingresos': total}})
+    # Los rankings van antes: si deslizan su ventana, la reconstruyen desde los acumulados aún sin este cambio
+    rankings.sumar_clientes(fecha, {usuario_id: total})
+    _sumar(VentaDiariaCliente, 'usuario_id', {(fecha, usuario_id): {'pedidos': signo, 'total': total}})
+
+
+def _aporte_lineas(fecha, lineas, signo):
+    """lineas: [(producto_id, cantidad, precio_unitario)]."""
+    _dia_cambiado(fecha)
+    productos = defaultdict(lambda: {'unidades': 0, 'ingresos': Decimal('0')})
+    for producto_id, cantidad, precio in lineas:
+        productos[(fecha, producto_id)]['unidades'] += signo * cantidad
+        productos[(fecha, producto_id)]['ingresos'] += signo * cantidad * Decimal(precio)
+    rankings.sumar_productos(fecha, {producto_id: fila['unidades'] for (_, producto_id), fila in productos.items()})
+    _sumar(VentaDiariaProducto, 'producto_id', productos)
+    _sumar(EstadisticaVenta, None, {fecha: {'unidades': sum(fila['unidades'] for fila in productos.values())}})
+
+
+def _lineas_pedido(pedido_id):
+    return list(DetallePedido.objects.filter(pedido_id=pedido_id).values_list('producto_id', 'cantidad', 'precio_unitario'))
+
+
+def estado_pedido(pedido_id):
+    """Fecha local en que cuenta el pedido, o None si no cuenta (o no existe)."""
+    fila = Pedido.objects.filter(pk=pedido_id).values_list('creado', 'activo', 'estado__nombre').first()
+    if fila is None or not cuenta(fila[1], fila[2]):
+        return None
+    return dia(fila[0])
+
+
+def leer_pedido(pedido_id):
+    """Huella del pedido para los acumulados: (fecha en que cuenta o None, usuario_id, total); None si no existe."""
+    fila = Pedido.objects.filter(pk=pedido_id).values_list('creado', 'activo', 'estado__nombre', 'usuario_id', 'total').first()
+    if fila is None:
+        return None
+    creado, activo, estado, usuario_id, total = fila
+    return (dia(creado) if cuenta(activo, estado) else None, usuario_id, total)
+
+
+def pedido_cambiado(pedido_id, anterior, actual):
+    """
+    Aplica la diferencia entre dos huellas de un pedido (None = no existía). Si cambia el día o si cuenta,
+    también se mueven sus líneas.
+    """
+    if anterior == actual:
+        return
+    anterior_fecha = anterior[0] if anterior else None
+    actual_fecha = actual[0] if actual else None
+    if anterior_fecha is not None:
+        _aporte_pedido(anterior_fecha, anterior[1], anterior[2], -1)
+    if actual_fecha is not None:
+        _aporte_pedido(actual_fecha, actual[1], actual[2], 1)
+    if anterior_fecha != actual_fecha:
+        lineas = _lineas_pedido(pedido_id)
+        if lineas:
+            if anterior_fecha is not None:
+                _aporte_lineas(anterior_fecha, lineas, -1)
+            if actual_fecha is not None:
+                _aporte_lineas(actual_fecha, lineas, 1)
+
+
+def lineas(pedido_id, detalles, signo=1):
+    """Suma (o resta) los detalles de un pedido si el pedido cuenta; la compra la usa tras su bulk_create."""
+    fecha = estado_pedido(pedido_id)
+    if fecha is not None and detalles:
+        _aporte_lineas(fecha, [(d.producto_id, d.cantidad, d.precio_unitario) for d in detalles], signo)
+
+
+def pedido_borrado(anterior):
+    """Resta el aporte de un pedido borrado; sus líneas se restan al borrarse cada DetallePedido en cascada."""
+    if anterior and anterior[0] is not None:
+        _aporte_pedido(anterior[0], anterior[1], anterior[2], -1)
+
+
+def linea_cambiada(anterior, actual):
+    """Diferencia de un DetallePedido: cada lado es (pedido_id, producto_id, cantidad, precio_unitario) o None."""
+    if anterior == actual:
+        return
+    for lado, signo in ((anterior, -1), (actual, 1)):
+        if lado is None:
+            continue
+        fecha = estado_pedido(lado[0])
+        if fecha is not None:
+            _aporte_lineas(fecha, [lado[1:]], signo)
+
+
+# --- Reconstrucción ---
+def _contados(desde=None):
+    anulados = [pk for pk, nombre in EstadoVenta.objects.values_list('pk', 'nombre') if not cuenta(True, nombre)]
+    pedidos = Pedido.objects.filter(activo=True).exclude(estado_id__in=anulados)
+    if desde is not None:
+        # Desde el inicio del día local
+        pedidos = pedidos.filter(creado__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    return pedidos
+
+
+def recalcular(desde=None):
+    """
+    Borra y reconstruye los acumulados (todos o desde la fecha `desde`) con consultas agrupadas por día
+    local en la base de datos. Retorna cuántos días quedaron con ventas.
+    """
+    fecha = TruncDate('creado', tzinfo=timezone.get_current_timezone())
+    pedidos = _contados(desde)
+    lineas_contadas = DetallePedido.objects.filter(pedido__in=pedidos.values('pk'))
+    ingresos_linea = Sum(F('cantidad') * F('precio_unitario'), output_field=_DINERO)
+    with transaction.atomic():
+        for modelo in (EstadisticaVenta, VentaDiariaProducto, VentaDiariaCliente):
+            filas = modelo.objects.all() if desde is None else modelo.objects.filter(fecha__gte=desde)
+            filas.delete()
+        dias = {
+            fila['dia']: EstadisticaVenta(fecha=fila['dia'], total_ventas=fila['pedidos'], total_ingresos=fila['total'] or 0)
+            for fila in pedidos.annotate(dia=fecha).order_by().values('dia').annotate(pedidos=Count('id'), total=Sum('total'))
+        }
+        productos = []
+        for fila in lineas_contadas.annotate(dia=TruncDate('pedido__creado', tzinfo=timezone.get_current_timezone())).order_by().values('dia', 'producto_id').annotate(unidades=Sum('cantidad'), ingresos=ingresos_linea):
+            productos.append(VentaDiariaProducto(fecha=fila['dia'], producto_id=fila['producto_id'], unidades=fila['unidades'], ingresos=fila['ingresos']))
+            dias.setdefault(fila['dia'], EstadisticaVenta(fecha=fila['dia'])).unidades += fila['unidades']
+        EstadisticaVenta.objects.bulk_create(dias.values(), batch_size=LOTE)
+        VentaDiariaProducto.objects.bulk_create(productos, batch_size=LOTE)
+        VentaDiariaCliente.objects.bulk_create([
+            VentaDiariaCliente(fecha=fila['dia'], usuario_id=fila['usuario_id'], pedidos=fila['pedidos'], total=fila['total'] or 0)
+            for fila in pedidos.annotate(dia=fecha).order_by().values('dia', 'usuario_id').annotate(pedidos=Count('id'), total=Sum('total'))
+        ], batch_size=LOTE)
+        rankings.recalcular()
+    analitica.invalidar_todo()
+    logger.info(f"Acumulados de ventas recalculados: {len(dias)} días, {len(productos)} filas de productos")
+    return len(dias)
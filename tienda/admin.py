@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Usuario, Categoria, Subcategoria, Producto, Pedido, DetallePedido, Comentario, Calificacion, Like, ImagenProducto, Carrito, CarritoItem, EstadoVenta, Compra, DetalleCompra
+from .models import Usuario, Categoria, Subcategoria, Producto, Pedido, DetallePedido, Comentario, Calificacion, Like, ImagenProducto, Carrito, CarritoItem, ReservaStock, EstadoVenta, Compra, DetalleCompra, Tarea, MovimientoInventario
 from django.contrib.auth.admin import UserAdmin
+from . import movimientos
 
 class UsuarioAdmin(UserAdmin):
     model = Usuario
@@ -63,6 +64,12 @@ class ProductoAdmin(admin.ModelAdmin):
     list_filter = ('subcategoria', 'destacado', 'activo')
     search_fields = ('nombre',)
     readonly_fields = ('fecha_creacion',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # La edición directa del stock queda en el libro como ajuste (el stock inicial lo registra tienda.signals)
+        if change and 'stock' in form.changed_data:
+            movimientos.ajuste(obj.pk, obj.stock - form.initial['stock'], request.user, 'Edición desde el admin', actualizar_stock=False)
     
     def get_imagen_principal(self, obj):
         imagen_principal = obj.imagenes.filter(es_principal=True).first()
@@ -96,3 +103,33 @@ class CarritoAdmin(admin.ModelAdmin):
     search_fields = ('usuario__numero',)
 
 admin.site.register(Carrito, CarritoAdmin)
+
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'producto', 'cantidad', 'expira')
+    search_fields = ('usuario__numero', 'producto__nombre')
+
+admin.site.register(ReservaStock, ReservaStockAdmin)
+
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'funcion', 'estado', 'intentos', 'ejecutar_en', 'finalizada')
+    list_filter = ('estado', 'funcion')
+    readonly_fields = ('ultimo_error',)
+
+admin.site.register(Tarea, TareaAdmin)
+
+class MovimientoInventarioAdmin(admin.ModelAdmin):
+    # El libro solo se amplía desde tienda.movimientos
+    list_display = ('fecha', 'producto', 'tipo', 'cantidad', 'usuario', 'nota')
+    list_filter = ('tipo',)
+    search_fields = ('producto__nombre',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(MovimientoInventario, MovimientoInventarioAdmin)
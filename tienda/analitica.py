@@ -0,0 +1,129 @@
+"""
+Analítica de ventas para el panel de admin: ingresos, pedidos y unidades por día, semana o mes.
+
+Las series se agregan en la base de datos con Trunc* sobre EstadisticaVenta, cuyos días ya son fechas
+locales de la tienda (TIME_ZONE, ver tienda.acumulados): una semana o un mes es exactamente el de
+America/Bogota y no el de UTC. Cada período terminado y contenido por completo en el rango se guarda en
+la caché sin vencimiento; solo el período en curso (y los extremos recortados de un rango arbitrario) se
+recalculan en cada consulta. Una corrección tardía (p. ej. cancelar un pedido de la semana pasada)
+descarta los períodos de ese día, y recalcular los acumulados descarta todos.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+from inventario.models import EstadisticaVenta
+
+PERIODOS = {'dia': TruncDay, 'semana': TruncWeek, 'mes': TruncMonth}
+MAX_PERIODOS = 400
+CLAVE_VERSION = 'analitica:version'
+
+
+class AnaliticaError(Exception):
+    pass
+
+
+def inicio_periodo(fecha, periodo):
+    if periodo == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    if periodo == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def siguiente_periodo(inicio, periodo):
+    if periodo == 'semana':
+        return inicio + timedelta(days=7)
+    if periodo == 'mes':
+        return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio + timedelta(days=1)
+
+
+def _version():
+    return cache.get_or_set(CLAVE_VERSION, 1, None)
+
+
+def _clave(version, periodo, inicio):
+    return f'analitica:{version}:{periodo}:{inicio.isoformat()}'
+
+
+def invalidar(fechas):
+    """Descarta, al confirmar, los períodos guardados que contienen alguna de las `fechas`."""
+    def borrar():
+        version = _version()
+        cache.delete_many([_clave(version, periodo, inicio_periodo(fecha, periodo)) for fecha in fechas for periodo in PERIODOS])
+    transaction.on_commit(borrar)
+
+
+def invalidar_todo():
+    """Cambia la versión: ningún período guardado vuelve a leerse (quedan para el desalojo)."""
+    def cambiar():
+        if not cache.add(CLAVE_VERSION, 2, None):
+            cache.incr(CLAVE_VERSION)
+    transaction.on_commit(cambiar)
+
+
+def _vacio(inicio):
+    return {'inicio': inicio.isoformat(), 'pedidos': 0, 'ingresos': Decimal('0'), 'unidades': 0}
+
+
+def _agregar(periodo, desde, hasta):
+    """{inicio del período: fila} con los acumulados entre `desde` y `hasta` (inclusive), agrupados en la base de datos."""
+    filas = (
+        EstadisticaVenta.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        .annotate(inicio=PERIODOS[periodo]('fecha')).order_by().values('inicio')
+        .annotate(pedidos=Sum('total_ventas'), ingresos=Sum('total_ingresos'), unidades=Sum('unidades'))
+    )
+    return {
+        fila['inicio']: {'inicio': fila['inicio'].isoformat(), 'pedidos': fila['pedidos'], 'ingresos': fila['ingresos'], 'unidades': fila['unidades']}
+        for fila in filas
+    }
+
+
+def serie(desde, hasta, periodo='dia'):
+    """
+    Lista de períodos entre las fechas locales `desde` y `hasta` (inclusive), sin huecos. Los períodos de
+    los extremos solo cuentan los días dentro del rango.
+    """
+    if periodo not in PERIODOS:
+        raise AnaliticaError(f'Período inválido: {periodo}. Opciones: {", ".join(PERIODOS)}.')
+    if desde > hasta:
+        raise AnaliticaError('La fecha inicial es posterior a la final.')
+    hoy = timezone.localdate()
+    periodos = []
+    inicio = inicio_periodo(desde, periodo)
+    while inicio <= hasta:
+        fin = siguiente_periodo(inicio, periodo) - timedelta(days=1)
+        # Solo se guarda un período cerrado y completo dentro del rango
+        periodos.append((inicio, inicio >= desde and fin <= hasta and fin < hoy))
+        if len(periodos) > MAX_PERIODOS:
+            raise AnaliticaError(f'El rango abarca más de {MAX_PERIODOS} períodos.')
+        inicio = fin + timedelta(days=1)
+    version = _version()
+    guardados = cache.get_many([_clave(version, periodo, inicio) for inicio, cerrado in periodos if cerrado])
+    faltantes = [inicio for inicio, cerrado in periodos if _clave(version, periodo, inicio) not in guardados]
+    calculados = {}
+    if faltantes:
+        # Una consulta para todos los faltantes; el rango se recorta a [desde, hasta]
+        calculados = _agregar(periodo, max(faltantes[0], desde), min(siguiente_periodo(faltantes[-1], periodo) - timedelta(days=1), hasta))
+        nuevos = {
+            _clave(version, periodo, inicio): calculados.get(inicio, _vacio(inicio))
+            for inicio, cerrado in periodos if cerrado and inicio in faltantes
+        }
+        if nuevos:
+            cache.set_many(nuevos, None)
+    return [
+        guardados.get(_clave(version, periodo, inicio)) or calculados.get(inicio) or _vacio(inicio)
+        for inicio, _ in periodos
+    ]
+
+
+def totales(filas):
+    return {
+        'pedidos': sum(fila['pedidos'] for fila in filas),
+        'ingresos': sum((fila['ingresos'] for fila in filas), Decimal('0')),
+        'unidades': sum(fila['unidades'] for fila in filas),
+    }
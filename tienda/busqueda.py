@@ -0,0 +1,159 @@
+"""
+Motor de búsqueda de productos: índice invertido en la base de datos con ranking BM25.
+
+Los textos se normalizan sin tildes, se eliminan palabras vacías y se reducen con un stemmer ligero de
+español. Cada producto se indexa con sus términos ponderados por campo (nombre, subcategoría, categoría,
+descripción) en TerminoIndice; el índice se actualiza al guardar productos, subcategorías o categorías
+(ver tienda.signals) y se reconstruye con `python manage.py reindexar_busqueda`.
+Funciona igual en PostgreSQL y SQLite, y los filtros de la vista se aplican sobre los resultados del índice.
+"""
+from collections import Counter, defaultdict
+from hashlib import sha1
+import math
+import re
+import unicodedata
+from django.db import transaction
+from django.db.models import Count, Avg
+from .models import Producto, TerminoIndice, DocumentoIndice
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada campo en la frecuencia del término
+PESOS_CAMPOS = {'nombre': 3.0, 'subcategoria': 2.0, 'categoria': 2.0, 'descripcion': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_EXPANSION_PREFIJO = 30
+
+PALABRAS_VACIAS = {
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'es', 'la', 'las', 'lo', 'los', 'o', 'para', 'por',
+    'se', 'sin', 'su', 'sus', 'u', 'un', 'una', 'unos', 'unas', 'y', 'que', 'mas', 'muy',
+}
+SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'iciones', 'idades', 'acion', 'icion',
+    'mente', 'idad', 'antes', 'entes', 'ante', 'ente', 'ables', 'ibles', 'able', 'ible', 'osos', 'osas',
+    'oso', 'osa',
+)
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes ni diéresis (la ñ se reduce a n)."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def raiz(palabra):
+    """Stemmer ligero de español: sufijos derivativos frecuentes, plurales y vocal final de género."""
+    if len(palabra) <= 3 or palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    if palabra.endswith('ces'):
+        palabra = palabra[:-3] + 'z'
+    elif palabra.endswith('es') and len(palabra) > 4 and palabra[-3] not in 'aeiou':
+        palabra = palabra[:-2]
+    elif palabra.endswith('s'):
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra[-1] in 'aeo':
+        palabra = palabra[:-1]
+    return palabra
+
+
+def palabras(texto):
+    return [p for p in re.findall(r'[a-z0-9]+', normalizar(texto)) if p not in PALABRAS_VACIAS]
+
+
+def tokenizar(texto):
+    return [raiz(p) for p in palabras(texto)]
+
+
+def terminos_ponderados(nombre, descripcion, subcategoria, categoria):
+    """Frecuencias ponderadas por campo y longitud (ponderada) del documento."""
+    frecuencias = Counter()
+    for campo, texto in (('nombre', nombre), ('subcategoria', subcategoria), ('categoria', categoria), ('descripcion', descripcion)):
+        for termino in tokenizar(texto):
+            frecuencias[termino[:60]] += PESOS_CAMPOS[campo]
+    return frecuencias, sum(frecuencias.values())
+
+
+def _huella(frecuencias):
+    return sha1(repr(sorted(frecuencias.items())).encode()).hexdigest()
+
+
+def indexar_productos(productos):
+    """(Re)indexa los productos dados (queryset o lista de ids). Omite los que no cambiaron."""
+    filas = Producto.objects.filter(pk__in=productos).values_list(
+        'pk', 'nombre', 'descripcion', 'subcategoria__nombre', 'subcategoria__categoria__nombre'
+    )
+    documentos = {pk: terminos_ponderados(*campos) for pk, *campos in filas}
+    if not documentos:
+        return 0
+    huellas = dict(DocumentoIndice.objects.filter(producto_id__in=documentos).values_list('producto_id', 'huella'))
+    cambiados = {pk: doc for pk, doc in documentos.items() if huellas.get(pk) != _huella(doc[0])}
+    if not cambiados:
+        return 0
+    with transaction.atomic():
+        TerminoIndice.objects.filter(producto_id__in=cambiados).delete()
+        DocumentoIndice.objects.filter(producto_id__in=cambiados).delete()
+        TerminoIndice.objects.bulk_create([
+            TerminoIndice(termino=termino, producto_id=pk, frecuencia=frecuencia, longitud=longitud)
+            for pk, (frecuencias, longitud) in cambiados.items()
+            for termino, frecuencia in frecuencias.items()
+        ], batch_size=1000)
+        DocumentoIndice.objects.bulk_create([
+            DocumentoIndice(producto_id=pk, longitud=longitud, huella=_huella(frecuencias))
+            for pk, (frecuencias, longitud) in cambiados.items()
+        ], batch_size=1000)
+    return len(cambiados)
+
+
+def reindexar_todo(lote=500):
+    ids = list(Producto.objects.order_by('pk').values_list('pk', flat=True))
+    total = 0
+    for inicio in range(0, len(ids), lote):
+        total += indexar_productos(ids[inicio:inicio + lote])
+    return total
+
+
+def _terminos_consulta(q):
+    """Términos de la consulta; el último se expande por prefijo para la búsqueda mientras se escribe."""
+    terminos = list(dict.fromkeys(tokenizar(q)))
+    if not terminos:
+        return []
+    ultima = palabras(q)[-1]
+    if len(ultima) >= 3:
+        expansion = TerminoIndice.objects.filter(termino__startswith=ultima).values_list('termino', flat=True).distinct()
+        terminos.extend(t for t in expansion[:MAX_EXPANSION_PREFIJO] if t not in terminos)
+    return terminos
+
+
+def filtrar(q, queryset):
+    """Restringe `queryset` a los productos que contienen algún término de `q` (subconsulta sobre el índice)."""
+    terminos = _terminos_consulta(q)
+    if not terminos:
+        return queryset
+    return queryset.filter(pk__in=TerminoIndice.objects.filter(termino__in=terminos).values('producto_id'))
+
+
+def buscar(q, queryset):
+    """
+    Ids de los productos de `queryset` que coinciden con `q`, ordenados por relevancia BM25 (desc) e id.
+    """
+    terminos = _terminos_consulta(q)
+    if not terminos:
+        return []
+    estadisticas = DocumentoIndice.objects.aggregate(total=Count('pk'), promedio=Avg('longitud'))
+    total_documentos = estadisticas['total'] or 0
+    longitud_promedio = estadisticas['promedio'] or 1.0
+    frecuencia_documental = dict(
+        TerminoIndice.objects.filter(termino__in=terminos).values('termino').annotate(df=Count('pk')).values_list('termino', 'df')
+    )
+    puntajes = defaultdict(float)
+    coincidencias = TerminoIndice.objects.filter(termino__in=terminos, producto__in=queryset.order_by().values('pk'))
+    for producto_id, termino, frecuencia, longitud in coincidencias.values_list('producto_id', 'termino', 'frecuencia', 'longitud'):
+        df = frecuencia_documental.get(termino, 0)
+        idf = math.log(1 + (total_documentos - df + 0.5) / (df + 0.5))
+        normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * longitud / longitud_promedio)
+        puntajes[producto_id] += idf * frecuencia * (BM25_K1 + 1) / (frecuencia + normalizacion)
+    return sorted(puntajes, key=lambda pk: (-puntajes[pk], pk))
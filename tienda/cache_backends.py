@@ -0,0 +1,310 @@
+"""
+Backends de caché compartidos entre workers de gunicorn.
+
+- SQLiteCache: caché en un archivo SQLite (modo WAL) compartido por todos los procesos de la máquina,
+  sin servicios externos. incr/add son atómicos, por lo que sirve para contadores de versión y locks.
+- MetricasRedisCache: Redis (opcional, requiere el paquete redis) para despliegues con varias máquinas.
+- MetricasLocMemCache: memoria local del proceso, solo para desarrollo.
+
+Todos comparten MetricasCacheMixin: TTL por espacio de nombres (settings.CACHE_TTL_NAMESPACES, el espacio
+es el prefijo de la clave antes de ':') y contadores de aciertos, fallos, escrituras y desalojos por espacio.
+Los contadores se acumulan en memoria y se vuelcan periódicamente a la propia caché para sumar todos los workers.
+"""
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+import pickle
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_METRICAS = 'cache_metricas'
+TIPOS_METRICA = ('aciertos', 'fallos', 'escrituras', 'desalojos')
+_AUSENTE = object()
+
+
+def espacio_de(clave):
+    return clave.split(':', 1)[0] if ':' in clave else 'general'
+
+
+class MetricasCacheMixin:
+    volcado_cada_operaciones = 200
+    volcado_cada_segundos = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metricas_pendientes = Counter()
+        self._metricas_lock = threading.Lock()
+        self._espacios_vistos = set()
+        self._ultimo_volcado = time.monotonic()
+
+    # --- TTL por espacio de nombres ---
+    def _timeout_para(self, key, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            ttl = getattr(settings, 'CACHE_TTL_NAMESPACES', {}).get(espacio_de(key), _AUSENTE)
+            if ttl is not _AUSENTE:
+                return ttl
+        return timeout
+
+    # --- Registro de métricas ---
+    def _registrar(self, espacio, tipo, cantidad=1):
+        if espacio == PREFIJO_METRICAS or not cantidad:
+            return
+        with self._metricas_lock:
+            self._metricas_pendientes[(espacio, tipo)] += cantidad
+            self._espacios_vistos.add(espacio)
+            pendientes = sum(self._metricas_pendientes.values())
+            vencido = time.monotonic() - self._ultimo_volcado > self.volcado_cada_segundos
+        if pendientes >= self.volcado_cada_operaciones or vencido:
+            self.volcar_metricas()
+
+    def volcar_metricas(self):
+        """Suma los contadores locales a los contadores compartidos en la caché."""
+        with self._metricas_lock:
+            pendientes, self._metricas_pendientes = self._metricas_pendientes, Counter()
+            espacios = set(self._espacios_vistos)
+            self._ultimo_volcado = time.monotonic()
+        try:
+            for (espacio, tipo), cantidad in pendientes.items():
+                clave = f'{PREFIJO_METRICAS}:{espacio}:{tipo}'
+                super().add(clave, 0, None)
+                super().incr(clave, cantidad)
+            clave_espacios = f'{PREFIJO_METRICAS}:espacios'
+            registrados = super().get(clave_espacios) or set()
+            if not espacios <= registrados:
+                super().set(clave_espacios, registrados | espacios, None)
+        except Exception as e:
+            logger.warning(f"No se pudieron volcar las métricas de caché: {e}")
+
+    def metricas(self):
+        """Contadores por espacio de nombres sumando todos los workers (incluye lo pendiente de este proceso)."""
+        self.volcar_metricas()
+        espacios = (super().get(f'{PREFIJO_METRICAS}:espacios') or set()) | set(getattr(settings, 'CACHE_TTL_NAMESPACES', {}))
+        resultado = {}
+        for espacio in sorted(espacios):
+            datos = {}
+            for tipo in TIPOS_METRICA:
+                datos[tipo] = super().get(f'{PREFIJO_METRICAS}:{espacio}:{tipo}') or 0
+            lecturas = datos['aciertos'] + datos['fallos']
+            datos['tasa_aciertos'] = round(datos['aciertos'] / lecturas, 4) if lecturas else None
+            datos['ttl'] = getattr(settings, 'CACHE_TTL_NAMESPACES', {}).get(espacio, self.default_timeout)
+            resultado[espacio] = datos
+        return resultado
+
+    def reiniciar_metricas(self):
+        with self._metricas_lock:
+            self._metricas_pendientes.clear()
+        espacios = super().get(f'{PREFIJO_METRICAS}:espacios') or set()
+        for espacio in espacios:
+            for tipo in TIPOS_METRICA:
+                super().delete(f'{PREFIJO_METRICAS}:{espacio}:{tipo}')
+
+    # --- API de caché instrumentada ---
+    def get(self, key, default=None, version=None):
+        valor = super().get(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            self._registrar(espacio_de(key), 'fallos')
+            return default
+        self._registrar(espacio_de(key), 'aciertos')
+        return valor
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        encontrados = super().get_many(keys, version=version)
+        for key in keys:
+            self._registrar(espacio_de(key), 'aciertos' if key in encontrados else 'fallos')
+        return encontrados
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._registrar(espacio_de(key), 'escrituras')
+        return super().set(key, value, self._timeout_para(key, timeout), version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        agregado = super().add(key, value, self._timeout_para(key, timeout), version=version)
+        if agregado:
+            self._registrar(espacio_de(key), 'escrituras')
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return super().touch(key, self._timeout_para(key, timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version=version)
+        return []
+
+
+class MetricasLocMemCache(MetricasCacheMixin, LocMemCache):
+    pass
+
+
+class MetricasRedisCache(MetricasCacheMixin, RedisCache):
+    pass
+
+
+class _SQLiteCacheBase(BaseCache):
+    """
+    Caché en SQLite. Los enteros se guardan como INTEGER para que incr sea un UPDATE atómico;
+    el resto de valores se serializa con pickle. Cada entrada guarda su espacio de nombres para
+    poder contar desalojos por espacio al purgar.
+    """
+    cull_cada_escrituras = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._ruta = Path(location)
+        self._local = threading.local()
+        self._escrituras = 0
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            self._ruta.parent.mkdir(parents=True, exist_ok=True)
+            conexion = sqlite3.connect(str(self._ruta), timeout=10, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'clave TEXT PRIMARY KEY, valor BLOB, expira REAL, espacio TEXT NOT NULL)'
+            )
+            conexion.execute('CREATE INDEX IF NOT EXISTS cache_expira ON cache (expira)')
+            self._local.conexion = conexion
+        return conexion
+
+    def _expiracion(self, timeout):
+        # get_backend_timeout ya retorna el instante absoluto de expiración (o None si no expira)
+        return self.get_backend_timeout(timeout)
+
+    @staticmethod
+    def _serializar(valor):
+        if isinstance(valor, int) and not isinstance(valor, bool):
+            return valor
+        return sqlite3.Binary(pickle.dumps(valor, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _deserializar(valor):
+        return valor if isinstance(valor, int) else pickle.loads(valor)
+
+    def _clave(self, key, version):
+        clave = self.make_and_validate_key(key, version=version)
+        return clave, espacio_de(key)
+
+    def get(self, key, default=None, version=None):
+        clave, _ = self._clave(key, version)
+        fila = self._conexion().execute(
+            'SELECT valor FROM cache WHERE clave = ? AND (expira IS NULL OR expira > ?)', (clave, time.time())
+        ).fetchone()
+        return default if fila is None else self._deserializar(fila[0])
+
+    def get_many(self, keys, version=None):
+        resultado = {}
+        for key in keys:
+            valor = _SQLiteCacheBase.get(self, key, _AUSENTE, version=version)
+            if valor is not _AUSENTE:
+                resultado[key] = valor
+        return resultado
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave, espacio = self._clave(key, version)
+        self._conexion().execute(
+            'INSERT OR REPLACE INTO cache (clave, valor, expira, espacio) VALUES (?, ?, ?, ?)',
+            (clave, self._serializar(value), self._expiracion(timeout), espacio),
+        )
+        self._tal_vez_purgar()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave, espacio = self._clave(key, version)
+        # Inserta si no existe o si la entrada existente ya expiró, en una sola sentencia
+        cursor = self._conexion().execute(
+            'INSERT INTO cache (clave, valor, expira, espacio) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira '
+            'WHERE cache.expira IS NOT NULL AND cache.expira <= ?',
+            (clave, self._serializar(value), self._expiracion(timeout), espacio, time.time()),
+        )
+        if cursor.rowcount:
+            self._tal_vez_purgar()
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        clave, _ = self._clave(key, version)
+        conexion = self._conexion()
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            fila = conexion.execute(
+                "UPDATE cache SET valor = valor + ? WHERE clave = ? AND typeof(valor) = 'integer' "
+                "AND (expira IS NULL OR expira > ?) RETURNING valor",
+                (delta, clave, time.time()),
+            ).fetchone()
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        if fila is None:
+            raise ValueError("Key '%s' not found" % key)
+        return fila[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        clave, _ = self._clave(key, version)
+        cursor = self._conexion().execute(
+            'UPDATE cache SET expira = ? WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (self._expiracion(timeout), clave, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        clave, _ = self._clave(key, version)
+        return self._conexion().execute('DELETE FROM cache WHERE clave = ?', (clave,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        return _SQLiteCacheBase.get(self, key, _AUSENTE, version=version) is not _AUSENTE
+
+    def clear(self):
+        self._conexion().execute('DELETE FROM cache')
+
+    def _tal_vez_purgar(self):
+        self._escrituras += 1
+        if self._escrituras % self.cull_cada_escrituras == 0:
+            self.purgar()
+
+    def purgar(self):
+        """Elimina entradas expiradas y, si se supera MAX_ENTRIES, la fracción 1/CULL_FREQUENCY más próxima a expirar."""
+        conexion = self._conexion()
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            desalojos = Counter(dict(conexion.execute(
+                'SELECT espacio, COUNT(*) FROM cache WHERE expira IS NOT NULL AND expira <= ? GROUP BY espacio', (time.time(),)
+            ).fetchall()))
+            conexion.execute('DELETE FROM cache WHERE expira IS NOT NULL AND expira <= ?', (time.time(),))
+            total = conexion.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if total > self._max_entries:
+                cantidad = total // self._cull_frequency if self._cull_frequency else total
+                filas = conexion.execute(
+                    'SELECT clave, espacio FROM cache WHERE espacio != ? ORDER BY expira IS NULL, expira LIMIT ?',
+                    (PREFIJO_METRICAS, cantidad),
+                ).fetchall()
+                conexion.executemany('DELETE FROM cache WHERE clave = ?', [(clave,) for clave, _ in filas])
+                desalojos.update(espacio for _, espacio in filas)
+            conexion.execute('COMMIT')
+        except Exception:
+            conexion.execute('ROLLBACK')
+            raise
+        for espacio, cantidad in desalojos.items():
+            self._registrar_desalojo(espacio, cantidad)
+
+    def _registrar_desalojo(self, espacio, cantidad):
+        pass
+
+    def close(self, **kwargs):
+        # La conexión se reutiliza entre peticiones del mismo hilo
+        pass
+
+
+class SQLiteCache(MetricasCacheMixin, _SQLiteCacheBase):
+    def _registrar_desalojo(self, espacio, cantidad):
+        self._registrar(espacio, 'desalojos', cantidad)
@@ -0,0 +1,88 @@
+"""
+Conjuntos de campos parciales (sparse fieldsets) para los listados de productos.
+
+`?fields=id,nombre,precio` o `?vista=lista` limitan a la vez las columnas del SELECT (only()), los JOIN
+y prefetch necesarios y la salida de ProductoSerializer. Las vistas de cuadrícula usan la URL de la
+imagen principal precalculada en Producto.imagen_principal en lugar de cargar todas las imágenes.
+"""
+from rest_framework.exceptions import ValidationError
+from .models import Producto, ImagenProducto
+
+# Campo de salida de ProductoSerializer → columnas que necesita
+COLUMNAS = {
+    'id': ('id',),
+    'subcategoria': ('subcategoria',),
+    'subcategoria_nombre': ('subcategoria__nombre',),
+    'nombre': ('nombre',),
+    'descripcion': ('descripcion',),
+    'precio': ('precio',),
+    'imagen': ('imagen',),
+    'imagen_principal': ('imagen_principal',),
+    'imagenes': (),
+    'stock': ('stock',),
+    'destacado': ('destacado',),
+    'activo': ('activo',),
+    'fecha_creacion': ('fecha_creacion',),
+    'total_reseñas': ('resenas_total',),
+    'total_likes': ('likes_total',),
+    'calificacion_promedio': ('calificacion_promedio', 'calificacion_cantidad'),
+}
+
+VISTAS = {
+    'lista': ('id', 'nombre', 'precio', 'imagen_principal', 'calificacion_promedio', 'total_reseñas'),
+}
+
+
+def campos_solicitados(request):
+    """Tupla ordenada de campos pedidos, o None para la representación completa."""
+    fields = request.query_params.get('fields')
+    vista = request.query_params.get('vista')
+    if fields:
+        campos = {campo.strip() for campo in fields.split(',') if campo.strip()}
+        desconocidos = campos - COLUMNAS.keys()
+        if desconocidos:
+            raise ValidationError({'fields': f"Campos no válidos: {', '.join(sorted(desconocidos))}."})
+        return tuple(sorted(campos | {'id'}))
+    if vista:
+        if vista not in VISTAS:
+            raise ValidationError({'vista': f"Vista no válida. Opciones: {', '.join(sorted(VISTAS))}."})
+        return tuple(sorted(VISTAS[vista]))
+    return None
+
+
+def aplicar_campos(queryset, campos, orden=()):
+    """
+    Ruta de lectura del catálogo restringida a `campos` (None = para_catalogo completo). Las columnas de
+    `orden` se cargan siempre porque la paginación por cursor las lee de cada fila.
+    """
+    if campos is None:
+        return queryset.para_catalogo()
+    columnas = {'id'} | {campo.lstrip('-') for campo in orden if campo.lstrip('-') != 'pk'}
+    for campo in campos:
+        columnas.update(COLUMNAS[campo])
+    if 'subcategoria_nombre' in campos:
+        queryset = queryset.select_related('subcategoria')
+    if 'imagenes' in campos:
+        queryset = queryset.prefetch_related('imagenes')
+    return queryset.only(*sorted(columnas))
+
+
+def url_imagen_principal(imagen):
+    return imagen.get_imagen_url() or ''
+
+
+def actualizar_imagen_principal(productos):
+    """Recalcula Producto.imagen_principal (la marcada como principal o, si no hay, la primera por orden)."""
+    productos = set(productos)
+    if not productos:
+        return
+    principales = {}
+    imagenes = ImagenProducto.objects.filter(producto_id__in=productos).order_by('producto_id', '-es_principal', 'orden', 'id')
+    for imagen in imagenes.only('id', 'producto_id', 'imagen', 'url_imagen', 'es_principal', 'orden'):
+        principales.setdefault(imagen.producto_id, url_imagen_principal(imagen))
+    actuales = dict(Producto.objects.filter(pk__in=productos).values_list('pk', 'imagen_principal'))
+    cambios = [
+        Producto(pk=pk, imagen_principal=principales.get(pk, ''))
+        for pk, actual in actuales.items() if principales.get(pk, '') != actual
+    ]
+    Producto.objects.bulk_update(cambios, ['imagen_principal'])
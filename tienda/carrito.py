@@ -0,0 +1,241 @@
+"""
+Carrito persistente del usuario (Carrito/CarritoItem): lectura, resumen y cambios.
+
+La lectura completa es una sola consulta que parte del carrito (LEFT JOIN a ítems y productos) y calcula
+en SQL el subtotal de cada línea y el total general (función de ventana). El resumen del encabezado
+(líneas, unidades y total) se guarda en caché bajo la versión del carrito del usuario, que toda escritura
+incrementa al confirmar, y la del catálogo, que cambia con los precios y el estado de los productos.
+El carrito se crea solo al escribir: leer un carrito inexistente no toca la tabla.
+aplicar() procesa muchos cambios a la vez (add/set/remove) con una consulta de productos, un upsert y un
+DELETE, en una transacción con el carrito bloqueado; los cambios inválidos se reportan por línea. Cada
+línea cambiada aparta sus unidades (tienda.reservas) y se valida contra el stock disponible, no el total.
+"""
+from decimal import Decimal
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Count, DecimalField, ExpressionWrapper, Window
+from rest_framework import serializers
+from .models import Carrito, CarritoItem, Producto
+from .catalogo import version_catalogo
+from . import reservas
+import logging
+
+logger = logging.getLogger(__name__)
+
+_dinero = serializers.DecimalField(max_digits=12, decimal_places=2)
+_fecha = serializers.DateTimeField()
+_imagen = Producto._meta.get_field('imagen').storage
+
+DURACION_RESUMEN = 600  # segundos; las claves de versiones viejas vencen solas
+
+
+class CarritoError(Exception):
+    """Cambio de carrito rechazado; `estado` es el código HTTP sugerido."""
+
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.estado = estado
+
+
+def _subtotal(prefijo=''):
+    return ExpressionWrapper(
+        F(f'{prefijo}cantidad') * F(f'{prefijo}producto__precio'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def _clave_version(usuario_id):
+    return f'carrito:{usuario_id}:version'
+
+
+def _version(usuario_id):
+    # Si la clave se pierde se reinicia desde el reloj para no reutilizar versiones viejas
+    return cache.get_or_set(_clave_version(usuario_id), lambda: time.time_ns(), None)
+
+
+def _clave_resumen(usuario_id):
+    # La versión se lee antes de calcular: un resumen calculado durante una escritura queda bajo la versión vieja
+    return f'carrito:{usuario_id}:resumen:{_version(usuario_id)}:{version_catalogo()}'
+
+
+def _incrementar_version(usuario_id):
+    try:
+        cache.incr(_clave_version(usuario_id))
+    except ValueError:
+        cache.set(_clave_version(usuario_id), time.time_ns(), None)
+
+
+def invalidar(usuario_id):
+    """Cambia la versión del carrito (y con ella la clave del resumen) cuando la transacción en curso confirme."""
+    transaction.on_commit(lambda: _incrementar_version(usuario_id))
+
+
+def _formato_resumen(lineas, unidades, total):
+    return {'lineas': lineas, 'unidades': unidades or 0, 'total': _dinero.to_representation(total or Decimal('0'))}
+
+
+def leer(usuario_id):
+    """Carrito completo con la forma de CarritoSerializer más subtotales y total (una consulta)."""
+    filas = list(
+        reservas.con_disponible(Carrito.objects.filter(usuario_id=usuario_id), usuario_id, prefijo='items__producto__')
+        .values(
+            'id', 'actualizado', 'items__id', 'items__cantidad', 'items__producto_id', 'items__producto__nombre',
+            'items__producto__precio', 'items__producto__imagen', 'items__producto__imagen_principal',
+            'items__producto__stock', 'items__producto__activo', 'disponible',
+        )
+        .annotate(subtotal=_subtotal('items__'), total=Window(Sum(_subtotal('items__'))))
+        .order_by('items__id')
+    )
+    items = [
+        {
+            'id': fila['items__id'],
+            'producto': {
+                'id': fila['items__producto_id'],
+                'nombre': fila['items__producto__nombre'],
+                'precio': _dinero.to_representation(fila['items__producto__precio']),
+                'imagen': _imagen.url(fila['items__producto__imagen']) if fila['items__producto__imagen'] else None,
+                'imagen_principal': fila['items__producto__imagen_principal'],
+                'stock': fila['items__producto__stock'],
+                'disponible': max(fila['disponible'], 0),
+                'activo': fila['items__producto__activo'],
+            },
+            'cantidad': fila['items__cantidad'],
+            'subtotal': _dinero.to_representation(fila['subtotal']),
+        }
+        for fila in filas if fila['items__id'] is not None
+    ]
+    cabecera = filas[0] if filas else {'id': None, 'actualizado': None, 'total': None}
+    resumen = _formato_resumen(len(items), sum(item['cantidad'] for item in items), cabecera['total'])
+    return {
+        'id': cabecera['id'],
+        'usuario': usuario_id,
+        'items': items,
+        'actualizado': _fecha.to_representation(cabecera['actualizado']) if cabecera['actualizado'] else None,
+        **resumen,
+    }
+
+
+def resumen(usuario_id):
+    """Líneas, unidades y total del carrito; desde la caché salvo después de un cambio del carrito o del catálogo."""
+    clave = _clave_resumen(usuario_id)
+    datos = cache.get(clave)
+    if datos is None:
+        agregados = CarritoItem.objects.filter(carrito__usuario_id=usuario_id).aggregate(
+            lineas=Count('id'), unidades=Sum('cantidad'), total=Sum(_subtotal()),
+        )
+        datos = _formato_resumen(agregados['lineas'], agregados['unidades'], agregados['total'])
+        cache.set(clave, datos, DURACION_RESUMEN)
+    return datos
+
+
+def agregar(usuario, producto_id, cantidad=1):
+    """Suma `cantidad` unidades del producto al carrito (lo crea si no existe)."""
+    errores = aplicar(usuario, [{'producto_id': producto_id, 'cantidad': cantidad, 'modo': 'add'}])
+    if errores:
+        raise CarritoError(errores[0]['error'], 404 if errores[0]['motivo'] == 'no_existe' else 400)
+
+
+def quitar(usuario, producto_id):
+    """Elimina la línea del producto; retorna False si no estaba en el carrito."""
+    with transaction.atomic():
+        borrados, _ = CarritoItem.objects.filter(carrito__usuario=usuario, producto_id=producto_id).delete()
+        if borrados:
+            reservas.liberar(usuario.pk, [producto_id])
+            invalidar(usuario.pk)
+    return bool(borrados)
+
+
+def vaciar(usuario):
+    with transaction.atomic():
+        CarritoItem.objects.filter(carrito__usuario=usuario).delete()
+        reservas.liberar(usuario.pk)
+        invalidar(usuario.pk)
+
+
+MODOS = ('add', 'set', 'remove')
+MAX_OPERACIONES = 200
+
+
+def _error(indice, producto_id, motivo, mensaje):
+    return {'indice': indice, 'producto_id': producto_id, 'motivo': motivo, 'error': mensaje}
+
+
+def _normalizar(indice, operacion):
+    """Retorna (producto_id, cantidad, modo) o un error de la línea."""
+    if not isinstance(operacion, dict):
+        return _error(indice, None, 'invalida', 'Cada operación debe ser un objeto.')
+    producto_id, modo = operacion.get('producto_id'), operacion.get('modo', 'add')
+    if modo not in MODOS:
+        return _error(indice, producto_id, 'invalida', f'Modo inválido: {modo}.')
+    try:
+        producto_id = int(producto_id)
+        cantidad = int(operacion.get('cantidad', 1 if modo == 'add' else 0))
+    except (TypeError, ValueError):
+        return _error(indice, producto_id, 'invalida', 'producto_id y cantidad deben ser enteros.')
+    if cantidad < (1 if modo == 'add' else 0):
+        return _error(indice, producto_id, 'invalida', 'Cantidad inválida.')
+    return producto_id, cantidad, modo
+
+
+def aplicar(usuario, operaciones):
+    """
+    Aplica las operaciones en orden sobre el carrito de `usuario` y retorna los errores por línea. `add`
+    suma unidades, `set` fija la cantidad (0 elimina) y `remove` elimina la línea.
+    """
+    if len(operaciones) > MAX_OPERACIONES:
+        raise CarritoError(f'Máximo {MAX_OPERACIONES} operaciones por solicitud.')
+    errores, validas = [], []
+    for indice, operacion in enumerate(operaciones):
+        resultado = _normalizar(indice, operacion)
+        if isinstance(resultado, dict):
+            errores.append(resultado)
+        else:
+            validas.append((indice, resultado))
+    if not validas:
+        return errores
+    with transaction.atomic():
+        carrito, _ = Carrito.objects.get_or_create(usuario=usuario)
+        # Bloquea el carrito: los `add` concurrentes del mismo usuario no pierden unidades
+        Carrito.objects.select_for_update().filter(pk=carrito.pk).first()
+        ids = {producto_id for _, (producto_id, _, _) in validas}
+        productos = Producto.objects.filter(pk__in=ids, activo=True)
+        if reservas.duracion():
+            # Filas bloqueadas en orden de id: dos carritos no pueden apartar las mismas unidades
+            productos = productos.select_for_update().order_by('pk')
+        productos = {pk: max(disponible, 0) for pk, disponible in reservas.con_disponible(productos, usuario.pk).values_list('pk', 'disponible')}
+        cantidades = dict(CarritoItem.objects.filter(carrito=carrito, producto_id__in=ids).values_list('producto_id', 'cantidad'))
+        finales, tocadas = dict(cantidades), set()
+        for indice, (producto_id, cantidad, modo) in validas:
+            if modo == 'remove' or (modo == 'set' and cantidad == 0):
+                finales[producto_id] = 0
+                tocadas.add(producto_id)
+                continue
+            if producto_id not in productos:
+                errores.append(_error(indice, producto_id, 'no_existe', 'Producto no encontrado o inactivo.'))
+                continue
+            nueva = cantidad + finales.get(producto_id, 0) if modo == 'add' else cantidad
+            if nueva > productos[producto_id]:
+                errores.append(_error(indice, producto_id, 'stock_insuficiente', f'Solo hay {productos[producto_id]} disponibles.'))
+                continue
+            finales[producto_id] = nueva
+            tocadas.add(producto_id)
+        cambios = {pk: cantidad for pk, cantidad in finales.items() if cantidades.get(pk, 0) != cantidad}
+        borrar = [pk for pk, cantidad in cambios.items() if cantidad == 0]
+        guardar = [CarritoItem(carrito=carrito, producto_id=pk, cantidad=cantidad) for pk, cantidad in cambios.items() if cantidad]
+        if borrar:
+            CarritoItem.objects.filter(carrito=carrito, producto_id__in=borrar).delete()
+        if guardar:
+            CarritoItem.objects.bulk_create(
+                guardar, update_conflicts=True, unique_fields=['carrito', 'producto'], update_fields=['cantidad'],
+            )
+        if cambios:
+            invalidar(usuario.pk)
+        if reservas.duracion():
+            reservas.reservar(usuario.pk, {pk: finales[pk] for pk in tocadas})
+        else:
+            reservas.liberar(usuario.pk, [pk for pk in tocadas if not finales[pk]])
+    errores.sort(key=lambda error: error['indice'])
+    logger.info(f"Carrito de {usuario.numero}: {len(validas)} operaciones, {len(cambios)} líneas cambiadas, {len(errores)} errores")
+    return errores
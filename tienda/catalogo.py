@@ -0,0 +1,155 @@
+"""
+Versión del catálogo y caché de respuestas públicas ya renderizadas.
+
+Toda escritura sobre Categoria, Subcategoria, Producto o ImagenProducto incrementa la versión
+(ver tienda.signals); las respuestas se guardan como bytes JSON bajo una clave que incluye la versión
+y los parámetros de la consulta, de modo que el ETag es estable mientras el catálogo no cambie. Comentarios
+y calificaciones tienen además una versión por producto (tienda.signals).
+Los contadores de likes, reseñas y calificaciones solo cambian la versión de su producto: los listados que
+los muestran se guardan además por ventanas de FRESCURA_CONTADORES segundos, que acotan su atraso.
+El árbol de categorías se guarda además en memoria del proceso bajo la misma versión.
+"""
+from hashlib import sha1
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.db.models import Count, Q
+from rest_framework.renderers import JSONRenderer
+from .models import Categoria, Subcategoria
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'catalogo:version'
+FRESCURA_CONTADORES = 300
+
+
+def _version_inicial():
+    # Si la clave se pierde (reinicio o desalojo) se reinicia desde el reloj para no reutilizar versiones viejas
+    return int(time.time() * 1000)
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, _version_inicial(), timeout=None)
+        version = cache.get(CLAVE_VERSION, _version_inicial())
+    return version
+
+
+def incrementar_version_catalogo():
+    try:
+        return cache.incr(CLAVE_VERSION)
+    except ValueError:
+        version = _version_inicial()
+        cache.set(CLAVE_VERSION, version, timeout=None)
+        return version
+
+
+def invalidar_catalogo():
+    """Programa el incremento de versión para cuando la transacción en curso confirme."""
+    transaction.on_commit(incrementar_version_catalogo)
+
+
+def _clave_version_producto(producto_id):
+    return f'producto:{producto_id}:version'
+
+
+def version_producto(producto_id):
+    """Versión de las partes de un producto que no cubre la del catálogo (comentarios, likes de comentarios, calificaciones)."""
+    clave = _clave_version_producto(producto_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, _version_inicial(), timeout=None)
+        version = cache.get(clave, _version_inicial())
+    return version
+
+
+def _incrementar_version_producto(producto_id):
+    try:
+        cache.incr(_clave_version_producto(producto_id))
+    except ValueError:
+        cache.set(_clave_version_producto(producto_id), _version_inicial(), timeout=None)
+
+
+def invalidar_producto(producto_id):
+    transaction.on_commit(lambda: _incrementar_version_producto(producto_id))
+
+
+def _normalizar_parametros(request):
+    return urlencode(sorted((clave, valor) for clave, valores in request.GET.lists() for valor in valores))
+
+
+def etag_coincide(request, etag):
+    """True si el If-None-Match de la solicitud incluye `etag` (o `*`); también lo usa tienda.descargas."""
+    cabecera = request.META.get('HTTP_IF_NONE_MATCH')
+    if not cabecera:
+        return False
+    # GZipMiddleware convierte el ETag en débil (W/"..."); la comparación ignora esa marca
+    etags = [valor[2:] if valor.startswith('W/') else valor for valor in parse_etags(cabecera)]
+    return '*' in etags or etag in etags
+
+
+def respuesta_catalogo(request, nombre, construir, cache_control, con_contadores=False):
+    """
+    Devuelve la respuesta JSON cacheada del recurso `nombre` para la versión actual del catálogo.
+    `construir` solo se invoca cuando no existe la entrada en caché; si el cliente envía un
+    If-None-Match vigente se responde 304 sin tocar la base de datos. Con `con_contadores` la clave
+    incluye además la ventana de FRESCURA_CONTADORES en curso.
+    """
+    version = version_catalogo()
+    if con_contadores:
+        version = f'{version}:{int(time.time() // FRESCURA_CONTADORES)}'
+    huella = sha1(f'{nombre}|{version}|{_normalizar_parametros(request)}'.encode()).hexdigest()
+    etag = f'"{nombre}-{huella[:20]}"'
+    if etag_coincide(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        clave = f'catalogo:respuesta:{huella}'
+        contenido = cache.get(clave)
+        if contenido is None:
+            contenido = JSONRenderer().render(construir())
+            cache.set(clave, contenido)
+        response = HttpResponse(contenido, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+_arbol = {'version': None, 'datos': None}
+_arbol_lock = threading.Lock()
+
+
+def _construir_arbol():
+    """Árbol categoría → subcategorías activas con productos disponibles por nodo, en dos consultas."""
+    categorias = {
+        categoria['id']: {**categoria, 'productos_count': 0, 'subcategorias': []}
+        for categoria in Categoria.objects.filter(activa=True).order_by('nombre').values('id', 'nombre', 'descripcion')
+    }
+    subcategorias = (
+        Subcategoria.objects.filter(activa=True, categoria__activa=True)
+        .annotate(productos_count=Count('productos', filter=Q(productos__activo=True, productos__stock__gt=0)))
+        .order_by('nombre')
+        .values('id', 'nombre', 'descripcion', 'categoria_id', 'productos_count')
+    )
+    for subcategoria in subcategorias:
+        categoria = categorias[subcategoria.pop('categoria_id')]
+        categoria['subcategorias'].append(subcategoria)
+        categoria['productos_count'] += subcategoria['productos_count']
+    return list(categorias.values())
+
+
+def arbol_categorias():
+    """Árbol de categorías de la versión actual del catálogo, reconstruido solo cuando la versión cambia."""
+    version = version_catalogo()
+    if _arbol['version'] != version:
+        with _arbol_lock:
+            if _arbol['version'] != version:
+                _arbol['datos'] = _construir_arbol()
+                _arbol['version'] = version
+    return _arbol['datos']
@@ -0,0 +1,114 @@
+"""
+Servicio de compra: convierte el carrito persistente del usuario en un Pedido.
+
+Todo ocurre en una sola transacción: se bloquea el carrito y las filas de los productos en orden de id
+(orden determinista para no generar deadlocks entre compras concurrentes), se valida el stock disponible
+(stock − reservas de otros usuarios) de los ítems que no tienen una reserva vigente que los cubra (las
+reservas se consumen, ver tienda.reservas), se descuenta con un único UPDATE condicional con F() y se crean
+los detalles con bulk_create.
+La factura PDF y las notificaciones se encolan en la misma transacción (ver tienda.tareas).
+Si algún ítem no se puede vender no se modifica nada y se retorna la lista de fallos por ítem.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Case, When, Value, BooleanField, PositiveIntegerField
+from .models import Carrito, CarritoItem, Producto, Pedido, DetallePedido, EstadoVenta
+from .catalogo import invalidar_catalogo
+from .tareas import encolar
+from .utils_pdf import generar_factura
+from .notificaciones import notificar_en_segundo_plano
+from . import sugerencias, reservas, movimientos, acumulados, carrito as carrito_servicio
+import logging
+
+logger = logging.getLogger(__name__)
+
+ESTADO_INICIAL = 'pendiente'
+
+
+class CompraError(Exception):
+    """La compra no se pudo realizar; `fallos` describe cada ítem rechazado."""
+
+    def __init__(self, mensaje, fallos=None):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.fallos = fallos or []
+
+
+def _fallo(producto_id, nombre, stock, solicitado, motivo):
+    return {'producto_id': producto_id, 'nombre': nombre, 'stock': stock, 'solicitado': solicitado, 'motivo': motivo}
+
+
+def _validar(items, productos, reservados=()):
+    fallos = []
+    for producto_id, cantidad in items.items():
+        producto = productos.get(producto_id)
+        if producto is None:
+            fallos.append(_fallo(producto_id, None, 0, cantidad, 'no_existe'))
+        elif not producto.activo:
+            fallos.append(_fallo(producto_id, producto.nombre, producto.stock, cantidad, 'inactivo'))
+        # Una reserva vigente ya apartó las unidades: solo se omite la comparación con el disponible
+        elif producto_id not in reservados and producto.disponible < cantidad:
+            fallos.append(_fallo(producto_id, producto.nombre, max(producto.disponible, 0), cantidad, 'stock_insuficiente'))
+    return fallos
+
+
+def _descontar_stock(items):
+    """Un solo UPDATE para todos los productos; solo afecta filas que aún tienen stock suficiente."""
+    cantidad = Case(
+        *[When(pk=producto_id, then=Value(cantidad)) for producto_id, cantidad in items.items()],
+        output_field=PositiveIntegerField(),
+    )
+    return Producto.objects.filter(pk__in=items, activo=True, stock__gte=cantidad).update(
+        stock=F('stock') - cantidad,
+        # Igual que antes: el producto que se agota queda inactivo
+        activo=Case(When(stock=cantidad, then=Value(False)), default=F('activo'), output_field=BooleanField()),
+    )
+
+
+def procesar_compra(usuario):
+    """Crea el pedido del carrito de `usuario` y vacía el carrito. Lanza CompraError si no es posible."""
+    with transaction.atomic():
+        carrito = Carrito.objects.select_for_update().filter(usuario=usuario).first()
+        items = {}
+        if carrito:
+            for producto_id, cantidad in CarritoItem.objects.filter(carrito=carrito, cantidad__gt=0).values_list('producto_id', 'cantidad'):
+                items[producto_id] = cantidad
+        if not items:
+            raise CompraError('El carrito está vacío.')
+        productos = {
+            producto.pk: producto
+            for producto in reservas.con_reservado(reservas.con_disponible(
+                Producto.objects.select_for_update().filter(pk__in=items).order_by('pk'), usuario.pk,
+            ), usuario.pk)
+        }
+        reservados = {pk for pk, producto in productos.items() if producto.reservado >= items[pk]}
+        fallos = _validar(items, productos, reservados)
+        if fallos:
+            raise CompraError('Algunos productos no tienen stock suficiente.', fallos)
+        if _descontar_stock(items) != len(items):
+            # No debería ocurrir con las filas bloqueadas; se revierte todo por seguridad
+            raise CompraError('El stock cambió durante la compra, intenta de nuevo.')
+        total = sum((productos[pk].precio * cantidad for pk, cantidad in items.items()), Decimal('0'))
+        estado, _ = EstadoVenta.objects.get_or_create(nombre=ESTADO_INICIAL)
+        pedido = Pedido.objects.create(usuario=usuario, estado=estado, total=total)
+        detalles = DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, producto_id=pk, cantidad=cantidad, precio_unitario=productos[pk].precio)
+            for pk, cantidad in sorted(items.items())
+        ])
+        # El stock ya se descontó arriba: solo se asientan las salidas en el libro
+        movimientos.venta(detalles, actualizar_stock=False, usuario=usuario)
+        # bulk_create no emite señales: las líneas se suman a los acumulados del día aquí
+        acumulados.lineas(pedido.pk, detalles)
+        CarritoItem.objects.filter(carrito=carrito).delete()
+        reservas.liberar(usuario.pk)
+        carrito_servicio.invalidar(usuario.pk)
+        # La factura y el aviso a los admins se procesan en la cola, fuera de la petición
+        encolar(generar_factura, pedido_id=pedido.pk)
+        notificar_en_segundo_plano(None, f'Nuevo pedido #{pedido.pk} de {usuario.numero} por ${total}', tipo='pedido')
+        invalidar_catalogo()
+        for pk, cantidad in items.items():
+            if productos[pk].stock == cantidad:
+                producto = productos[pk]
+                transaction.on_commit(lambda producto=producto: sugerencias.registrar_cambio('producto', producto.pk, producto.nombre, False))
+    logger.info(f"Pedido #{pedido.id} creado para {usuario.numero} con {len(items)} productos, total {total}")
+    return pedido
@@ -0,0 +1,103 @@
+"""
+Contadores desnormalizados de Producto: likes, reseñas activas y calificaciones.
+Las vistas los ajustan con incrementos atómicos (F) dentro de la misma transacción que la escritura;
+recalcular_contadores() los reconstruye desde Like, Comentario y Calificacion (y Comentario.likes_total
+desde LikeComentario).
+"""
+from django.db.models import F, Q, Case, When, Value, Count, Sum, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest
+from .models import Producto, Comentario, Like, LikeComentario, Calificacion
+from .catalogo import invalidar_catalogo, invalidar_producto
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _expresion_promedio():
+    return Case(
+        When(calificacion_cantidad=0, then=Value(0.0)),
+        default=Cast('calificacion_suma', FloatField()) / F('calificacion_cantidad'),
+        output_field=FloatField(),
+    )
+
+
+def _incrementar(producto_id, **deltas):
+    # Sin bajar de cero: si el contador se desvió, un delta negativo no viola el CHECK de la columna y la
+    # escritura del usuario no falla; verificar_contadores/recalcular_contadores corrigen la diferencia
+    deltas = {campo: Greatest(F(campo) + delta, 0) for campo, delta in deltas.items() if delta}
+    if deltas:
+        Producto.objects.filter(pk=producto_id).update(**deltas)
+        # Solo la ficha del producto se reconstruye; los listados los refrescan por ventanas (ver tienda.catalogo)
+        invalidar_producto(producto_id)
+
+
+def ajustar_likes(producto_id, delta):
+    _incrementar(producto_id, likes_total=delta)
+
+
+def ajustar_resenas(producto_id, delta):
+    _incrementar(producto_id, resenas_total=delta)
+
+
+def ajustar_calificaciones(producto_id, delta_suma, delta_cantidad=0):
+    """Ajusta suma y cantidad de calificaciones y recalcula el promedio sobre la fila ya bloqueada."""
+    if not delta_suma and not delta_cantidad:
+        return
+    _incrementar(producto_id, calificacion_suma=delta_suma, calificacion_cantidad=delta_cantidad)
+    Producto.objects.filter(pk=producto_id).update(calificacion_promedio=_expresion_promedio())
+
+
+def _subconsulta(queryset, agregado):
+    """Subconsulta correlacionada que agrega las filas relacionadas de un solo producto."""
+    return Coalesce(
+        Subquery(queryset.filter(producto=OuterRef('pk')).order_by().values('producto').annotate(valor=agregado).values('valor')),
+        0,
+    )
+
+
+def _valores_esperados():
+    return {
+        'likes_total': _subconsulta(Like.objects.all(), Count('pk')),
+        'resenas_total': _subconsulta(Comentario.objects.filter(activo=True), Count('pk')),
+        'calificacion_suma': _subconsulta(Calificacion.objects.all(), Sum('valor')),
+        'calificacion_cantidad': _subconsulta(Calificacion.objects.all(), Count('pk')),
+    }
+
+
+def recalcular_contadores(productos=None):
+    """Reconstruye los contadores (de todos los productos o de los ids indicados) y los likes de sus comentarios."""
+    queryset = Producto.objects.all()
+    if productos is not None:
+        queryset = queryset.filter(pk__in=productos)
+    actualizados = queryset.update(**_valores_esperados())
+    queryset.update(calificacion_promedio=_expresion_promedio())
+    comentarios = Comentario.objects.all() if productos is None else Comentario.objects.filter(producto__in=productos)
+    comentarios.update(likes_total=Coalesce(
+        Subquery(LikeComentario.objects.filter(comentario=OuterRef('pk')).order_by().values('comentario').annotate(valor=Count('pk')).values('valor')),
+        0,
+    ))
+    invalidar_catalogo()
+    return actualizados
+
+
+def verificar_contadores():
+    """Retorna los productos cuyos contadores no coinciden con las tablas de origen."""
+    esperados = {f'esperado_{campo}': expresion for campo, expresion in _valores_esperados().items()}
+    diferencias = Q()
+    for campo in _valores_esperados():
+        diferencias |= ~Q(**{campo: F(f'esperado_{campo}')})
+    inconsistentes = Producto.objects.annotate(**esperados).filter(diferencias).order_by('pk')
+    resultado = []
+    for producto in inconsistentes:
+        resultado.append({
+            'producto_id': producto.pk,
+            'nombre': producto.nombre,
+            'diferencias': {
+                campo: {'actual': getattr(producto, campo), 'esperado': getattr(producto, f'esperado_{campo}')}
+                for campo in _valores_esperados()
+                if getattr(producto, campo) != getattr(producto, f'esperado_{campo}')
+            },
+        })
+    if resultado:
+        logger.warning(f"{len(resultado)} productos con contadores desnormalizados inconsistentes")
+    return resultado
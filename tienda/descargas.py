@@ -0,0 +1,73 @@
+"""
+Descarga de archivos almacenados con soporte de ETag (304), rangos de bytes (206/416) y
+Content-Disposition. El contenido se lee del storage por bloques, sin cargarlo completo en memoria, y
+no pasa por la compresión GZip.
+"""
+import re
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from .catalogo import etag_coincide
+
+TAMANO_BLOQUE = 64 * 1024
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _rango(cabecera, tamano):
+    """(inicio, fin) inclusivo de un único rango válido, None si no hay rango y False si no es satisfacible."""
+    if not cabecera:
+        return None
+    coincidencia = RANGO.match(cabecera.strip())
+    if not coincidencia or coincidencia.groups() == ('', ''):
+        # Rangos múltiples o mal formados: se ignoran y se envía el archivo completo
+        return None
+    inicio, fin = coincidencia.groups()
+    if inicio == '':
+        # bytes=-N: los últimos N bytes
+        largo = int(fin)
+        if largo == 0:
+            return False
+        return max(tamano - largo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _leer(archivo, inicio, largo):
+    try:
+        archivo.seek(inicio)
+        while largo > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+    finally:
+        archivo.close()
+
+
+def respuesta_archivo(request, storage, ruta, etag, nombre, content_type, adjunto=True, cache_control='private, max-age=86400'):
+    if etag_coincide(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        tamano = storage.size(ruta)
+        rango = _rango(request.META.get('HTTP_RANGE'), tamano)
+        if rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{tamano}'
+        elif rango:
+            inicio, fin = rango
+            response = StreamingHttpResponse(_leer(storage.open(ruta, 'rb'), inicio, fin - inicio + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+            response['Content-Length'] = str(fin - inicio + 1)
+        else:
+            response = FileResponse(storage.open(ruta, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(tamano)
+        disposicion = 'attachment' if adjunto else 'inline'
+        response['Content-Disposition'] = f'{disposicion}; filename="{nombre}"'
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control
+    # Ver tienda.middleware.GZipMiddleware
+    response.sin_compresion = True
+    return response
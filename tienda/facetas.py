@@ -0,0 +1,107 @@
+"""
+Facetas de la búsqueda de productos: conteos por categoría, subcategoría y destacados, más rango e
+histograma de precios, todo a partir de una sola consulta agrupada sobre el conjunto filtrado.
+
+El resultado se cachea por versión del catálogo y consulta normalizada (texto sin tildes ni palabras
+vacías y filtros ordenados); la paginación y el orden no forman parte de la clave.
+"""
+from bisect import bisect_right
+from decimal import Decimal
+from hashlib import sha1
+from urllib.parse import urlencode
+import math
+from django.core.cache import cache
+from django.db.models import Count
+from .busqueda import palabras
+from .catalogo import version_catalogo
+
+CUBETAS_PRECIO = 6
+# Parámetros que no cambian el conjunto de resultados
+PARAMETROS_IGNORADOS = {'q', 'page', 'page_size', 'cursor', 'ordering', 'total', 'facetas'}
+
+
+def clave_facetas(request):
+    filtros = sorted(
+        (clave, valor) for clave, valores in request.query_params.lists() if clave not in PARAMETROS_IGNORADOS for valor in valores
+    )
+    consulta = ' '.join(palabras(request.query_params.get('q', '')))
+    huella = sha1(f'{version_catalogo()}|{consulta}|{urlencode(filtros)}'.encode()).hexdigest()
+    return f'catalogo:facetas:{huella}'
+
+
+def _ancho_redondo(bruto):
+    """Menor ancho 'redondo' (1, 2, 2.5 o 5 × 10^n) que cubre el ancho bruto."""
+    magnitud = 10 ** math.floor(math.log10(bruto))
+    for factor in (1, 2, 2.5, 5, 10):
+        if factor * magnitud >= bruto:
+            return factor * magnitud
+    return 10 * magnitud
+
+
+def histograma_precios(precios, cubetas=CUBETAS_PRECIO):
+    """`precios` es una lista de (precio, cantidad) ordenada por precio."""
+    if not precios:
+        return {'min': None, 'max': None, 'histograma': []}
+    minimo, maximo = float(precios[0][0]), float(precios[-1][0])
+    if minimo == maximo:
+        return {'min': minimo, 'max': maximo, 'histograma': [{'desde': minimo, 'hasta': maximo, 'count': sum(c for _, c in precios)}]}
+    ancho = _ancho_redondo((maximo - minimo) / cubetas)
+    inicio = math.floor(minimo / ancho) * ancho
+    limites = []
+    while not limites or limites[-1] <= maximo:
+        limites.append(round(inicio + ancho * len(limites), 2))
+    conteos = [0] * (len(limites) - 1)
+    for precio, cantidad in precios:
+        conteos[min(bisect_right(limites, float(precio)) - 1, len(conteos) - 1)] += cantidad
+    return {
+        'min': minimo,
+        'max': maximo,
+        'histograma': [
+            {'desde': limites[i], 'hasta': limites[i + 1], 'count': conteos[i]} for i in range(len(conteos))
+        ],
+    }
+
+
+def calcular_facetas(queryset):
+    """Una consulta agrupada por (subcategoría, destacado, precio); el resto se agrega en memoria."""
+    filas = (
+        queryset.order_by()
+        .values('subcategoria_id', 'subcategoria__nombre', 'subcategoria__categoria_id', 'subcategoria__categoria__nombre', 'destacado', 'precio')
+        .annotate(cantidad=Count('id'))
+    )
+    categorias, subcategorias, precios = {}, {}, {}
+    total = destacados = 0
+    for fila in filas:
+        cantidad = fila['cantidad']
+        total += cantidad
+        if fila['destacado']:
+            destacados += cantidad
+        categoria = categorias.setdefault(
+            fila['subcategoria__categoria_id'],
+            {'id': fila['subcategoria__categoria_id'], 'nombre': fila['subcategoria__categoria__nombre'], 'count': 0},
+        )
+        categoria['count'] += cantidad
+        subcategoria = subcategorias.setdefault(
+            fila['subcategoria_id'],
+            {'id': fila['subcategoria_id'], 'nombre': fila['subcategoria__nombre'], 'categoria_id': categoria['id'], 'count': 0},
+        )
+        subcategoria['count'] += cantidad
+        precios[fila['precio']] = precios.get(fila['precio'], 0) + cantidad
+    por_conteo = lambda nodo: (-nodo['count'], nodo['nombre'])
+    return {
+        'total': total,
+        'categorias': sorted(categorias.values(), key=por_conteo),
+        'subcategorias': sorted(subcategorias.values(), key=por_conteo),
+        'destacados': destacados,
+        'precio': histograma_precios(sorted(precios.items(), key=lambda p: Decimal(p[0]))),
+    }
+
+
+def facetas(request, obtener_queryset):
+    """`obtener_queryset` solo se invoca si no hay facetas cacheadas (filtrar por texto ya consulta el índice)."""
+    clave = clave_facetas(request)
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = calcular_facetas(obtener_queryset())
+        cache.set(clave, resultado)
+    return resultado
@@ -0,0 +1,44 @@
+"""
+Ficha de producto: producto con imágenes, agregados de likes y calificaciones, primera página de hilos
+de comentarios y productos relacionados de la misma subcategoría, en un número fijo de consultas.
+
+El JSON se cachea (ver catalogo.respuesta_catalogo) bajo la versión del catálogo, que cubre producto,
+imágenes y relacionados, y la versión propia del producto (catalogo.version_producto), que cambia con
+sus comentarios, likes de comentarios o calificaciones.
+"""
+from django.db.models import Count
+from rest_framework.exceptions import NotFound
+from .models import Producto, Calificacion
+from .campos import VISTAS
+from . import foro, lectura
+
+HILOS_POR_PAGINA = 10
+RELACIONADOS = 8
+CAMPOS_RELACIONADOS = tuple(sorted(VISTAS['lista']))
+
+
+def _calificaciones(producto):
+    distribucion = {str(valor): 0 for valor in range(1, 6)}
+    for fila in Calificacion.objects.filter(producto_id=producto['id']).order_by().values('valor').annotate(cantidad=Count('id')):
+        distribucion[str(fila['valor'])] = fila['cantidad']
+    return {'promedio': producto['calificacion_promedio'], 'cantidad': sum(distribucion.values()), 'distribucion': distribucion}
+
+
+def construir_ficha(producto_id):
+    """Documento completo de la ficha (5 consultas). NotFound si el producto no existe o está inactivo."""
+    filas = lectura.productos.valores(Producto.objects.filter(pk=producto_id, activo=True))
+    productos = lectura.productos.convertir(filas)
+    if not productos:
+        raise NotFound('Producto no encontrado o inactivo.')
+    producto = productos[0]
+    relacionados = (
+        Producto.objects.filter(subcategoria_id=producto['subcategoria'], activo=True, stock__gt=0)
+        .exclude(pk=producto_id)
+        .order_by('-likes_total', '-id')[:RELACIONADOS]
+    )
+    return {
+        'producto': producto,
+        'agregados': {'likes': producto['total_likes'], 'resenas': producto['total_reseñas'], 'calificacion': _calificaciones(producto)},
+        'comentarios': foro.primera_pagina(producto_id, HILOS_POR_PAGINA),
+        'relacionados': lectura.productos.convertir(lectura.productos.valores(relacionados, CAMPOS_RELACIONADOS), CAMPOS_RELACIONADOS),
+    }
@@ -0,0 +1,150 @@
+"""
+Hilos de comentarios del foro.
+
+Para un producto se cargan todos sus comentarios activos (con su contador likes_total) en una sola
+consulta (cacheada bajo la versión del producto) y el árbol se arma en memoria. Los hilos se paginan por
+comentario raíz (más recientes primero) y las respuestas se muestran hasta PROFUNDIDAD_MAXIMA niveles:
+los nodos del último nivel con respuestas ocultas traen en `mas_respuestas` la URL que continúa ese hilo.
+Las respuestas de un comentario inactivo quedan ocultas.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+from django.urls import reverse
+from .models import Comentario
+from .catalogo import version_producto
+from .paginacion import KeysetPagination
+from . import lectura
+
+PROFUNDIDAD_MAXIMA = 3
+HILOS_POR_PAGINA = 10
+
+
+def _activos():
+    return Comentario.objects.filter(activo=True)
+
+
+def url_hilo(comentario_id):
+    return f"{reverse('comentarios-foro')}?hilo={comentario_id}"
+
+
+def nodos(filas):
+    """Filas de values() convertidas a nodos con la forma de ComentarioSerializer más los datos del hilo."""
+    resultado = lectura.comentarios.convertir(filas)
+    for nodo in resultado:
+        nodo['respuestas_total'] = 0
+        nodo['mas_respuestas'] = None
+    return resultado
+
+
+def _convertir(queryset):
+    return nodos(lectura.comentarios.valores(queryset))
+
+
+def comentarios_producto(producto_id):
+    """Todos los comentarios activos del producto en orden cronológico (una consulta, cacheada por versión)."""
+    clave = f'foro:producto:{producto_id}:{version_producto(producto_id)}'
+    comentarios = cache.get(clave)
+    if comentarios is None:
+        comentarios = _convertir(_activos().filter(producto_id=producto_id).order_by('creado', 'id'))
+        cache.set(clave, comentarios)
+    return comentarios
+
+
+def _recortar(nodo, profundidad):
+    """Oculta las respuestas por debajo de `profundidad` niveles y deja el cursor para cargarlas."""
+    if profundidad == 0:
+        if nodo['respuestas']:
+            nodo['respuestas'] = []
+            nodo['mas_respuestas'] = url_hilo(nodo['id'])
+        return
+    for respuesta in nodo['respuestas']:
+        _recortar(respuesta, profundidad - 1)
+
+
+def url_pagina(producto_id, posicion):
+    cursor = KeysetPagination().codificar_cursor({'o': posicion})
+    return f"{reverse('comentarios-foro')}?producto={producto_id}&cursor={cursor}"
+
+
+def armar_arbol(comentarios):
+    """Enlaza cada nodo con su padre; retorna (raíces más recientes primero, nodos por id)."""
+    por_id = {nodo['id']: nodo for nodo in comentarios}
+    raices = []
+    for nodo in comentarios:
+        padre_id = nodo['comentario_padre']
+        if padre_id is None:
+            raices.append(nodo)
+        elif padre_id in por_id:
+            por_id[padre_id]['respuestas'].append(nodo)
+            por_id[padre_id]['respuestas_total'] += 1
+    raices.reverse()
+    return raices, por_id
+
+
+def hilos_producto(producto_id, profundidad=PROFUNDIDAD_MAXIMA):
+    raices, _ = armar_arbol(comentarios_producto(producto_id))
+    for raiz in raices:
+        _recortar(raiz, profundidad)
+    return raices
+
+
+def primera_pagina(producto_id, limite=HILOS_POR_PAGINA):
+    """Primera página de hilos con la forma de la respuesta paginada del foro (para la ficha de producto)."""
+    hilos = hilos_producto(producto_id)
+    return {
+        'count': len(hilos),
+        'next': url_pagina(producto_id, limite) if len(hilos) > limite else None,
+        'previous': None,
+        'results': hilos[:limite],
+    }
+
+
+def hilo(comentario_id, profundidad=PROFUNDIDAD_MAXIMA):
+    """Subárbol de un comentario ("cargar más"), recortado a `profundidad` niveles desde él; None si no existe."""
+    producto_id = Comentario.objects.filter(pk=comentario_id, activo=True).values_list('producto_id', flat=True).first()
+    if producto_id is None:
+        return None
+    _, por_id = armar_arbol(comentarios_producto(producto_id))
+    nodo = por_id.get(comentario_id)
+    if nodo is not None:
+        _recortar(nodo, profundidad)
+    return nodo
+
+
+def cargar_respuestas(raices, profundidad=PROFUNDIDAD_MAXIMA):
+    """
+    Completa las respuestas de comentarios de distintos productos nivel por nivel: una consulta por nivel
+    más una para saber qué nodos del último nivel tienen respuestas ocultas.
+    """
+    nivel = raices
+    for _ in range(profundidad):
+        if not nivel:
+            return raices
+        por_id = {nodo['id']: nodo for nodo in nivel}
+        hijos = _convertir(_activos().filter(comentario_padre_id__in=por_id).order_by('creado', 'id'))
+        for hijo in hijos:
+            por_id[hijo['comentario_padre']]['respuestas'].append(hijo)
+            por_id[hijo['comentario_padre']]['respuestas_total'] += 1
+        nivel = hijos
+    if nivel:
+        por_id = {nodo['id']: nodo for nodo in nivel}
+        ocultas = (
+            Comentario.objects.filter(activo=True, comentario_padre_id__in=por_id)
+            .order_by().values('comentario_padre').annotate(cantidad=Count('id'))
+        )
+        for fila in ocultas:
+            nodo = por_id[fila['comentario_padre']]
+            nodo['respuestas_total'] = fila['cantidad']
+            nodo['mas_respuestas'] = url_hilo(nodo['id'])
+    return raices
+
+
+def respuestas(comentarios_ids, profundidad=PROFUNDIDAD_MAXIMA):
+    """{id: respuestas hasta `profundidad` niveles} de varios comentarios a la vez (para ComentarioSerializer)."""
+    raices = [{'id': pk, 'respuestas': [], 'respuestas_total': 0, 'mas_respuestas': None} for pk in dict.fromkeys(comentarios_ids)]
+    return {raiz['id']: raiz['respuestas'] for raiz in cargar_respuestas(raices, profundidad)}
+
+
+def comentarios_raiz():
+    """Comentarios raíz activos de toda la tienda, más recientes primero (para paginar con KeysetPagination)."""
+    return lectura.comentarios.valores(_activos().filter(comentario_padre=None).order_by('-creado', '-id'))
@@ -0,0 +1,147 @@
+"""
+Serialización rápida de solo lectura para los listados grandes.
+
+Cada lector se compila una vez a partir del serializer DRF correspondiente: por cada campo de salida se
+resuelve la columna de values() y un conversor (identidad para texto, enteros y booleanos; el
+to_representation del campo DRF para decimales y fechas; la URL del storage para archivos). La salida es
+idéntica, byte a byte, a la del serializer original, sin instanciar modelos ni recorrer la maquinaria de
+campos de DRF por fila. Los serializers DRF siguen siendo la ruta de escritura y validación.
+"""
+from collections import defaultdict
+from rest_framework import serializers
+from .models import ImagenProducto
+from .serializers import ProductoSerializer, ImagenProductoSerializer, NotificacionSerializer, HistorialAccionSerializer, ComentarioSerializer
+
+# Campos DRF cuyo valor de values() ya es el de salida
+IDENTIDAD = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.FloatField,
+    serializers.PrimaryKeyRelatedField, serializers.ChoiceField, serializers.EmailField,
+)
+
+
+def _identidad(valor):
+    return valor
+
+
+def _conversor_archivo(campo_modelo):
+    storage = campo_modelo.storage
+    return lambda nombre: storage.url(nombre) if nombre else None
+
+
+class Lector:
+    """
+    `metodos` define los SerializerMethodField: nombre → (columnas, función(fila)).
+    `anidados` define listas relacionadas: nombre → función(ids) que retorna {id: [elementos]}.
+    """
+
+    def __init__(self, serializer_class, metodos=None, anidados=None):
+        metodos = metodos or {}
+        self.model = serializer_class.Meta.model
+        self.anidados = anidados or {}
+        # (nombre de salida, tipo, columnas, conversor)
+        self.especificacion = []
+        for nombre, campo in serializer_class().fields.items():
+            if campo.write_only:
+                continue
+            if nombre in metodos:
+                columnas, funcion = metodos[nombre]
+                self.especificacion.append((nombre, 'metodo', tuple(columnas), funcion))
+            elif nombre in self.anidados:
+                self.especificacion.append((nombre, 'anidado', (), self.anidados[nombre]))
+            else:
+                self.especificacion.append((nombre, 'valor', (self._columna(campo),), self._conversor(campo)))
+        self._compilados = {}
+
+    def _columna(self, campo):
+        if isinstance(campo, serializers.RelatedField):
+            return self.model._meta.get_field(campo.source).attname
+        return campo.source.replace('.', '__')
+
+    def _conversor(self, campo):
+        if isinstance(campo, serializers.FileField):
+            return _conversor_archivo(self.model._meta.get_field(campo.source))
+        if isinstance(campo, IDENTIDAD):
+            return _identidad
+        # DecimalField, DateTimeField, DateField...: mismo formato que DRF
+        return campo.to_representation
+
+    def _compilar(self, campos):
+        if campos not in self._compilados:
+            especificacion = [e for e in self.especificacion if campos is None or e[0] in campos]
+            columnas = {'id'}
+            for _, _, cols, _ in especificacion:
+                columnas.update(cols)
+            self._compilados[campos] = (especificacion, columnas)
+        return self._compilados[campos]
+
+    def valores(self, queryset, campos=None, adicionales=()):
+        """
+        values() con solo las columnas que necesita la salida, más `adicionales` (p. ej. las del orden, que
+        la paginación por cursor lee de cada fila).
+        """
+        _, columnas = self._compilar(campos)
+        extra = {campo.lstrip('-') for campo in adicionales if campo.lstrip('-') != 'pk'}
+        return queryset.values(*sorted(columnas | extra))
+
+    def convertir(self, filas, campos=None):
+        especificacion, _ = self._compilar(campos)
+        filas = list(filas)
+        relacionados = {
+            nombre: funcion([fila['id'] for fila in filas])
+            for nombre, tipo, _, funcion in especificacion if tipo == 'anidado'
+        }
+        resultado = []
+        for fila in filas:
+            salida = {}
+            for nombre, tipo, columnas, funcion in especificacion:
+                if tipo == 'valor':
+                    valor = fila[columnas[0]]
+                    salida[nombre] = None if valor is None else funcion(valor)
+                elif tipo == 'metodo':
+                    salida[nombre] = funcion(fila)
+                else:
+                    salida[nombre] = relacionados[nombre].get(fila['id'], [])
+            resultado.append(salida)
+        return resultado
+
+
+_archivo_imagen = _conversor_archivo(ImagenProducto._meta.get_field('imagen'))
+
+
+def _url_imagen(fila):
+    # Igual que ImagenProducto.get_imagen_url
+    return _archivo_imagen(fila['imagen']) if fila['imagen'] else fila['url_imagen']
+
+
+imagenes = Lector(ImagenProductoSerializer, metodos={'imagen_url': (('imagen', 'url_imagen'), _url_imagen)})
+
+
+def imagenes_por_producto(ids):
+    """Imágenes de todos los productos de la página en una consulta, en el orden de ImagenProducto.Meta."""
+    agrupadas = defaultdict(list)
+    if not ids:
+        return agrupadas
+    filas = list(imagenes.valores(ImagenProducto.objects.filter(producto_id__in=ids).order_by('orden', 'id'), adicionales=['producto_id']))
+    for fila, imagen in zip(filas, imagenes.convertir(filas)):
+        agrupadas[fila['producto_id']].append(imagen)
+    return agrupadas
+
+
+def _calificacion_promedio(fila):
+    # Igual que ProductoSerializer.get_calificacion_promedio
+    return round(fila['calificacion_promedio'], 2) if fila['calificacion_cantidad'] else None
+
+
+productos = Lector(
+    ProductoSerializer,
+    metodos={
+        'total_reseñas': (('resenas_total',), lambda fila: fila['resenas_total']),
+        'total_likes': (('likes_total',), lambda fila: fila['likes_total']),
+        'calificacion_promedio': (('calificacion_promedio', 'calificacion_cantidad'), _calificacion_promedio),
+    },
+    anidados={'imagenes': imagenes_por_producto},
+)
+notificaciones = Lector(NotificacionSerializer)
+historial = Lector(HistorialAccionSerializer)
+# Las respuestas las completa el armado del árbol (tienda.foro)
+comentarios = Lector(ComentarioSerializer, metodos={'respuestas': ((), lambda fila: [])})
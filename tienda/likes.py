@@ -0,0 +1,231 @@
+"""
+Likes de productos y de comentarios.
+
+Dar y quitar un like son una sola sentencia cada una (INSERT ... ON CONFLICT DO NOTHING y DELETE); el
+número de filas afectadas decide el delta del contador, de modo que toggles concurrentes del mismo
+usuario nunca desvían el contador de la tabla. Los deltas se aplican con incrementos atómicos (F) o, con
+LIKES_CONTADORES_EN_CACHE, se acumulan en la caché compartida (claves `likes:delta:<tipo>:<id>`) y
+volcar_contadores() los escribe en lote desde el worker de procesar_tareas.
+Cada objeto con delta queda registrado en LikePendiente; el registro es atómico por id (INSERT ... ON
+CONFLICT DO NOTHING), sin leer y reescribir listas en caché. Una marca `likes:pendiente:<tipo>:<id>`, que
+se pone solo después de confirmar el INSERT y vence sola, evita repetirlo en cada like.
+"""
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Case, When, F, Value, IntegerField
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Like, LikeComentario, LikePendiente, Producto, Comentario
+from .catalogo import invalidar_producto
+from . import contadores
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tipo → (tabla de likes, columna del objeto, modelo con el contador likes_total)
+TIPOS = {
+    'producto': (Like, 'producto_id', Producto),
+    'comentario': (LikeComentario, 'comentario_id', Comentario),
+}
+CANDADO = 'likes:candado'
+DURACION_MARCA = 300  # segundos; si la marca queda sin su fila, a lo sumo se repite el INSERT al vencer
+
+
+def _ejecutar(sql, parametros):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.rowcount
+
+
+def _insertar(tipo, usuario_id, objeto_id):
+    modelo, columna, _ = TIPOS[tipo]
+    q = connection.ops.quote_name
+    return _ejecutar(
+        f'INSERT INTO {q(modelo._meta.db_table)} ({q("usuario_id")}, {q(columna)}, {q("creado")}) VALUES (%s, %s, %s) '
+        f'ON CONFLICT ({q("usuario_id")}, {q(columna)}) DO NOTHING',
+        [usuario_id, objeto_id, timezone.now()],
+    )
+
+
+def _borrar(tipo, usuario_id, objeto_id):
+    modelo, columna, _ = TIPOS[tipo]
+    q = connection.ops.quote_name
+    return _ejecutar(
+        f'DELETE FROM {q(modelo._meta.db_table)} WHERE {q("usuario_id")} = %s AND {q(columna)} = %s',
+        [usuario_id, objeto_id],
+    )
+
+
+# --- Contadores ---
+def _invalidar(productos):
+    for producto_id in set(productos):
+        invalidar_producto(producto_id)
+
+
+def _ajustar(tipo, objeto_id, delta, producto_id):
+    if getattr(settings, 'LIKES_CONTADORES_EN_CACHE', False):
+        # Solo se acumula si la escritura confirma
+        transaction.on_commit(lambda: _acumular(tipo, objeto_id, delta))
+    elif tipo == 'producto':
+        contadores.ajustar_likes(objeto_id, delta)
+    else:
+        Comentario.objects.filter(pk=objeto_id).update(likes_total=Greatest(F('likes_total') + delta, 0))
+        invalidar_producto(producto_id)
+
+
+def _cambiar(tipo, usuario_id, objeto_id, quiere_like, producto_id=None):
+    """Aplica el estado pedido (None = alternar). Retorna True si el usuario queda con like."""
+    with transaction.atomic():
+        if quiere_like is None:
+            if _borrar(tipo, usuario_id, objeto_id):
+                _ajustar(tipo, objeto_id, -1, producto_id)
+                return False
+            quiere_like = True
+        if quiere_like:
+            if _insertar(tipo, usuario_id, objeto_id):
+                _ajustar(tipo, objeto_id, 1, producto_id)
+            return True
+        if _borrar(tipo, usuario_id, objeto_id):
+            _ajustar(tipo, objeto_id, -1, producto_id)
+        return False
+
+
+def like_producto(usuario_id, producto_id, quiere_like=None):
+    return _cambiar('producto', usuario_id, producto_id, quiere_like)
+
+
+def like_comentario(usuario_id, comentario, quiere_like=None):
+    return _cambiar('comentario', usuario_id, comentario.pk, quiere_like, comentario.producto_id)
+
+
+# --- Acumulación en caché (write-behind) ---
+def _clave_delta(tipo, objeto_id):
+    return f'likes:delta:{tipo}:{objeto_id}'
+
+
+def _clave_marca(tipo, objeto_id):
+    return f'likes:pendiente:{tipo}:{objeto_id}'
+
+
+class CandadoOcupado(Exception):
+    pass
+
+
+def _con_candado(funcion, espera=2.0, duracion=60):
+    """Ejecuta `funcion` con el candado de volcado; si no se obtiene en `espera` segundos lanza CandadoOcupado."""
+    token = uuid.uuid4().hex
+    limite = time.monotonic() + espera
+    while not cache.add(CANDADO, token, duracion):
+        if time.monotonic() > limite:
+            raise CandadoOcupado()
+        time.sleep(0.01)
+    try:
+        return funcion()
+    finally:
+        # Solo lo libera quien lo tiene: si venció y otro proceso lo tomó, no se toca
+        if cache.get(CANDADO) == token:
+            cache.delete(CANDADO)
+
+
+def _registrar(tipo, ids):
+    marcas = {objeto_id: _clave_marca(tipo, objeto_id) for objeto_id in ids}
+    marcados = cache.get_many(marcas.values())
+    nuevos = [objeto_id for objeto_id, clave in marcas.items() if clave not in marcados]
+    if nuevos:
+        LikePendiente.objects.bulk_create([LikePendiente(tipo=tipo, objeto_id=objeto_id) for objeto_id in nuevos], ignore_conflicts=True)
+        # La marca solo se pone si la fila quedó confirmada: un rollback no deja marcas sin registro
+        transaction.on_commit(lambda: cache.set_many({marcas[objeto_id]: 1 for objeto_id in nuevos}, DURACION_MARCA))
+
+
+def _acumular(tipo, objeto_id, delta):
+    clave = _clave_delta(tipo, objeto_id)
+    cache.add(clave, 0, None)
+    cache.incr(clave, delta)
+    # Después del incremento: si el volcado ya borró la marca, este delta vuelve a registrarse
+    _registrar(tipo, [objeto_id])
+
+
+def _tomar_pendientes(tipo):
+    """Ids pendientes del tipo; borra su registro y su marca antes de leer los deltas."""
+    pendientes = LikePendiente.objects.filter(tipo=tipo)
+    ids = list(pendientes.values_list('objeto_id', flat=True))
+    if ids:
+        pendientes.filter(objeto_id__in=ids).delete()
+        cache.delete_many([_clave_marca(tipo, objeto_id) for objeto_id in ids])
+    return ids
+
+
+def volcar_contadores(espera=2.0):
+    """
+    Escribe en la base los deltas acumulados en caché, un UPDATE por tipo. Retorna los objetos
+    actualizados; si otro proceso está volcando, no hace nada y retorna 0.
+    """
+    try:
+        return _con_candado(_volcar, espera)
+    except CandadoOcupado:
+        logger.warning("Otro proceso está volcando los contadores de likes; se omite este volcado")
+        return 0
+
+
+def _aplicar(tipo, modelo, deltas):
+    """Suma los deltas a likes_total con un UPDATE (sin bajar de cero) y programa la invalidación."""
+    modelo.objects.filter(pk__in=deltas).update(likes_total=Greatest(
+        Case(
+            *[When(pk=objeto_id, then=F('likes_total') + Value(delta)) for objeto_id, delta in deltas.items()],
+            default=F('likes_total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    ))
+    _invalidar(deltas if tipo == 'producto' else modelo.objects.filter(pk__in=deltas).values_list('producto_id', flat=True))
+
+
+def _devolver(tipo, objeto_id, delta):
+    # El delta vuelve a la caché y el objeto queda pendiente para el siguiente volcado
+    clave = _clave_delta(tipo, objeto_id)
+    cache.add(clave, 0, None)
+    cache.incr(clave, delta)
+    _registrar(tipo, [objeto_id])
+
+
+def _volcar():
+    total = 0
+    for tipo, (_, _, modelo) in TIPOS.items():
+        deltas, reintentar = {}, []
+        with transaction.atomic():
+            for objeto_id in _tomar_pendientes(tipo):
+                clave = _clave_delta(tipo, objeto_id)
+                delta = cache.get(clave)
+                if not delta:
+                    continue
+                # decr deja intactos los incrementos que lleguen mientras tanto
+                if cache.decr(clave, delta):
+                    reintentar.append(objeto_id)
+                deltas[objeto_id] = delta
+            if reintentar:
+                _registrar(tipo, reintentar)
+            if not deltas:
+                continue
+            try:
+                # Punto de guardado: un error no deja inutilizable la transacción de los pendientes
+                with transaction.atomic():
+                    _aplicar(tipo, modelo, deltas)
+            except DatabaseError:
+                logger.exception(f"Falló el volcado en lote de likes de {tipo}; se aplica objeto por objeto")
+                aplicados = {}
+                for objeto_id, delta in deltas.items():
+                    try:
+                        with transaction.atomic():
+                            _aplicar(tipo, modelo, {objeto_id: delta})
+                        aplicados[objeto_id] = delta
+                    except DatabaseError:
+                        logger.exception(f"No se pudo volcar el delta {delta:+d} de likes de {tipo} {objeto_id}")
+                        _devolver(tipo, objeto_id, delta)
+                deltas = aplicados
+        total += len(deltas)
+    if total:
+        logger.info(f"Contadores de likes volcados para {total} objetos")
+    return total
@@ -0,0 +1,90 @@
+"""
+Compara los serializers DRF con los lectores rápidos de tienda.lectura en los listados grandes.
+Verifica que el JSON sea idéntico byte a byte y muestra el tiempo de cada ruta (consulta + serialización + render).
+Uso: python manage.py medir_serializadores [--repeticiones N] [--sinteticos N]
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from tienda import lectura
+from tienda.models import Usuario, Categoria, Subcategoria, Producto, ImagenProducto, Notificacion, HistorialAccion
+from tienda.serializers import ProductoSerializer, NotificacionSerializer, HistorialAccionSerializer
+
+
+def _casos():
+    productos = Producto.objects.filter(activo=True, stock__gt=0).order_by('-fecha_creacion')
+    destacados = productos.filter(destacado=True)[:12]
+    usuario = Notificacion.objects.values_list('usuario_id', flat=True).first()
+    notificaciones = Notificacion.objects.filter(usuario_id=usuario, eliminada=False).order_by('-creada', '-id')[:100]
+    historial = HistorialAccion.objects.order_by('-fecha', '-id')[:100]
+    return [
+        ('AllProductosView', lambda: ProductoSerializer(productos.para_catalogo(), many=True).data,
+         lambda: lectura.productos.convertir(lectura.productos.valores(productos))),
+        ('ProductosDestacadosView', lambda: ProductoSerializer(destacados.para_catalogo(), many=True).data,
+         lambda: lectura.productos.convertir(lectura.productos.valores(destacados))),
+        ('NotificacionListView', lambda: NotificacionSerializer(notificaciones, many=True).data,
+         lambda: lectura.notificaciones.convertir(lectura.notificaciones.valores(notificaciones))),
+        ('HistorialAccionAdminView', lambda: HistorialAccionSerializer(historial, many=True).data,
+         lambda: lectura.historial.convertir(lectura.historial.valores(historial))),
+    ]
+
+
+def _medir(funcion, repeticiones):
+    renderer = JSONRenderer()
+    mejor, contenido = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        contenido = renderer.render(funcion())
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, contenido
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de los serializers DRF frente a los lectores rápidos y verifica que el JSON sea idéntico.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help='Se reporta el mejor tiempo de N ejecuciones.')
+        parser.add_argument('--sinteticos', type=int, default=0, help='Crea N filas de prueba por tabla (se descartan al terminar).')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['sinteticos']:
+                self._crear_sinteticos(options['sinteticos'])
+            distintos = 0
+            for nombre, drf, rapido in _casos():
+                tiempo_drf, json_drf = _medir(drf, options['repeticiones'])
+                tiempo_rapido, json_rapido = _medir(rapido, options['repeticiones'])
+                identico = json_drf == json_rapido
+                distintos += not identico
+                self.stdout.write(
+                    f'{nombre:<26} {len(json_drf):>9} bytes  DRF {tiempo_drf * 1000:8.2f} ms  '
+                    f'rápido {tiempo_rapido * 1000:8.2f} ms  x{tiempo_drf / max(tiempo_rapido, 1e-9):5.1f}  '
+                    f'{"idéntico" if identico else "DISTINTO"}'
+                )
+            transaction.set_rollback(True)
+        if distintos:
+            self.stderr.write(self.style.ERROR(f'{distintos} listados con JSON distinto.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('JSON idéntico en todos los listados.'))
+
+    def _crear_sinteticos(self, cantidad):
+        ahora = timezone.now()
+        usuario = Usuario.objects.create_user(numero='3999999999', nombre='Medición', apellido='Sintética', password=None)
+        subcategoria = Subcategoria.objects.create(categoria=Categoria.objects.create(nombre='Medición sintética'), nombre='Medición')
+        productos = Producto.objects.bulk_create([
+            Producto(
+                subcategoria=subcategoria, nombre=f'Producto {i}', descripcion='Descripción de prueba ' * 10, precio=f'{i % 90 + 9}.90',
+                stock=5, destacado=i % 3 == 0, fecha_creacion=ahora, likes_total=i % 7, resenas_total=i % 5,
+                calificacion_suma=i % 5 * 4, calificacion_cantidad=i % 5, calificacion_promedio=4.0 if i % 5 else 0,
+            )
+            for i in range(cantidad)
+        ])
+        ImagenProducto.objects.bulk_create([
+            ImagenProducto(producto=producto, url_imagen=f'https://cdn.example.com/{producto.pk}-{orden}.jpg', orden=orden, es_principal=orden == 0)
+            for producto in productos for orden in range(2)
+        ])
+        Notificacion.objects.bulk_create([Notificacion(usuario=usuario, tipo='pedido', mensaje=f'Mensaje {i}') for i in range(cantidad)])
+        HistorialAccion.objects.bulk_create([HistorialAccion(usuario=usuario, accion='login', detalle=f'Detalle {i}', ip='127.0.0.1') for i in range(cantidad)])
@@ -0,0 +1,74 @@
+"""
+Worker de la cola de tareas en segundo plano (facturas PDF, notificaciones, etc.); además vuelca los
+contadores de likes, libera las reservas de stock vencidas, toma las fotos periódicas de stock y desliza
+los rankings de ventas al cambiar el día. Un fallo de una de esas tareas periódicas se registra y el
+worker sigue con las demás, igual que procesar_pendientes aísla los fallos de cada tarea.
+Uso: python manage.py procesar_tareas [--una-vez] [--lote N] [--espera SEGUNDOS]
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+from tienda.tareas import procesar_pendientes, purgar_completadas
+from tienda.likes import volcar_contadores
+from tienda.reservas import liberar_vencidas
+from tienda.movimientos import tomar_fotos_si_corresponde
+from tienda.rankings import deslizar
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def periodica(funcion, *args):
+    """Ejecuta una tarea periódica del worker; si falla lo registra en vez de detener el worker."""
+    try:
+        return funcion(*args)
+    except Exception:
+        logger.exception(f"Falló la tarea periódica {funcion.__name__}")
+        return None
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas pendientes de la cola; sin --una-vez queda escuchando indefinidamente.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesa las tareas vencidas y termina.')
+        parser.add_argument('--lote', type=int, default=10, help='Tareas reservadas por vuelta.')
+        parser.add_argument('--espera', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--purgar-dias', type=int, default=7, help='Días que se conservan las tareas completadas.')
+        parser.add_argument('--volcar-likes', type=float, default=5.0, help='Segundos entre volcados de contadores de likes (con LIKES_CONTADORES_EN_CACHE).')
+
+    def handle(self, *args, **options):
+        if options['una_vez']:
+            total = 0
+            while True:
+                procesadas = procesar_pendientes(options['lote'])
+                if not procesadas:
+                    break
+                total += procesadas
+            if settings.LIKES_CONTADORES_EN_CACHE:
+                periodica(volcar_contadores)
+            periodica(liberar_vencidas)
+            periodica(deslizar)
+            self.stdout.write(self.style.SUCCESS(f'{total} tareas procesadas.'))
+            return
+        self.stdout.write(self.style.SUCCESS('Worker de tareas iniciado (Ctrl+C para detener).'))
+        ultima_purga = ultimo_volcado = ultimo_barrido = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - ultima_purga > 3600:
+                    periodica(purgar_completadas, options['purgar_dias'])
+                    periodica(tomar_fotos_si_corresponde)
+                    ultima_purga = time.monotonic()
+                if settings.LIKES_CONTADORES_EN_CACHE and time.monotonic() - ultimo_volcado > options['volcar_likes']:
+                    periodica(volcar_contadores)
+                    ultimo_volcado = time.monotonic()
+                if time.monotonic() - ultimo_barrido > 60:
+                    periodica(liberar_vencidas)
+                    periodica(deslizar)
+                    ultimo_barrido = time.monotonic()
+                # Un error de la base (p. ej. conexión caída) tampoco detiene el worker: se espera y se reintenta
+                if not periodica(procesar_pendientes, options['lote']):
+                    time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido.')
@@ -0,0 +1,28 @@
+"""
+Reconstruye y verifica los contadores desnormalizados de productos (likes, reseñas y calificaciones).
+Uso: python manage.py recalcular_contadores [--verificar] [--producto ID ...]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tienda.contadores import recalcular_contadores, verificar_contadores
+
+class Command(BaseCommand):
+    help = 'Reconstruye o verifica los contadores desnormalizados de likes, reseñas y calificaciones de productos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='Solo reporta inconsistencias, sin modificar datos.')
+        parser.add_argument('--producto', type=int, nargs='*', help='Limita la reconstrucción a estos ids de producto.')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            inconsistentes = verificar_contadores()
+            for item in inconsistentes:
+                self.stdout.write(self.style.WARNING(f"Producto #{item['producto_id']} ({item['nombre']}): {item['diferencias']}"))
+            if inconsistentes:
+                self.stdout.write(self.style.ERROR(f'{len(inconsistentes)} productos con contadores inconsistentes.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Todos los contadores son consistentes.'))
+            return
+        with transaction.atomic():
+            actualizados = recalcular_contadores(options['producto'])
+        self.stdout.write(self.style.SUCCESS(f'Contadores reconstruidos para {actualizados} productos.'))
@@ -0,0 +1,24 @@
+"""
+Reconstruye los acumulados diarios de ventas (EstadisticaVenta, VentaDiariaProducto, VentaDiariaCliente)
+desde el historial de pedidos, y con ellos los rankings de ventas.
+Uso: python manage.py recalcular_estadisticas [--desde AAAA-MM-DD]
+"""
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from tienda.acumulados import recalcular
+
+class Command(BaseCommand):
+    help = 'Reconstruye los acumulados diarios de ventas por día, producto y cliente desde Pedido/DetallePedido, y los rankings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Solo recalcula desde esta fecha local (AAAA-MM-DD); los días anteriores no se tocan.')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde debe tener el formato AAAA-MM-DD.')
+        dias = recalcular(desde)
+        self.stdout.write(self.style.SUCCESS(f'Acumulados de ventas recalculados: {dias} días con ventas.'))
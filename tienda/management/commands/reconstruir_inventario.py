@@ -0,0 +1,29 @@
+"""
+Reconstruye o verifica el libro de movimientos de inventario a partir de DetalleCompra y DetallePedido.
+Uso: python manage.py reconstruir_inventario [--verificar] [--fotos]
+"""
+from django.core.management.base import BaseCommand
+from tienda.movimientos import reconstruir, verificar, tomar_fotos
+
+class Command(BaseCommand):
+    help = 'Regenera el libro de inventario desde compras y pedidos (con saldo inicial por producto) o verifica que cuadre con el stock.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='Solo reporta productos cuyo stock no coincide con el libro.')
+        parser.add_argument('--fotos', action='store_true', help='Solo toma una foto del stock actual según el libro.')
+
+    def handle(self, *args, **options):
+        if options['fotos']:
+            self.stdout.write(self.style.SUCCESS(f'Fotos de stock tomadas para {tomar_fotos()} productos.'))
+            return
+        if options['verificar']:
+            diferencias = verificar()
+            for item in diferencias:
+                self.stdout.write(self.style.WARNING(f"Producto #{item['producto_id']} ({item['nombre']}): stock {item['stock']}, libro {item['libro']}"))
+            if diferencias:
+                self.stdout.write(self.style.ERROR(f'{len(diferencias)} productos con stock distinto al libro.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('El stock de todos los productos coincide con el libro.'))
+            return
+        total = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Libro de inventario reconstruido con {total} movimientos.'))
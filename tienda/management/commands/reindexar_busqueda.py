@@ -0,0 +1,20 @@
+"""
+Reconstruye el índice invertido de búsqueda de productos.
+Uso: python manage.py reindexar_busqueda [--completo]
+"""
+from django.core.management.base import BaseCommand
+from tienda.models import TerminoIndice, DocumentoIndice
+from tienda.busqueda import reindexar_todo
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (solo los documentos que cambiaron, o todos con --completo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Vacía el índice antes de reconstruirlo.')
+
+    def handle(self, *args, **options):
+        if options['completo']:
+            TerminoIndice.objects.all().delete()
+            DocumentoIndice.objects.all().delete()
+        total = reindexar_todo()
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda actualizado para {total} productos.'))
@@ -1,4 +1,5 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
 
 class UsuarioManager(BaseUserManager):
     def create_user(self, numero, nombre, apellido, password=None, **extra_fields):
@@ -21,3 +22,14 @@ class UsuarioManager(BaseUserManager):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(numero, nombre, apellido, password, **extra_fields)
+
+# -----------------------------
+# QUERYSET DE CATÁLOGO
+# -----------------------------
+class ProductoQuerySet(models.QuerySet):
+    def para_catalogo(self):
+        """
+        Ruta de lectura del catálogo: subcategoría por JOIN e imágenes por prefetch.
+        Reseñas, likes y calificación promedio son columnas desnormalizadas del propio producto.
+        """
+        return self.select_related('subcategoria').prefetch_related('imagenes')
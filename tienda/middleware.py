@@ -3,6 +3,7 @@ Middleware personalizado para manejar CSRF en desarrollo
 """
 
 from django.utils.deprecation import MiddlewareMixin
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
 from django.conf import settings
 
 class CSRFMiddleware(MiddlewareMixin):
@@ -18,4 +19,14 @@ class CSRFMiddleware(MiddlewareMixin):
             if request.method in ('GET', 'HEAD', 'OPTIONS'):
                 setattr(request, '_dont_enforce_csrf_checks', True)
             # Para POST/PUT/PATCH/DELETE siempre se exige CSRF para evitar problemas al pasar a producción.
-        return None 
\ No newline at end of file
+        return None 
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """
+    GZip de Django que omite las respuestas marcadas con `sin_compresion`: las descargas con rangos de
+    bytes deben enviarse tal cual (comprimirlas invalidaría Content-Range y Content-Length).
+    """
+    def process_response(self, request, response):
+        if getattr(response, 'sin_compresion', False):
+            return response
+        return super().process_response(request, response)
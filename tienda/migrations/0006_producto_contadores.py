@@ -0,0 +1,71 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:06
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def poblar_contadores(apps, schema_editor):
+    Producto = apps.get_model("tienda", "Producto")
+    Like = apps.get_model("tienda", "Like")
+    Comentario = apps.get_model("tienda", "Comentario")
+    Calificacion = apps.get_model("tienda", "Calificacion")
+
+    def subconsulta(queryset, agregado):
+        return Coalesce(
+            Subquery(
+                queryset.filter(producto=OuterRef("pk"))
+                .order_by()
+                .values("producto")
+                .annotate(valor=agregado)
+                .values("valor")
+            ),
+            0,
+        )
+
+    Producto.objects.update(
+        likes_total=subconsulta(Like.objects.all(), Count("pk")),
+        resenas_total=subconsulta(Comentario.objects.filter(activo=True), Count("pk")),
+        calificacion_suma=subconsulta(Calificacion.objects.all(), Sum("valor")),
+        calificacion_cantidad=subconsulta(Calificacion.objects.all(), Count("pk")),
+    )
+    Producto.objects.filter(calificacion_cantidad__gt=0).update(
+        calificacion_promedio=Cast("calificacion_suma", models.FloatField())
+        / F("calificacion_cantidad")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0005_alter_categoria_activa_alter_producto_activo_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="producto",
+            name="likes_total",
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="producto",
+            name="resenas_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="producto",
+            name="calificacion_suma",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="producto",
+            name="calificacion_cantidad",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="producto",
+            name="calificacion_promedio",
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,148 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:12
+
+from collections import Counter
+from hashlib import sha1
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copia congelada del tokenizador de tienda.busqueda al crear el índice: la migración no depende del
+# código vivo. Si el tokenizador cambia, `python manage.py reindexar_busqueda` reconstruye el índice.
+PESOS_CAMPOS = {"nombre": 3.0, "subcategoria": 2.0, "categoria": 2.0, "descripcion": 1.0}
+PALABRAS_VACIAS = {
+    "a", "al", "con", "de", "del", "e", "el", "en", "es", "la", "las", "lo", "los", "o", "para", "por",
+    "se", "sin", "su", "sus", "u", "un", "una", "unos", "unas", "y", "que", "mas", "muy",
+}
+SUFIJOS = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "iciones", "idades", "acion", "icion",
+    "mente", "idad", "antes", "entes", "ante", "ente", "ables", "ibles", "able", "ible", "osos", "osas",
+    "oso", "osa",
+)
+
+
+def normalizar(texto):
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def raiz(palabra):
+    if len(palabra) <= 3 or palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[: -len(sufijo)]
+    if palabra.endswith("ces"):
+        palabra = palabra[:-3] + "z"
+    elif palabra.endswith("es") and len(palabra) > 4 and palabra[-3] not in "aeiou":
+        palabra = palabra[:-2]
+    elif palabra.endswith("s"):
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra[-1] in "aeo":
+        palabra = palabra[:-1]
+    return palabra
+
+
+def tokenizar(texto):
+    return [raiz(p) for p in re.findall(r"[a-z0-9]+", normalizar(texto)) if p not in PALABRAS_VACIAS]
+
+
+def terminos_ponderados(nombre, descripcion, subcategoria, categoria):
+    frecuencias = Counter()
+    for campo, texto in (("nombre", nombre), ("subcategoria", subcategoria), ("categoria", categoria), ("descripcion", descripcion)):
+        for termino in tokenizar(texto):
+            frecuencias[termino[:60]] += PESOS_CAMPOS[campo]
+    return frecuencias, sum(frecuencias.values())
+
+
+def _huella(frecuencias):
+    return sha1(repr(sorted(frecuencias.items())).encode()).hexdigest()
+
+
+def construir_indice(apps, schema_editor):
+    Producto = apps.get_model("tienda", "Producto")
+    TerminoIndice = apps.get_model("tienda", "TerminoIndice")
+    DocumentoIndice = apps.get_model("tienda", "DocumentoIndice")
+    terminos, documentos = [], []
+    filas = Producto.objects.values_list(
+        "pk",
+        "nombre",
+        "descripcion",
+        "subcategoria__nombre",
+        "subcategoria__categoria__nombre",
+    )
+    for pk, *campos in filas.iterator():
+        frecuencias, longitud = terminos_ponderados(*campos)
+        terminos.extend(
+            TerminoIndice(
+                termino=termino,
+                producto_id=pk,
+                frecuencia=frecuencia,
+                longitud=longitud,
+            )
+            for termino, frecuencia in frecuencias.items()
+        )
+        documentos.append(
+            DocumentoIndice(
+                producto_id=pk, longitud=longitud, huella=_huella(frecuencias)
+            )
+        )
+    TerminoIndice.objects.bulk_create(terminos, batch_size=1000)
+    DocumentoIndice.objects.bulk_create(documentos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0006_producto_contadores"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentoIndice",
+            fields=[
+                (
+                    "producto",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="documento_indice",
+                        serialize=False,
+                        to="tienda.producto",
+                    ),
+                ),
+                ("longitud", models.FloatField()),
+                ("huella", models.CharField(max_length=40)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TerminoIndice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("termino", models.CharField(db_index=True, max_length=60)),
+                ("frecuencia", models.FloatField()),
+                ("longitud", models.FloatField()),
+                (
+                    "producto",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="terminos_indice",
+                        to="tienda.producto",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("termino", "producto")},
+            },
+        ),
+        migrations.RunPython(construir_indice, migrations.RunPython.noop),
+    ]
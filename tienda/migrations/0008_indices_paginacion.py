@@ -0,0 +1,92 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0007_indice_busqueda"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="producto",
+            name="calificacion_promedio",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="producto",
+            name="fecha_creacion",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name="producto",
+            name="likes_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="historialaccion",
+            index=models.Index(fields=["fecha", "id"], name="historial_fecha_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="historialaccion",
+            index=models.Index(
+                fields=["usuario", "fecha", "id"], name="historial_usuario_fecha_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificacion",
+            index=models.Index(
+                fields=["usuario", "creada", "id"], name="notificacion_usuario_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pedido",
+            index=models.Index(fields=["creado", "id"], name="pedido_creado_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pedido",
+            index=models.Index(
+                fields=["usuario", "creado", "id"], name="pedido_usuario_creado_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(
+                fields=["fecha_creacion", "id"], name="producto_fecha_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(fields=["nombre", "id"], name="producto_nombre_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(fields=["precio", "id"], name="producto_precio_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(fields=["stock", "id"], name="producto_stock_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(
+                fields=["likes_total", "id"], name="producto_likes_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(
+                fields=["resenas_total", "id"], name="producto_resenas_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(
+                fields=["calificacion_promedio", "id"],
+                name="producto_calificacion_id_idx",
+            ),
+        ),
+    ]
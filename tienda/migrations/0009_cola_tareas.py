@@ -0,0 +1,80 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def marcar_facturas_existentes(apps, schema_editor):
+    Pedido = apps.get_model("tienda", "Pedido")
+    Pedido.objects.exclude(pdf="").exclude(pdf__isnull=True).update(factura_estado="generada")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0008_indices_paginacion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pedido",
+            name="factura_estado",
+            field=models.CharField(
+                choices=[
+                    ("pendiente", "Pendiente"),
+                    ("generada", "Generada"),
+                    ("fallida", "Fallida"),
+                ],
+                default="pendiente",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(marcar_facturas_existentes, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="Tarea",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("funcion", models.CharField(max_length=200)),
+                ("argumentos", models.JSONField(blank=True, default=dict)),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("pendiente", "Pendiente"),
+                            ("en_proceso", "En proceso"),
+                            ("completada", "Completada"),
+                            ("fallida", "Fallida"),
+                        ],
+                        default="pendiente",
+                        max_length=12,
+                    ),
+                ),
+                ("intentos", models.PositiveSmallIntegerField(default=0)),
+                ("max_intentos", models.PositiveSmallIntegerField(default=5)),
+                (
+                    "ejecutar_en",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("bloqueada_hasta", models.DateTimeField(blank=True, null=True)),
+                ("ultimo_error", models.TextField(blank=True)),
+                ("creada", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finalizada", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["estado", "ejecutar_en"],
+                        name="tarea_estado_ejecutar_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0009_cola_tareas"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pedido",
+            name="factura_huella",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:29
+
+from django.db import migrations, models
+
+
+def calcular_imagenes_principales(apps, schema_editor):
+    Producto = apps.get_model("tienda", "Producto")
+    ImagenProducto = apps.get_model("tienda", "ImagenProducto")
+    principales = {}
+    for imagen in ImagenProducto.objects.order_by("producto_id", "-es_principal", "orden", "id").iterator():
+        if imagen.producto_id not in principales:
+            principales[imagen.producto_id] = (imagen.imagen.url if imagen.imagen else imagen.url_imagen) or ""
+    Producto.objects.bulk_update(
+        [Producto(pk=pk, imagen_principal=url) for pk, url in principales.items()], ["imagen_principal"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0010_pedido_factura_huella"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="producto",
+            name="imagen_principal",
+            field=models.CharField(blank=True, default="", max_length=500),
+        ),
+        migrations.RunPython(calcular_imagenes_principales, migrations.RunPython.noop),
+    ]
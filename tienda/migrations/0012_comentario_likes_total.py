@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def contar_likes(apps, schema_editor):
+    Comentario = apps.get_model("tienda", "Comentario")
+    LikeComentario = apps.get_model("tienda", "LikeComentario")
+    conteo = (
+        LikeComentario.objects.filter(comentario=OuterRef("pk")).order_by().values("comentario").annotate(total=Count("pk")).values("total")
+    )
+    Comentario.objects.update(likes_total=Coalesce(Subquery(conteo), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0011_producto_imagen_principal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comentario",
+            name="likes_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(contar_likes, migrations.RunPython.noop),
+    ]
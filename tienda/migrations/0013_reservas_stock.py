@@ -0,0 +1,57 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0012_comentario_likes_total"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReservaStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cantidad", models.PositiveIntegerField()),
+                ("expira", models.DateTimeField()),
+                (
+                    "producto",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservas",
+                        to="tienda.producto",
+                    ),
+                ),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservas",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["producto", "expira"],
+                        name="reserva_producto_expira_idx",
+                    ),
+                    models.Index(fields=["expira"], name="reserva_expira_idx"),
+                ],
+                "unique_together": {("usuario", "producto")},
+            },
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0013_reservas_stock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MovimientoInventario",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[
+                            ("compra", "Compra a proveedor"),
+                            ("venta", "Venta"),
+                            ("ajuste", "Ajuste"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("cantidad", models.IntegerField()),
+                ("fecha", models.DateTimeField(default=django.utils.timezone.now)),
+                ("nota", models.CharField(blank=True, max_length=255)),
+                (
+                    "detalle_compra",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="movimientos",
+                        to="tienda.detallecompra",
+                    ),
+                ),
+                (
+                    "detalle_pedido",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="movimientos",
+                        to="tienda.detallepedido",
+                    ),
+                ),
+                (
+                    "producto",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="movimientos",
+                        to="tienda.producto",
+                    ),
+                ),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["producto", "fecha"],
+                        name="movimiento_producto_fecha_idx",
+                    ),
+                    models.Index(fields=["fecha"], name="movimiento_fecha_idx"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="FotoStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fecha", models.DateTimeField()),
+                ("stock", models.IntegerField()),
+                (
+                    "producto",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fotos_stock",
+                        to="tienda.producto",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["fecha"], name="foto_stock_fecha_idx")
+                ],
+                "unique_together": {("producto", "fecha")},
+            },
+        ),
+    ]
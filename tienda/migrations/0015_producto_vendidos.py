@@ -0,0 +1,24 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0014_movimientos_inventario"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="producto",
+            name="vendidos_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="producto",
+            index=models.Index(
+                fields=["vendidos_total", "id"], name="producto_vendidos_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0015_producto_vendidos"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LikePendiente",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tipo", models.CharField(max_length=10)),
+                ("objeto_id", models.PositiveIntegerField()),
+            ],
+            options={
+                "unique_together": {("tipo", "objeto_id")},
+            },
+        ),
+    ]
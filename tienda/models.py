@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
+from .managers import ProductoQuerySet
 
 # -----------------------------
 # MANAGER DE USUARIO PERSONALIZADO
@@ -59,6 +60,12 @@ class HistorialAccion(models.Model):
     fecha = models.DateTimeField(default=timezone.now)
     ip = models.CharField(max_length=45, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='historial_fecha_id_idx'),
+            models.Index(fields=['usuario', 'fecha', 'id'], name='historial_usuario_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.usuario} - {self.accion} - {self.fecha.strftime('%Y-%m-%d %H:%M:%S')}"
 
@@ -88,10 +95,35 @@ class Producto(models.Model):
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     imagen = models.ImageField(upload_to='productos/', null=True, blank=True)
+    # URL de la imagen principal, precalculada para los listados (ver tienda.campos)
+    imagen_principal = models.CharField(max_length=500, blank=True, default='')
     stock = models.PositiveIntegerField(default=0)
     destacado = models.BooleanField(default=False, db_index=True)
     activo = models.BooleanField(default=True, db_index=True)
-    fecha_creacion = models.DateTimeField(default=timezone.now, db_index=True)
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+    # Contadores desnormalizados: se mantienen en cada escritura desde tienda.contadores
+    likes_total = models.PositiveIntegerField(default=0)
+    resenas_total = models.PositiveIntegerField(default=0)
+    calificacion_suma = models.PositiveIntegerField(default=0)
+    calificacion_cantidad = models.PositiveIntegerField(default=0)
+    calificacion_promedio = models.FloatField(default=0)
+    # Unidades vendidas en pedidos vigentes (ver tienda.rankings)
+    vendidos_total = models.PositiveIntegerField(default=0)
+
+    objects = ProductoQuerySet.as_manager()
+
+    class Meta:
+        # Índices compuestos (campo, id) para la paginación por cursor de cada orden del catálogo
+        indexes = [
+            models.Index(fields=['fecha_creacion', 'id'], name='producto_fecha_id_idx'),
+            models.Index(fields=['nombre', 'id'], name='producto_nombre_id_idx'),
+            models.Index(fields=['precio', 'id'], name='producto_precio_id_idx'),
+            models.Index(fields=['stock', 'id'], name='producto_stock_id_idx'),
+            models.Index(fields=['likes_total', 'id'], name='producto_likes_id_idx'),
+            models.Index(fields=['resenas_total', 'id'], name='producto_resenas_id_idx'),
+            models.Index(fields=['calificacion_promedio', 'id'], name='producto_calificacion_id_idx'),
+            models.Index(fields=['vendidos_total', 'id'], name='producto_vendidos_id_idx'),
+        ]
 
     def clean(self):
         """
@@ -143,6 +175,29 @@ class ImagenProducto(models.Model):
     def __str__(self):
         return f"Imagen de {self.producto.nombre} ({self.id})"
 
+# -----------------------------
+# ÍNDICE DE BÚSQUEDA (ver tienda.busqueda)
+# -----------------------------
+class TerminoIndice(models.Model):
+    termino = models.CharField(max_length=60, db_index=True)
+    producto = models.ForeignKey(Producto, related_name='terminos_indice', on_delete=models.CASCADE)
+    frecuencia = models.FloatField()
+    longitud = models.FloatField()  # Longitud ponderada del documento, copiada para calcular BM25 sin JOIN
+
+    class Meta:
+        unique_together = ('termino', 'producto')
+
+    def __str__(self):
+        return f"{self.termino} -> {self.producto_id}"
+
+class DocumentoIndice(models.Model):
+    producto = models.OneToOneField(Producto, related_name='documento_indice', on_delete=models.CASCADE, primary_key=True)
+    longitud = models.FloatField()
+    huella = models.CharField(max_length=40)
+
+    def __str__(self):
+        return f"Documento de búsqueda de {self.producto_id}"
+
 # -----------------------------
 # MODELOS DE CARRITO PERSISTENTE
 # -----------------------------
@@ -166,6 +221,25 @@ class CarritoItem(models.Model):
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre} ({self.carrito.usuario.numero})"
 
+class ReservaStock(models.Model):
+    """Unidades apartadas por el carrito de un usuario hasta `expira` (ver tienda.reservas)."""
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='reservas')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('usuario', 'producto')
+        indexes = [
+            # Stock disponible: suma de reservas vigentes de un producto
+            models.Index(fields=['producto', 'expira'], name='reserva_producto_expira_idx'),
+            # Barrido de reservas vencidas
+            models.Index(fields=['expira'], name='reserva_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto_id} para {self.usuario_id} hasta {self.expira}"
+
 # -----------------------------
 # MODELOS DE PEDIDO Y DETALLE
 # -----------------------------
@@ -186,6 +260,18 @@ class Pedido(models.Model):
     creado_por = models.ForeignKey('Usuario', null=True, blank=True, related_name='ventas_registradas', on_delete=models.SET_NULL)
     metodo_pago = models.CharField(max_length=30, default='contraentrega')
     activo = models.BooleanField(default=True)
+    # La factura PDF se genera en segundo plano (ver tienda.tareas)
+    FACTURA_ESTADOS = [('pendiente', 'Pendiente'), ('generada', 'Generada'), ('fallida', 'Fallida')]
+    factura_estado = models.CharField(max_length=10, choices=FACTURA_ESTADOS, default='pendiente')
+    # Hash del contenido facturado: el PDF se guarda bajo esta huella y se reutiliza mientras no cambie
+    factura_huella = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creado', 'id'], name='pedido_creado_id_idx'),
+            models.Index(fields=['usuario', 'creado', 'id'], name='pedido_usuario_creado_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido #{self.id} de {self.usuario}"
 
@@ -216,6 +302,48 @@ class DetallePedido(models.Model):
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre}"
 
+# -----------------------------
+# LIBRO DE MOVIMIENTOS DE INVENTARIO (ver tienda.movimientos)
+# -----------------------------
+class MovimientoInventario(models.Model):
+    TIPOS = [
+        ('compra', 'Compra a proveedor'),
+        ('venta', 'Venta'),
+        ('ajuste', 'Ajuste'),
+    ]
+    producto = models.ForeignKey(Producto, related_name='movimientos', on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    cantidad = models.IntegerField()  # Con signo: positiva entra al inventario, negativa sale
+    fecha = models.DateTimeField(default=timezone.now)
+    detalle_compra = models.ForeignKey(DetalleCompra, related_name='movimientos', on_delete=models.SET_NULL, null=True, blank=True)
+    detalle_pedido = models.ForeignKey(DetallePedido, related_name='movimientos', on_delete=models.SET_NULL, null=True, blank=True)
+    usuario = models.ForeignKey('Usuario', on_delete=models.SET_NULL, null=True, blank=True)
+    nota = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='movimiento_producto_fecha_idx'),
+            models.Index(fields=['fecha'], name='movimiento_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.cantidad:+d} de {self.producto_id} ({self.fecha})"
+
+class FotoStock(models.Model):
+    """Stock de un producto en un instante; el stock a otra fecha se obtiene sumando los movimientos posteriores."""
+    producto = models.ForeignKey(Producto, related_name='fotos_stock', on_delete=models.CASCADE)
+    fecha = models.DateTimeField()
+    stock = models.IntegerField()
+
+    class Meta:
+        unique_together = ('producto', 'fecha')
+        indexes = [
+            models.Index(fields=['fecha'], name='foto_stock_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.stock} al {self.fecha}"
+
 # -----------------------------
 # MODELOS DE INTERACCIÓN: COMENTARIO, CALIFICACIÓN, LIKE
 # -----------------------------
@@ -226,6 +354,8 @@ class Comentario(models.Model):
     creado = models.DateTimeField(default=timezone.now)
     activo = models.BooleanField(default=True)
     comentario_padre = models.ForeignKey('self', null=True, blank=True, related_name='respuestas', on_delete=models.CASCADE)
+    # Contador desnormalizado de LikeComentario (ver tienda.likes)
+    likes_total = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Comentario de {self.usuario} en {self.producto}"
@@ -249,6 +379,11 @@ class Notificacion(models.Model):
     creada = models.DateTimeField(default=timezone.now)
     eliminada = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'creada', 'id'], name='notificacion_usuario_idx'),
+        ]
+
     def __str__(self):
         return f"Notificación para {self.usuario}: {self.mensaje[:30]}..."
 
@@ -274,3 +409,43 @@ class Like(models.Model):
 
     def __str__(self):
         return f"Like de {self.usuario} en {self.producto.nombre}"
+
+# Objetos con un delta de likes acumulado en caché esperando el volcado (ver tienda.likes)
+class LikePendiente(models.Model):
+    tipo = models.CharField(max_length=10)
+    objeto_id = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('tipo', 'objeto_id')
+
+    def __str__(self):
+        return f"Like pendiente de {self.tipo} {self.objeto_id}"
+
+# -----------------------------
+# COLA DE TAREAS EN SEGUNDO PLANO
+# -----------------------------
+class Tarea(models.Model):
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+    funcion = models.CharField(max_length=200)  # Ruta importable, p. ej. 'tienda.utils_pdf.generar_factura'
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=12, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    ejecutar_en = models.DateTimeField(default=timezone.now)
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+    finalizada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'ejecutar_en'], name='tarea_estado_ejecutar_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tarea #{self.id} {self.funcion} ({self.estado})"
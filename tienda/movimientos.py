@@ -0,0 +1,198 @@
+"""
+Libro de movimientos de inventario: solo se agregan filas, nunca se editan.
+
+Cada entrada o salida de stock (compra a proveedor, venta, ajuste) es un MovimientoInventario con cantidad
+con signo, y Producto.stock se actualiza en la misma transacción con un único UPDATE condicional (una
+salida nunca deja stock negativo). Corregir un movimiento es registrar otro que lo compense.
+
+FotoStock guarda periódicamente el stock de todos los productos según el libro: el stock a una fecha es la
+última foto anterior más los movimientos posteriores hasta esa fecha. La fecha de un movimiento se fija al
+crearlo, antes de confirmar su transacción: las fotos se toman MARGEN_FOTOS atrás para no dejar fuera
+movimientos aún sin confirmar con fecha anterior a la foto. reconstruir() regenera el libro
+desde DetalleCompra y DetallePedido, con un ajuste de saldo inicial para cuadrar con el stock actual.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Min, Max, Case, When, Value, IntegerField
+from django.utils import timezone
+from .models import Producto, MovimientoInventario, FotoStock, DetalleCompra, DetallePedido
+from .catalogo import invalidar_catalogo
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOTE = 1000
+MARGEN_FOTOS = timedelta(minutes=5)  # mayor que la transacción más larga que registra movimientos
+
+
+class StockInsuficiente(Exception):
+    """Una salida dejaría stock negativo; `productos` son los ids rechazados."""
+
+    def __init__(self, productos):
+        super().__init__(f'Stock insuficiente para los productos {sorted(productos)}')
+        self.productos = productos
+
+
+def _aplicar_stock(deltas):
+    """Un UPDATE para todos los productos; las salidas solo se aplican si alcanza el stock."""
+    delta = Case(*[When(pk=pk, then=Value(cantidad)) for pk, cantidad in deltas.items()], output_field=IntegerField())
+    minimo = Case(
+        *[When(pk=pk, then=Value(-cantidad)) for pk, cantidad in deltas.items() if cantidad < 0],
+        default=Value(0), output_field=IntegerField(),
+    )
+    actualizados = Producto.objects.filter(pk__in=deltas, stock__gte=minimo).update(stock=F('stock') + delta)
+    if actualizados != len(deltas):
+        suficientes = Producto.objects.filter(pk__in=deltas, stock__gte=minimo).values_list('pk', flat=True)
+        raise StockInsuficiente(set(deltas) - set(suficientes))
+    invalidar_catalogo()
+
+
+def registrar(movimientos, actualizar_stock=True):
+    """
+    Agrega los movimientos (instancias sin guardar) y, con `actualizar_stock`, ajusta Producto.stock en la
+    misma transacción. Lanza StockInsuficiente sin registrar nada si alguna salida no alcanza.
+    """
+    movimientos = [movimiento for movimiento in movimientos if movimiento.cantidad]
+    if not movimientos:
+        return []
+    with transaction.atomic():
+        if actualizar_stock:
+            deltas = defaultdict(int)
+            for movimiento in movimientos:
+                deltas[movimiento.producto_id] += movimiento.cantidad
+            deltas = {pk: cantidad for pk, cantidad in deltas.items() if cantidad}
+            if deltas:
+                _aplicar_stock(deltas)
+        return MovimientoInventario.objects.bulk_create(movimientos, batch_size=LOTE)
+
+
+def compra(detalles, signo=1, usuario=None, nota=''):
+    """Entrada de mercancía por DetalleCompra (signo=-1 la revierte, p. ej. al anular la compra)."""
+    return registrar([
+        MovimientoInventario(producto_id=detalle.producto_id, tipo='compra', cantidad=signo * detalle.cantidad,
+                             detalle_compra=detalle, usuario=usuario, nota=nota)
+        for detalle in detalles
+    ])
+
+
+def venta(detalles, actualizar_stock=True, usuario=None):
+    """Salida por DetallePedido; la compra del carrito ya descontó el stock y pasa actualizar_stock=False."""
+    return registrar([
+        MovimientoInventario(producto_id=detalle.producto_id, tipo='venta', cantidad=-detalle.cantidad,
+                             detalle_pedido=detalle, usuario=usuario)
+        for detalle in detalles
+    ], actualizar_stock)
+
+
+def ajuste(producto_id, cantidad, usuario=None, nota='', actualizar_stock=True):
+    return registrar([MovimientoInventario(producto_id=producto_id, tipo='ajuste', cantidad=cantidad, usuario=usuario, nota=nota)], actualizar_stock)
+
+
+# --- Fotos de stock ---
+def _ultima_foto(hasta=None):
+    fotos = FotoStock.objects.all() if hasta is None else FotoStock.objects.filter(fecha__lte=hasta)
+    return fotos.aggregate(fecha=Max('fecha'))['fecha']
+
+
+def _stock_libro(hasta, productos=None):
+    """{producto_id: stock según el libro a `hasta`}: última foto + movimientos posteriores (dos consultas agrupadas)."""
+    fecha_foto = _ultima_foto(hasta)
+    fotos = FotoStock.objects.filter(fecha=fecha_foto)
+    movimientos = MovimientoInventario.objects.filter(fecha__lte=hasta)
+    if fecha_foto is not None:
+        movimientos = movimientos.filter(fecha__gt=fecha_foto)
+    if productos is not None:
+        fotos, movimientos = fotos.filter(producto_id__in=productos), movimientos.filter(producto_id__in=productos)
+    stock = defaultdict(int, fotos.values_list('producto_id', 'stock') if fecha_foto is not None else ())
+    for producto_id, delta in movimientos.order_by().values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total'):
+        stock[producto_id] += delta
+    return stock
+
+
+def stock_en(producto_id, fecha):
+    """Stock del producto a `fecha` según el libro."""
+    return _stock_libro(fecha, [producto_id])[producto_id]
+
+
+def tomar_fotos(ahora=None):
+    """
+    Guarda el stock de todos los productos con movimientos a `ahora` (por omisión, MARGEN_FOTOS antes del
+    instante actual); retorna cuántas fotos se tomaron.
+    """
+    ahora = ahora or timezone.now() - MARGEN_FOTOS
+    stock = _stock_libro(ahora)
+    FotoStock.objects.bulk_create(
+        [FotoStock(producto_id=pk, fecha=ahora, stock=cantidad) for pk, cantidad in stock.items()],
+        batch_size=LOTE, ignore_conflicts=True,
+    )
+    logger.info(f"Fotos de stock tomadas para {len(stock)} productos")
+    return len(stock)
+
+
+def tomar_fotos_si_corresponde():
+    """Toma las fotos si la última tiene más de INVENTARIO_FOTOS_HORAS (para el worker)."""
+    ultima = _ultima_foto()
+    if ultima is None or timezone.now() - MARGEN_FOTOS - ultima > timedelta(hours=settings.INVENTARIO_FOTOS_HORAS):
+        return tomar_fotos()
+    return 0
+
+
+def verificar():
+    """Productos cuyo Producto.stock no coincide con el libro: [{producto_id, nombre, stock, libro}]."""
+    libro = _stock_libro(timezone.now())
+    resultado = [
+        {'producto_id': pk, 'nombre': nombre, 'stock': stock, 'libro': libro.get(pk, 0)}
+        for pk, nombre, stock in Producto.objects.order_by('pk').values_list('pk', 'nombre', 'stock')
+        if stock != libro.get(pk, 0)
+    ]
+    if resultado:
+        logger.warning(f"{len(resultado)} productos con stock distinto al libro de inventario")
+    return resultado
+
+
+# --- Reconstrucción ---
+def _en_lotes(queryset, construir):
+    lote = []
+    for fila in queryset.iterator(chunk_size=LOTE):
+        lote.append(construir(fila))
+        if len(lote) >= LOTE:
+            MovimientoInventario.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        MovimientoInventario.objects.bulk_create(lote)
+
+
+def reconstruir():
+    """
+    Regenera el libro desde el historial: una entrada por DetalleCompra de compras activas, una salida por
+    DetallePedido y, por producto, un ajuste de saldo inicial (fechado antes de su primer movimiento) que
+    cuadra el libro con el stock actual. Borra las fotos y toma una nueva. No modifica Producto.stock.
+    """
+    with transaction.atomic():
+        FotoStock.objects.all().delete()
+        MovimientoInventario.objects.all().delete()
+        _en_lotes(
+            DetalleCompra.objects.filter(compra__activo=True).values_list('pk', 'producto_id', 'cantidad', 'compra__creado', 'compra__usuario_id'),
+            lambda fila: MovimientoInventario(detalle_compra_id=fila[0], producto_id=fila[1], tipo='compra', cantidad=fila[2], fecha=fila[3], usuario_id=fila[4]),
+        )
+        _en_lotes(
+            DetallePedido.objects.values_list('pk', 'producto_id', 'cantidad', 'pedido__creado', 'pedido__usuario_id'),
+            lambda fila: MovimientoInventario(detalle_pedido_id=fila[0], producto_id=fila[1], tipo='venta', cantidad=-fila[2], fecha=fila[3], usuario_id=fila[4]),
+        )
+        historial = {
+            fila['producto_id']: fila
+            for fila in MovimientoInventario.objects.order_by().values('producto_id').annotate(total=Sum('cantidad'), primera=Min('fecha'))
+        }
+        iniciales = []
+        for pk, stock, creado in Producto.objects.values_list('pk', 'stock', 'fecha_creacion').iterator(chunk_size=LOTE):
+            fila = historial.get(pk, {'total': 0, 'primera': creado})
+            if stock != fila['total']:
+                fecha = min(creado, fila['primera'] - timedelta(microseconds=1))
+                iniciales.append(MovimientoInventario(producto_id=pk, tipo='ajuste', cantidad=stock - fila['total'], fecha=fecha, nota='Saldo inicial'))
+        MovimientoInventario.objects.bulk_create(iniciales, batch_size=LOTE)
+        total = MovimientoInventario.objects.count()
+        tomar_fotos()
+    logger.info(f"Libro de inventario reconstruido con {total} movimientos")
+    return total
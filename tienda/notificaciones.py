@@ -1,6 +1,5 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from .models import Notificacion, Usuario
+from .tareas import encolar
 from django.utils import timezone
 
 def notificar_usuario(usuario, mensaje, tipo='info'):
@@ -8,9 +7,19 @@ def notificar_usuario(usuario, mensaje, tipo='info'):
     Notifica a un usuario (o a todos los admins si usuario=None) solo de forma persistente (base de datos).
     """
     if usuario is None:
-        # Notificar a todos los admins
-        admins = Usuario.objects.filter(es_admin=True, esta_activo=True)
-        for admin in admins:
-            Notificacion.objects.create(usuario=admin, tipo=tipo, mensaje=mensaje, creada=timezone.now())
+        # Notificar a todos los admins con un solo INSERT
+        admins = Usuario.objects.filter(es_admin=True, esta_activo=True).values_list('pk', flat=True)
+        Notificacion.objects.bulk_create([
+            Notificacion(usuario_id=admin_id, tipo=tipo, mensaje=mensaje, creada=timezone.now()) for admin_id in admins
+        ], batch_size=500)
     else:
         Notificacion.objects.create(usuario=usuario, tipo=tipo, mensaje=mensaje, creada=timezone.now())
+
+def enviar_notificacion(usuario_id, mensaje, tipo='info'):
+    """Tarea en segundo plano de notificar_usuario (usuario_id=None notifica a los admins)."""
+    usuario = Usuario.objects.get(pk=usuario_id) if usuario_id is not None else None
+    notificar_usuario(usuario, mensaje, tipo)
+
+def notificar_en_segundo_plano(usuario, mensaje, tipo='info'):
+    """Encola la notificación en la cola de tareas para no hacer el fan-out dentro de la petición."""
+    return encolar(enviar_notificacion, usuario_id=usuario.pk if usuario else None, mensaje=mensaje, tipo=tipo)
@@ -0,0 +1,175 @@
+"""
+Paginación por cursor (keyset) sobre claves de orden estables.
+
+En lugar de OFFSET + COUNT(*) cada página filtra a partir de los valores de orden de la última fila
+entregada (p. ej. `fecha_creacion < x OR (fecha_creacion = x AND id < y)`), de modo que el costo no
+crece con la profundidad. Los cursores son opacos (base64 de JSON) y el total solo se calcula si el
+cliente lo pide con `?total=1`. Cada orden debe estar respaldado por un índice compuesto (campo, id).
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_INVALIDO = 'Cursor inválido.'
+
+
+def _invertir(campo):
+    return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+
+def completar_orden(orden):
+    """Agrega el id como desempate (en la misma dirección que la última clave) para que el orden sea total."""
+    orden = [campo for campo in orden if isinstance(campo, str)]
+    if not orden:
+        return ['-id']
+    if orden[-1].lstrip('-') not in ('id', 'pk'):
+        orden.append('-id' if orden[-1].startswith('-') else 'id')
+    return orden
+
+
+def _valor(fila, campo):
+    nombre = campo.lstrip('-')
+    nombre = 'id' if nombre == 'pk' else nombre
+    valor = fila[nombre] if isinstance(fila, dict) else getattr(fila, nombre)
+    # isoformat completo: DjangoJSONEncoder recorta a milisegundos y el cursor saltaría filas
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _condicion_posterior(orden, valores):
+    """Filas estrictamente posteriores a `valores` en el orden lexicográfico dado."""
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicion |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+        iguales[nombre] = valor
+    return condicion
+
+
+def reenlazar(datos, request, parametro='cursor'):
+    """
+    Rehace `next` y `previous` de una respuesta paginada guardada en caché sobre la URL de `request`,
+    conservando sus cursores: los enlaces no dependen de la consulta de quien llenó la caché.
+    """
+    base = remove_query_param(request.build_absolute_uri(), 'page')
+    datos = dict(datos)
+    for enlace in ('next', 'previous'):
+        if datos.get(enlace):
+            cursor = parse_qs(urlsplit(datos[enlace]).query).get(parametro)
+            datos[enlace] = replace_query_param(base, parametro, cursor[0]) if cursor else None
+    return datos
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+    # Orden por defecto si el queryset no trae uno propio
+    ordering = ('-id',)
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+            if tamano > 0:
+                return min(tamano, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    # --- Cursores ---
+    def codificar_cursor(self, datos):
+        return urlsafe_b64encode(json.dumps(datos, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decodificar_cursor(self, request):
+        crudo = request.query_params.get(self.cursor_query_param)
+        if not crudo:
+            return None
+        try:
+            datos = json.loads(urlsafe_b64decode(crudo + '=' * (-len(crudo) % 4)))
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(CURSOR_INVALIDO)
+        if not isinstance(datos, dict):
+            raise NotFound(CURSOR_INVALIDO)
+        return datos
+
+    def _valores_cursor(self, model, orden, cursor):
+        valores = cursor.get('v')
+        if not isinstance(valores, list) or len(valores) != len(orden):
+            raise NotFound(CURSOR_INVALIDO)
+        try:
+            return [model._meta.get_field(campo.lstrip('-').replace('pk', 'id')).to_python(valor) for campo, valor in zip(orden, valores)]
+        except (FieldDoesNotExist, ValidationError):
+            raise NotFound(CURSOR_INVALIDO)
+
+    def _url(self, cursor):
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.codificar_cursor(cursor))
+
+    # --- Paginación ---
+    def _contar(self, request, contar):
+        self.total = contar() if request.query_params.get(self.total_query_param) in ('1', 'true') else None
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        """Página de `queryset` ordenada por `ordering` (o por el order_by que ya trae el queryset)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        orden = completar_orden(ordering or queryset.query.order_by or self.ordering)
+        cursor = self.decodificar_cursor(request)
+        self._contar(request, queryset.count)
+        hacia_atras = bool(cursor and cursor.get('r'))
+        efectivo = [_invertir(campo) for campo in orden] if hacia_atras else orden
+        queryset = queryset.order_by(*efectivo)
+        if cursor:
+            queryset = queryset.filter(_condicion_posterior(efectivo, self._valores_cursor(queryset.model, orden, cursor)))
+        filas = list(queryset[:self.page_size + 1])
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if hacia_atras:
+            filas.reverse()
+        hay_siguiente, hay_anterior = (True, hay_mas) if hacia_atras else (hay_mas, cursor is not None)
+        self.siguiente = self.anterior = None
+        if filas and hay_siguiente:
+            self.siguiente = {'v': [_valor(filas[-1], campo) for campo in orden]}
+        if filas and hay_anterior:
+            self.anterior = {'v': [_valor(filas[0], campo) for campo in orden], 'r': 1}
+        return filas
+
+    def paginate_list(self, elementos, request):
+        """Página de una lista ya ordenada en memoria (p. ej. los ids ordenados por relevancia)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decodificar_cursor(request) or {}
+        posicion = cursor.get('o', 0)
+        if not isinstance(posicion, int) or posicion < 0:
+            raise NotFound(CURSOR_INVALIDO)
+        self._contar(request, lambda: len(elementos))
+        pagina = elementos[posicion:posicion + self.page_size]
+        self.siguiente = {'o': posicion + self.page_size} if posicion + self.page_size < len(elementos) else None
+        self.anterior = {'o': max(posicion - self.page_size, 0)} if posicion > 0 else None
+        return pagina
+
+    def get_paginated_response(self, data):
+        respuesta = OrderedDict()
+        if self.total is not None:
+            respuesta['count'] = self.total
+        respuesta['next'] = self._url(self.siguiente) if self.siguiente else None
+        respuesta['previous'] = self._url(self.anterior) if self.anterior else None
+        respuesta['results'] = data
+        return Response(respuesta)
@@ -0,0 +1,197 @@
+"""
+Rankings de ventas: productos más vendidos (histórico, últimos 7 y 30 días y por categoría) y mejores
+clientes (histórico, 7 y 30 días).
+
+Son tablas ordenadas que se mantienen con cada pedido que cuenta (ver tienda.acumulados), en la misma
+transacción: el histórico de productos es Producto.vendidos_total (índice (vendidos_total, id), que
+también sirve el orden "más vendidos" del catálogo) y los demás tableros son filas de PosicionRanking
+leídas por el índice (tablero, -valor). El top-k es una lectura de k filas más una consulta de nombres.
+Los tableros de ventana se deslizan una vez por día local: los días que salen de la ventana se restan
+con los acumulados diarios de ese día, sin recorrer pedidos. recalcular() reconstruye todo desde los
+acumulados.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q, Sum, Case, When, Value, DecimalField, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from inventario.models import PosicionRanking, VentanaRanking, VentaDiariaProducto, VentaDiariaCliente
+from .models import Producto, Usuario
+from .catalogo import invalidar_catalogo
+import logging
+
+logger = logging.getLogger(__name__)
+
+VENTANAS = (7, 30)
+LOTE = 1000
+TOP_MAXIMO = 100
+
+_DINERO = DecimalField(max_digits=14, decimal_places=2)
+
+
+class RankingError(Exception):
+    pass
+
+
+def tableros():
+    return ['productos', *[f'productos:{dias}' for dias in VENTANAS], 'clientes', *[f'clientes:{dias}' for dias in VENTANAS]]
+
+
+def _sumar(filas):
+    """filas: {(tablero, objeto_id): delta}. Crea las posiciones que faltan y aplica los deltas con un UPDATE."""
+    filas = {llave: delta for llave, delta in filas.items() if delta}
+    if not filas:
+        return
+    PosicionRanking.objects.bulk_create(
+        [PosicionRanking(tablero=tablero, objeto_id=objeto_id) for tablero, objeto_id in filas], ignore_conflicts=True,
+    )
+    condicion = Q()
+    for tablero, objeto_id in filas:
+        condicion |= Q(tablero=tablero, objeto_id=objeto_id)
+    PosicionRanking.objects.filter(condicion).update(valor=F('valor') + Case(
+        *[When(tablero=tablero, objeto_id=objeto_id, then=Value(delta)) for (tablero, objeto_id), delta in filas.items()],
+        default=Value(0), output_field=_DINERO,
+    ))
+
+
+def _ventanas(fecha):
+    """Ventanas (ya deslizadas a hoy) que contienen el día `fecha`."""
+    hoy = deslizar()
+    return [dias for dias in VENTANAS if hoy - timedelta(days=dias - 1) <= fecha <= hoy]
+
+
+def sumar_productos(fecha, unidades):
+    """Ajusta los tableros de productos con {producto_id: unidades} (negativas al anular) vendidas el día `fecha`."""
+    unidades = {pk: cantidad for pk, cantidad in unidades.items() if cantidad}
+    if not unidades:
+        return
+    Producto.objects.filter(pk__in=unidades).update(vendidos_total=F('vendidos_total') + Case(
+        *[When(pk=pk, then=Value(cantidad)) for pk, cantidad in unidades.items()], output_field=IntegerField(),
+    ))
+    # vendidos_total no forma parte de ninguna respuesta cacheada por versión: el orden "más vendidos" de la
+    # búsqueda se refresca con la frescura de tienda.resultados
+    filas = defaultdict(int)
+    for pk, categoria_id in Producto.objects.filter(pk__in=unidades).values_list('pk', 'subcategoria__categoria_id'):
+        filas[(f'categoria:{categoria_id}', pk)] += unidades[pk]
+    for dias in _ventanas(fecha):
+        for pk, cantidad in unidades.items():
+            filas[(f'productos:{dias}', pk)] += cantidad
+    _sumar(filas)
+
+
+def sumar_clientes(fecha, totales):
+    """Ajusta los tableros de clientes con {usuario_id: total} gastado el día `fecha`."""
+    filas = defaultdict(Decimal)
+    for dias in (None, *_ventanas(fecha)):
+        for usuario_id, total in totales.items():
+            filas[('clientes' if dias is None else f'clientes:{dias}', usuario_id)] += total
+    _sumar(filas)
+
+
+# --- Ventanas ---
+def _reconstruir_ventana(dias, hoy):
+    desde = hoy - timedelta(days=dias - 1)
+    PosicionRanking.objects.filter(tablero__in=[f'productos:{dias}', f'clientes:{dias}']).delete()
+    productos = VentaDiariaProducto.objects.filter(fecha__gte=desde, fecha__lte=hoy).order_by().values('producto_id').annotate(total=Sum('unidades'))
+    clientes = VentaDiariaCliente.objects.filter(fecha__gte=desde, fecha__lte=hoy).order_by().values('usuario_id').annotate(total=Sum('total'))
+    PosicionRanking.objects.bulk_create(
+        [PosicionRanking(tablero=f'productos:{dias}', objeto_id=fila['producto_id'], valor=fila['total']) for fila in productos if fila['total']]
+        + [PosicionRanking(tablero=f'clientes:{dias}', objeto_id=fila['usuario_id'], valor=fila['total']) for fila in clientes if fila['total']],
+        batch_size=LOTE,
+    )
+
+
+def _restar_dias(dias, desde, hasta):
+    """Resta del tablero de `dias` días los acumulados de los días [desde, hasta], que salieron de la ventana."""
+    filas = {}
+    for fila in VentaDiariaProducto.objects.filter(fecha__gte=desde, fecha__lte=hasta).order_by().values('producto_id').annotate(total=Sum('unidades')):
+        filas[(f'productos:{dias}', fila['producto_id'])] = -fila['total']
+    for fila in VentaDiariaCliente.objects.filter(fecha__gte=desde, fecha__lte=hasta).order_by().values('usuario_id').annotate(total=Sum('total')):
+        filas[(f'clientes:{dias}', fila['usuario_id'])] = -fila['total']
+    _sumar(filas)
+    PosicionRanking.objects.filter(tablero__in=[f'productos:{dias}', f'clientes:{dias}'], valor__lte=0).delete()
+
+
+def deslizar(hoy=None):
+    """Lleva los tableros de ventana hasta `hoy` (día local); retorna `hoy`. Sin cambio de día es una consulta."""
+    hoy = hoy or timezone.localdate()
+    if VentanaRanking.objects.filter(dias__in=VENTANAS, hasta=hoy).count() == len(VENTANAS):
+        return hoy
+    with transaction.atomic():
+        for dias in VENTANAS:
+            VentanaRanking.objects.get_or_create(dias=dias)
+        # Bloqueo de las ventanas: dos procesos no restan dos veces el mismo día
+        for ventana in VentanaRanking.objects.select_for_update().filter(dias__in=VENTANAS).order_by('dias'):
+            if ventana.hasta == hoy:
+                continue
+            if ventana.hasta is None or ventana.hasta > hoy or (hoy - ventana.hasta).days >= ventana.dias:
+                _reconstruir_ventana(ventana.dias, hoy)
+            else:
+                # La ventana iba de hasta−dias+1 a hasta; ahora empieza en hoy−dias+1
+                _restar_dias(ventana.dias, ventana.hasta - timedelta(days=ventana.dias - 1), hoy - timedelta(days=ventana.dias))
+            ventana.hasta = hoy
+            ventana.save(update_fields=['hasta'])
+    logger.info(f"Rankings de ventana deslizados hasta {hoy}")
+    return hoy
+
+
+# --- Lectura ---
+def top(tablero, limite=10):
+    """Las `limite` primeras posiciones del tablero (k filas por índice más una consulta de nombres)."""
+    limite = min(max(int(limite), 1), TOP_MAXIMO)
+    if tablero == 'productos':
+        filas = list(
+            Producto.objects.filter(vendidos_total__gt=0).order_by('-vendidos_total', '-id')
+            .values_list('pk', 'nombre', 'vendidos_total')[:limite]
+        )
+        return [{'posicion': i, 'producto_id': pk, 'nombre': nombre, 'unidades': unidades} for i, (pk, nombre, unidades) in enumerate(filas, 1)]
+    tipo, _, sufijo = tablero.partition(':')
+    if tablero not in tableros() and not (tipo == 'categoria' and sufijo.isdigit()):
+        raise RankingError(f'Tablero inválido: {tablero}.')
+    if tipo != 'categoria' and sufijo:
+        deslizar()
+    posiciones = list(
+        PosicionRanking.objects.filter(tablero=tablero, valor__gt=0).order_by('-valor', 'objeto_id')
+        .values_list('objeto_id', 'valor')[:limite]
+    )
+    ids = [objeto_id for objeto_id, _ in posiciones]
+    if tipo == 'clientes':
+        usuarios = {fila['pk']: fila for fila in Usuario.objects.filter(pk__in=ids).values('pk', 'numero', 'nombre', 'apellido')}
+        return [
+            {'posicion': i, 'usuario_id': pk, 'numero': usuarios[pk]['numero'], 'nombre': usuarios[pk]['nombre'],
+             'apellido': usuarios[pk]['apellido'], 'total': float(valor)}
+            for i, (pk, valor) in enumerate(posiciones, 1) if pk in usuarios
+        ]
+    nombres = dict(Producto.objects.filter(pk__in=ids).values_list('pk', 'nombre'))
+    return [
+        {'posicion': i, 'producto_id': pk, 'nombre': nombres[pk], 'unidades': int(valor)}
+        for i, (pk, valor) in enumerate(posiciones, 1) if pk in nombres
+    ]
+
+
+# --- Reconstrucción ---
+def recalcular():
+    """Reconstruye todos los tableros desde los acumulados diarios."""
+    hoy = timezone.localdate()
+    with transaction.atomic():
+        vendidos = VentaDiariaProducto.objects.filter(producto=OuterRef('pk')).order_by().values('producto').annotate(total=Sum('unidades')).values('total')
+        Producto.objects.update(vendidos_total=Coalesce(Subquery(vendidos), 0))
+        invalidar_catalogo()
+        PosicionRanking.objects.all().delete()
+        categorias = (
+            VentaDiariaProducto.objects.order_by().values('producto_id', 'producto__subcategoria__categoria_id')
+            .annotate(total=Sum('unidades'))
+        )
+        clientes = VentaDiariaCliente.objects.order_by().values('usuario_id').annotate(total=Sum('total'))
+        PosicionRanking.objects.bulk_create(
+            [PosicionRanking(tablero=f"categoria:{fila['producto__subcategoria__categoria_id']}", objeto_id=fila['producto_id'], valor=fila['total'])
+             for fila in categorias if fila['total']]
+            + [PosicionRanking(tablero='clientes', objeto_id=fila['usuario_id'], valor=fila['total']) for fila in clientes if fila['total']],
+            batch_size=LOTE,
+        )
+        for dias in VENTANAS:
+            _reconstruir_ventana(dias, hoy)
+            VentanaRanking.objects.update_or_create(dias=dias, defaults={'hasta': hoy})
+    logger.info("Rankings de ventas reconstruidos")
@@ -0,0 +1,81 @@
+"""
+Reservas de stock del carrito.
+
+Al agregar o cambiar una línea del carrito se apartan sus unidades durante RESERVA_CARRITO_SEGUNDOS
+(0 desactiva las reservas). El stock disponible de un producto es stock − reservas vigentes de otros
+usuarios, calculado con una subconsulta sobre el índice (producto, expira). Las reservas vencidas dejan
+de contar de inmediato; liberar_vencidas() las borra en lotes desde el worker de procesar_tareas. La
+compra consume las reservas del usuario en la misma transacción.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import ReservaStock
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOTE_BARRIDO = 500
+
+
+def duracion():
+    return getattr(settings, 'RESERVA_CARRITO_SEGUNDOS', 0)
+
+
+def _vigentes(ahora=None):
+    return ReservaStock.objects.filter(expira__gt=ahora or timezone.now())
+
+
+def con_disponible(queryset, usuario_id=None, campo='disponible', prefijo=''):
+    """Anota stock − reservas vigentes de los demás usuarios (las de `usuario_id` no le restan a él)."""
+    reservas = _vigentes().filter(producto=OuterRef(f'{prefijo}pk'))
+    if usuario_id is not None:
+        reservas = reservas.exclude(usuario_id=usuario_id)
+    reservado = Coalesce(Subquery(reservas.order_by().values('producto').annotate(total=Sum('cantidad')).values('total')), 0)
+    return queryset.annotate(**{campo: F(f'{prefijo}stock') - reservado})
+
+
+def reservar(usuario_id, cantidades):
+    """Fija la reserva del usuario para cada producto ({producto_id: cantidad}; 0 la libera) y renueva su vencimiento."""
+    liberar(usuario_id, [pk for pk, cantidad in cantidades.items() if not cantidad])
+    expira = timezone.now() + timedelta(seconds=duracion())
+    nuevas = [
+        ReservaStock(usuario_id=usuario_id, producto_id=pk, cantidad=cantidad, expira=expira)
+        for pk, cantidad in cantidades.items() if cantidad
+    ]
+    if nuevas:
+        ReservaStock.objects.bulk_create(
+            nuevas, update_conflicts=True, unique_fields=['usuario', 'producto'], update_fields=['cantidad', 'expira'],
+        )
+
+
+def liberar(usuario_id, productos=None):
+    """Borra las reservas del usuario (todas o las de `productos`)."""
+    reservas = ReservaStock.objects.filter(usuario_id=usuario_id)
+    if productos is not None:
+        if not productos:
+            return 0
+        reservas = reservas.filter(producto_id__in=productos)
+    return reservas.delete()[0]
+
+
+def con_reservado(queryset, usuario_id, campo='reservado'):
+    """Anota las unidades que el usuario tiene reservadas (vigentes) de cada producto."""
+    propia = _vigentes().filter(producto=OuterRef('pk'), usuario_id=usuario_id).values('cantidad')[:1]
+    return queryset.annotate(**{campo: Coalesce(Subquery(propia), 0)})
+
+
+def liberar_vencidas(lote=LOTE_BARRIDO):
+    """Borra las reservas vencidas en lotes de `lote` filas; retorna cuántas se liberaron."""
+    total = 0
+    ahora = timezone.now()
+    while True:
+        ids = list(ReservaStock.objects.filter(expira__lte=ahora).values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        total += ReservaStock.objects.filter(pk__in=ids, expira__lte=ahora).delete()[0]
+    if total:
+        logger.info(f"{total} reservas de stock vencidas liberadas")
+    return total
@@ -0,0 +1,151 @@
+"""
+Caché de resultados de consultas públicas (búsqueda y destacados) con protección contra estampidas.
+
+Cada entrada guarda el resultado junto con la versión del catálogo y el instante hasta el que es fresca.
+- Entrada fresca: se sirve directamente (acierto).
+- Entrada vencida o de una versión anterior: un solo worker toma el candado y recalcula; los demás
+  sirven el valor anterior mientras tanto (stale-while-revalidate en el servidor).
+- Sin entrada: un solo worker calcula; los demás esperan a que aparezca (hasta ESPERA_MAXIMA) y, si no
+  aparece, calculan por su cuenta.
+Los contadores por clave (aciertos, fallos, obsoletos, recálculos, esperas) se acumulan en memoria y se
+vuelcan a la caché compartida cada cierto número de operaciones.
+"""
+from collections import Counter
+from hashlib import sha1
+from urllib.parse import urlencode
+import threading
+import time
+from django.core.cache import cache
+from .catalogo import version_catalogo
+import logging
+
+logger = logging.getLogger(__name__)
+
+FRESCURA = 60  # segundos que un resultado se sirve sin recalcular
+GRACIA = 300  # segundos adicionales que se conserva para servirlo obsoleto mientras se recalcula
+DURACION_CANDADO = 30
+ESPERA_MAXIMA = 3.0
+INTERVALO_ESPERA = 0.05
+TIPOS = ('aciertos', 'fallos', 'obsoletos', 'recalculos', 'esperas')
+MAX_CLAVES_METRICAS = 500
+VOLCADO_CADA = 100
+
+_pendientes = Counter()
+_descripciones = {}
+_lock = threading.Lock()
+
+
+def clave_canonica(nombre, parametros):
+    """Clave estable a partir de parámetros ya canonizados (dict sin valores vacíos)."""
+    descripcion = f"{nombre}?{urlencode(sorted((k, v) for k, v in parametros.items() if v not in (None, '')))}"
+    return sha1(descripcion.encode()).hexdigest(), descripcion
+
+
+# --- Métricas por clave ---
+def _registrar(huella, descripcion, tipo):
+    with _lock:
+        _pendientes[(huella, tipo)] += 1
+        _descripciones[huella] = descripcion
+        volcar = sum(_pendientes.values()) >= VOLCADO_CADA
+    if volcar:
+        volcar_metricas()
+
+
+def volcar_metricas():
+    with _lock:
+        pendientes, descripciones = dict(_pendientes), dict(_descripciones)
+        _pendientes.clear()
+        _descripciones.clear()
+    if not pendientes:
+        return
+    try:
+        registradas = cache.get('resultados_metricas:claves') or {}
+        nuevas = {h: d for h, d in descripciones.items() if h not in registradas}
+        if nuevas and len(registradas) < MAX_CLAVES_METRICAS:
+            registradas.update(list(nuevas.items())[:MAX_CLAVES_METRICAS - len(registradas)])
+            cache.set('resultados_metricas:claves', registradas, None)
+        for (huella, tipo), cantidad in pendientes.items():
+            if huella not in registradas:
+                continue
+            clave = f'resultados_metricas:{huella}:{tipo}'
+            cache.add(clave, 0, None)
+            cache.incr(clave, cantidad)
+    except Exception as e:
+        logger.warning(f"No se pudieron volcar las métricas de resultados: {e}")
+
+
+def metricas(limite=50):
+    """Claves más consultadas con sus contadores, ordenadas por número de lecturas."""
+    volcar_metricas()
+    registradas = cache.get('resultados_metricas:claves') or {}
+    filas = []
+    for huella, descripcion in registradas.items():
+        valores = cache.get_many([f'resultados_metricas:{huella}:{tipo}' for tipo in TIPOS])
+        fila = {'clave': descripcion}
+        for tipo in TIPOS:
+            fila[tipo] = valores.get(f'resultados_metricas:{huella}:{tipo}', 0)
+        lecturas = fila['aciertos'] + fila['obsoletos'] + fila['fallos']
+        fila['tasa_aciertos'] = round((fila['aciertos'] + fila['obsoletos']) / lecturas, 4) if lecturas else None
+        filas.append(fila)
+    filas.sort(key=lambda f: -(f['aciertos'] + f['obsoletos'] + f['fallos']))
+    return filas[:limite]
+
+
+def reiniciar_metricas():
+    with _lock:
+        _pendientes.clear()
+        _descripciones.clear()
+    registradas = cache.get('resultados_metricas:claves') or {}
+    cache.delete_many([f'resultados_metricas:{h}:{t}' for h in registradas for t in TIPOS] + ['resultados_metricas:claves'])
+
+
+# --- Obtención con coalescencia ---
+def _guardar(clave, valor, version):
+    entrada = {'valor': valor, 'version': version, 'fresco_hasta': time.time() + FRESCURA}
+    cache.set(clave, entrada, FRESCURA + GRACIA)
+
+
+def _recalcular(clave, calcular, version, candado):
+    try:
+        valor = calcular()
+        _guardar(clave, valor, version)
+        return valor
+    finally:
+        cache.delete(candado)
+
+
+def obtener(huella, descripcion, calcular):
+    """
+    Retorna (valor, estado) donde estado es 'HIT', 'STALE' o 'MISS'. `calcular` solo se ejecuta en el
+    worker que obtiene el candado de la clave (o si la espera se agota).
+    """
+    clave = f'resultados:{huella}'
+    candado = f'resultados:candado:{huella}'
+    version = version_catalogo()
+    entrada = cache.get(clave)
+    if entrada is not None:
+        if entrada['version'] == version and entrada['fresco_hasta'] > time.time():
+            _registrar(huella, descripcion, 'aciertos')
+            return entrada['valor'], 'HIT'
+        if not cache.add(candado, 1, DURACION_CANDADO):
+            # Otro worker ya está recalculando: se sirve el valor anterior
+            _registrar(huella, descripcion, 'obsoletos')
+            return entrada['valor'], 'STALE'
+        _registrar(huella, descripcion, 'recalculos')
+        return _recalcular(clave, calcular, version, candado), 'MISS'
+    _registrar(huella, descripcion, 'fallos')
+    if cache.add(candado, 1, DURACION_CANDADO):
+        _registrar(huella, descripcion, 'recalculos')
+        return _recalcular(clave, calcular, version, candado), 'MISS'
+    # Otro worker está calculando la misma clave: se espera su resultado
+    _registrar(huella, descripcion, 'esperas')
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        entrada = cache.get(clave)
+        if entrada is not None:
+            return entrada['valor'], 'HIT'
+    logger.warning(f"Espera agotada para {descripcion}; se calcula sin coalescencia")
+    valor = calcular()
+    _guardar(clave, valor, version)
+    return valor, 'MISS'
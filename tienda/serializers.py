@@ -101,27 +101,35 @@ class ProductoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Producto
-        fields = '__all__'
+        # Los contadores desnormalizados se exponen a través de los campos calculados de abajo
+        exclude = ('likes_total', 'resenas_total', 'calificacion_suma', 'calificacion_cantidad', 'vendidos_total')
         # Agregar los nuevos campos al output
         extra_fields = ['subcategoria_nombre', 'total_reseñas', 'total_likes', 'calificacion_promedio']
+        read_only_fields = ('imagen_principal',)
+
+    def __init__(self, *args, campos=None, **kwargs):
+        # `campos`: conjunto parcial pedido con ?fields= o ?vista= (ver tienda.campos)
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
 
     def get_total_reseñas(self, obj):
-        return obj.comentarios.filter(activo=True).count()
+        return obj.resenas_total
 
     def get_total_likes(self, obj):
-        return obj.likes.count()
+        return obj.likes_total
 
     def get_calificacion_promedio(self, obj):
-        calificaciones = obj.calificaciones.all()
-        if calificaciones.exists():
-            return round(sum([c.valor for c in calificaciones]) / calificaciones.count(), 2)
-        return None
+        if not obj.calificacion_cantidad:
+            return None
+        return round(obj.calificacion_promedio, 2)
 
 
 class CarritoItemProductoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Producto
-        fields = ('id', 'nombre', 'precio', 'imagen', 'stock', 'activo')
+        fields = ('id', 'nombre', 'precio', 'imagen', 'imagen_principal', 'stock', 'activo')
 
 class CarritoItemSerializer(serializers.ModelSerializer):
     producto = CarritoItemProductoSerializer(read_only=True)
@@ -146,16 +154,30 @@ class DetallePedidoSerializer(serializers.ModelSerializer):
         model = DetallePedido
         fields = '__all__'
 
+class ComentarioListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Las respuestas de todos los comentarios se cargan juntas, una consulta por nivel
+        from .foro import respuestas
+        comentarios = list(data.all() if hasattr(data, 'all') else data)
+        self.context.setdefault('respuestas', respuestas([comentario.pk for comentario in comentarios]))
+        return super().to_representation(comentarios)
+
 class ComentarioSerializer(serializers.ModelSerializer):
     usuario_nombre = serializers.CharField(source='usuario.nombre', read_only=True)
     respuestas = serializers.SerializerMethodField()
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
+    likes_count = serializers.IntegerField(source='likes_total', read_only=True)
     class Meta:
         model = Comentario
         fields = ['id', 'usuario', 'usuario_nombre', 'producto', 'texto', 'creado', 'activo', 'comentario_padre', 'respuestas', 'likes_count']
+        list_serializer_class = ComentarioListSerializer
 
     def get_respuestas(self, obj):
-        return ComentarioSerializer(obj.respuestas.filter(activo=True), many=True).data
+        # Con many=True las trae el contexto (ComentarioListSerializer); un comentario suelto las carga solo
+        cargadas = self.context.get('respuestas')
+        if cargadas is None or obj.pk not in cargadas:
+            from .foro import respuestas
+            cargadas = respuestas([obj.pk])
+        return cargadas[obj.pk]
 
 class LikeComentarioSerializer(serializers.ModelSerializer):
     class Meta:
@@ -202,4 +224,7 @@ class CategoriaPublicaSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre', 'descripcion', 'subcategorias_count']
 
     def get_subcategorias_count(self, obj):
+        # Las vistas anotan el conteo en la misma consulta (subcategorias_activas)
+        if hasattr(obj, 'subcategorias_activas'):
+            return obj.subcategorias_activas
         return obj.subcategorias.filter(activa=True).count()
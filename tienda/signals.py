@@ -0,0 +1,126 @@
+"""
+Señales de la tienda: invalidación de la versión del catálogo y mantenimiento de los índices de
+búsqueda y de sugerencias, de la imagen principal precalculada, de la versión de la ficha de cada producto
+del saldo inicial de stock en el libro de inventario y de los acumulados diarios de ventas.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Categoria, Subcategoria, Producto, ImagenProducto, Comentario, LikeComentario, Calificacion, Pedido, DetallePedido
+from .catalogo import invalidar_catalogo, invalidar_producto
+from . import busqueda, sugerencias, movimientos, acumulados
+from .campos import actualizar_imagen_principal
+
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender=Subcategoria)
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=ImagenProducto)
+def catalogo_modificado(sender, **kwargs):
+    invalidar_catalogo()
+
+@receiver([post_save, post_delete], sender=ImagenProducto)
+def imagen_principal(sender, instance, raw=False, **kwargs):
+    if not raw:
+        actualizar_imagen_principal([instance.producto_id])
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busqueda.indexar_productos([instance.pk])
+
+@receiver(post_save, sender=Producto)
+def stock_inicial(sender, instance, created, raw=False, **kwargs):
+    # Después de crearlo, el stock solo cambia por movimientos del libro
+    if created and not raw:
+        movimientos.ajuste(instance.pk, instance.stock, nota='Stock inicial', actualizar_stock=False)
+
+@receiver(post_save, sender=Subcategoria)
+def indexar_subcategoria(sender, instance, raw=False, created=False, **kwargs):
+    # Los nombres de subcategoría y categoría forman parte del documento de cada producto
+    if not raw and not created:
+        busqueda.indexar_productos(instance.productos.values('pk'))
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        busqueda.indexar_productos(Producto.objects.filter(subcategoria__categoria=instance).values('pk'))
+
+@receiver(post_save, sender=Producto)
+def sugerencias_producto(sender, instance, raw=False, **kwargs):
+    if not raw:
+        activo = instance.activo and instance.stock > 0
+        transaction.on_commit(lambda: sugerencias.registrar_cambio('producto', instance.pk, instance.nombre, activo))
+
+@receiver(post_save, sender=Subcategoria)
+def sugerencias_subcategoria(sender, instance, raw=False, **kwargs):
+    if not raw:
+        activa = instance.activa and instance.categoria.activa
+        transaction.on_commit(lambda: sugerencias.registrar_cambio('subcategoria', instance.pk, instance.nombre, activa))
+
+@receiver(post_save, sender=Categoria)
+def sugerencias_categoria(sender, instance, raw=False, created=False, **kwargs):
+    # Activar o desactivar una categoría afecta a sus subcategorías: se reconstruye el índice completo
+    if not raw:
+        transaction.on_commit(lambda: sugerencias.registrar_cambio(
+            'categoria', instance.pk, instance.nombre, instance.activa, completo=not created
+        ))
+
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Subcategoria)
+@receiver(post_delete, sender=Producto)
+def sugerencias_eliminado(sender, instance, **kwargs):
+    tipo = {Categoria: 'categoria', Subcategoria: 'subcategoria', Producto: 'producto'}[sender]
+    pk = instance.pk
+    transaction.on_commit(lambda: sugerencias.registrar_cambio(tipo, pk, completo=sender is not Producto))
+
+@receiver([post_save, post_delete], sender=Comentario)
+@receiver([post_save, post_delete], sender=Calificacion)
+def ficha_modificada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidar_producto(instance.producto_id)
+
+@receiver([post_save, post_delete], sender=LikeComentario)
+def ficha_like_comentario(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidar_producto(instance.comentario.producto_id)
+
+# Acumulados de ventas: se compara el pedido (o la línea) antes y después de guardarlo
+CAMPOS_ACUMULADOS_PEDIDO = {'usuario', 'estado', 'total', 'creado', 'activo'}
+
+def _afecta_acumulados(update_fields):
+    return update_fields is None or bool(CAMPOS_ACUMULADOS_PEDIDO & set(update_fields))
+
+@receiver(pre_save, sender=Pedido)
+def pedido_antes(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and instance.pk and _afecta_acumulados(update_fields):
+        instance._acumulado_anterior = acumulados.leer_pedido(instance.pk)
+
+@receiver(post_save, sender=Pedido)
+def pedido_acumulados(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and (created or _afecta_acumulados(update_fields)):
+        anterior = None if created else getattr(instance, '_acumulado_anterior', None)
+        acumulados.pedido_cambiado(instance.pk, anterior, acumulados.leer_pedido(instance.pk))
+
+@receiver(pre_delete, sender=Pedido)
+def pedido_borrado(sender, instance, **kwargs):
+    acumulados.pedido_borrado(acumulados.leer_pedido(instance.pk))
+
+def _linea(detalle):
+    return (detalle.pedido_id, detalle.producto_id, detalle.cantidad, detalle.precio_unitario)
+
+@receiver(pre_save, sender=DetallePedido)
+def detalle_antes(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._acumulado_anterior = DetallePedido.objects.filter(pk=instance.pk).values_list(
+            'pedido_id', 'producto_id', 'cantidad', 'precio_unitario',
+        ).first()
+
+@receiver(post_save, sender=DetallePedido)
+def detalle_acumulados(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        anterior = None if created else getattr(instance, '_acumulado_anterior', None)
+        acumulados.linea_cambiada(anterior, _linea(instance))
+
+@receiver(post_delete, sender=DetallePedido)
+def detalle_borrado(sender, instance, **kwargs):
+    acumulados.linea_cambiada(_linea(instance), None)
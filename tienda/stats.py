@@ -1,44 +1,58 @@
-from django.db.models import Sum, Count, F
-from tienda.models import Pedido, DetallePedido, Producto, Usuario
-from datetime import datetime, timedelta
+"""
+Estadísticas de ventas para los paneles de cliente y admin.
+
+Se leen de los acumulados diarios (ver tienda.acumulados) y de los rankings (ver tienda.rankings), no
+de Pedido/DetallePedido: cada consulta recorre a lo sumo una fila por día del período pedido o las k
+primeras posiciones de un tablero, sin importar cuántos pedidos haya en el historial.
+"""
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from inventario.models import EstadisticaVenta, VentaDiariaCliente
+from tienda.models import Pedido
+from tienda import analitica, rankings
+
+DIAS_RANKING = 30
+
 
 # Estadísticas para clientes
 
-def historial_compras(usuario):
-    pedidos = Pedido.objects.filter(usuario=usuario).order_by('-fecha')
-    total_gastado = pedidos.aggregate(total=Sum('total'))['total'] or 0
-    cantidad_pedidos = pedidos.count()
+def historial_compras(usuario, ultimos=10):
+    totales = VentaDiariaCliente.objects.filter(usuario=usuario).aggregate(pedidos=Sum('pedidos'), total=Sum('total'))
+    pedidos = Pedido.objects.filter(usuario=usuario).select_related('estado').order_by('-creado')[:ultimos]
     return {
-        'cantidad_pedidos': cantidad_pedidos,
-        'total_gastado': float(total_gastado),
+        'cantidad_pedidos': totales['pedidos'] or 0,
+        'total_gastado': float(totales['total'] or 0),
         'historial': [
             {
                 'id': p.id,
-                'fecha': p.fecha,
+                'fecha': timezone.localtime(p.creado).isoformat(),
                 'total': float(p.total),
-                'estado': p.estado
+                'estado': p.estado.nombre
             } for p in pedidos
         ]
     }
 
 # Estadísticas para admin
 
+def resumen_dia(fecha=None):
+    fecha = fecha or timezone.localdate()
+    fila = EstadisticaVenta.objects.filter(fecha=fecha).first()
+    return {
+        'fecha': str(fecha),
+        'pedidos': fila.total_ventas if fila else 0,
+        'ingresos': float(fila.total_ingresos) if fila else 0.0,
+        'unidades': fila.unidades if fila else 0,
+    }
+
 def ventas_por_dia(ultimos_n=30):
-    hoy = datetime.now().date()
-    dias = [(hoy - timedelta(days=i)) for i in range(ultimos_n)][::-1]
-    ventas = Pedido.objects.filter(fecha__date__gte=dias[0], estado='completado')
-    datos = {str(d): 0 for d in dias}
-    for v in ventas:
-        d = v.fecha.date()
-        datos[str(d)] += float(v.total)
-    return datos
-
-def productos_mas_vendidos(top_n=5):
-    qs = DetallePedido.objects.values('producto__nombre').annotate(
-        total_vendidos=Sum('cantidad')).order_by('-total_vendidos')[:top_n]
-    return list(qs)
-
-def mejores_clientes(top_n=5):
-    qs = Pedido.objects.values('usuario__numero', 'usuario__nombre', 'usuario__apellido').annotate(
-        total_gastado=Sum('total'), cantidad=Count('id')).order_by('-total_gastado')[:top_n]
-    return list(qs)
+    """Ingresos de cada uno de los últimos `ultimos_n` días locales (los días sin ventas en 0)."""
+    hoy = timezone.localdate()
+    return {fila['inicio']: float(fila['ingresos']) for fila in analitica.serie(hoy - timedelta(days=ultimos_n - 1), hoy)}
+
+def productos_mas_vendidos(top_n=5, dias=DIAS_RANKING):
+    """Top de productos por unidades de los últimos `dias` (7 o 30) o histórico con dias=None."""
+    return rankings.top('productos' if dias is None else f'productos:{dias}', top_n)
+
+def mejores_clientes(top_n=5, dias=DIAS_RANKING):
+    return rankings.top('clientes' if dias is None else f'clientes:{dias}', top_n)
@@ -0,0 +1,226 @@
+"""
+Índice de sugerencias en memoria para el autocompletado del buscador.
+
+Cada worker mantiene un índice de prefijos (lista ordenada de palabras normalizadas + bisect) y de
+trigramas sobre los nombres de productos, subcategorías y categorías activas. Las búsquedas toleran
+errores de tipeo pequeños (una letra de más, de menos, cambiada o dos letras transpuestas; hasta dos
+errores en palabras largas).
+
+El índice se actualiza de forma incremental en el worker que escribe (ver tienda.signals) y se
+reconstruye en los demás cuando cambia la versión compartida `sugerencias:version`.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+import threading
+import time
+from django.core.cache import cache
+from .busqueda import palabras
+from .models import Producto, Subcategoria, Categoria
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'sugerencias:version'
+INTERVALO_MINIMO_RECONSTRUCCION = 5  # segundos
+ORDEN_TIPOS = {'categoria': 0, 'subcategoria': 1, 'producto': 2}
+
+
+def distancia_edicion(a, b, maximo):
+    """
+    Distancia de edición acotada (Damerau-Levenshtein restringida: la transposición de dos letras
+    cuenta como un solo error). Retorna maximo + 1 si se supera el máximo.
+    """
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    previa, anterior = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        actual = [i]
+        for j, cb in enumerate(b, start=1):
+            valor = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                valor = min(valor, previa[j - 2] + 1)
+            actual.append(valor)
+        if min(actual) > maximo:
+            return maximo + 1
+        previa, anterior = anterior, actual
+    return anterior[-1]
+
+
+def tolerancia(palabra):
+    if len(palabra) >= 7:
+        return 2
+    if len(palabra) >= 4:
+        return 1
+    return 0
+
+
+def trigramas(palabra):
+    marcada = f'^{palabra}$'
+    return {marcada[i:i + 3] for i in range(len(marcada) - 2)}
+
+
+class IndiceSugerencias:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.construido_en = 0
+        self._vaciar()
+
+    def _vaciar(self):
+        self.entradas = {}
+        self.palabras_ordenadas = []
+        self.por_palabra = defaultdict(set)
+        self.por_trigrama = defaultdict(set)
+
+    # --- Mantenimiento ---
+    def construir(self, version=None):
+        with self.lock:
+            self._vaciar()
+            for pk, nombre in Categoria.objects.filter(activa=True).values_list('pk', 'nombre'):
+                self._agregar('categoria', pk, nombre)
+            for pk, nombre in Subcategoria.objects.filter(activa=True, categoria__activa=True).values_list('pk', 'nombre'):
+                self._agregar('subcategoria', pk, nombre)
+            for pk, nombre in Producto.objects.filter(activo=True, stock__gt=0).values_list('pk', 'nombre'):
+                self._agregar('producto', pk, nombre)
+            self.version = version
+            self.construido_en = time.monotonic()
+        logger.info(f"Índice de sugerencias construido con {len(self.entradas)} entradas")
+
+    def _agregar(self, tipo, pk, nombre):
+        clave = (tipo, pk)
+        tokens = list(dict.fromkeys(palabras(nombre)))
+        self.entradas[clave] = {'tipo': tipo, 'id': pk, 'nombre': nombre, 'palabras': tokens}
+        for token in tokens:
+            if token not in self.por_palabra:
+                self.palabras_ordenadas.insert(bisect_left(self.palabras_ordenadas, token), token)
+                for trigrama in trigramas(token):
+                    self.por_trigrama[trigrama].add(token)
+            self.por_palabra[token].add(clave)
+
+    def _eliminar(self, tipo, pk):
+        entrada = self.entradas.pop((tipo, pk), None)
+        if not entrada:
+            return
+        for token in entrada['palabras']:
+            claves = self.por_palabra[token]
+            claves.discard((tipo, pk))
+            if not claves:
+                del self.por_palabra[token]
+                del self.palabras_ordenadas[bisect_left(self.palabras_ordenadas, token)]
+                for trigrama in trigramas(token):
+                    self.por_trigrama[trigrama].discard(token)
+
+    def actualizar(self, tipo, pk, nombre, activo):
+        with self.lock:
+            self._eliminar(tipo, pk)
+            if activo:
+                self._agregar(tipo, pk, nombre)
+
+    def eliminar(self, tipo, pk):
+        with self.lock:
+            self._eliminar(tipo, pk)
+
+    # --- Consulta ---
+    def _por_prefijo(self, prefijo):
+        inicio = bisect_left(self.palabras_ordenadas, prefijo)
+        resultado = set()
+        for token in self.palabras_ordenadas[inicio:]:
+            if not token.startswith(prefijo):
+                break
+            resultado.add(token)
+        return resultado
+
+    def _aproximadas(self, palabra, prefijo):
+        """Palabras del índice a distancia tolerable de `palabra` (comparando solo el prefijo si `prefijo`)."""
+        maximo = tolerancia(palabra)
+        if not maximo:
+            return {}
+        candidatas = set()
+        for trigrama in trigramas(palabra):
+            candidatas |= self.por_trigrama.get(trigrama, set())
+        resultado = {}
+        for token in candidatas:
+            comparables = [token[:len(palabra) + d] for d in (-1, 0, 1)] if prefijo else [token]
+            distancia = min(distancia_edicion(palabra, c, maximo) for c in comparables)
+            if distancia <= maximo:
+                resultado[token] = distancia
+        return resultado
+
+    def _coincidencias(self, palabra, prefijo):
+        """Entradas que contienen la palabra (exacta/prefijo) con su penalización por errores de tipeo."""
+        tokens = self._por_prefijo(palabra) if prefijo else ({palabra} if palabra in self.por_palabra else set())
+        penalizacion = {token: 0 for token in tokens}
+        if not tokens:
+            penalizacion = self._aproximadas(palabra, prefijo)
+        entradas = {}
+        for token, distancia in penalizacion.items():
+            for clave in self.por_palabra.get(token, ()):
+                entradas[clave] = min(distancia, entradas.get(clave, distancia))
+        return entradas
+
+    def sugerir(self, q, limite=10):
+        consulta = palabras(q)
+        if not consulta:
+            return []
+        with self.lock:
+            puntajes = None
+            for posicion, palabra in enumerate(consulta):
+                coincidencias = self._coincidencias(palabra, prefijo=posicion == len(consulta) - 1)
+                if puntajes is None:
+                    puntajes = coincidencias
+                else:
+                    puntajes = {clave: puntajes[clave] + d for clave, d in coincidencias.items() if clave in puntajes}
+                if not puntajes:
+                    return []
+            ordenadas = sorted(
+                puntajes,
+                key=lambda clave: (puntajes[clave], ORDEN_TIPOS[clave[0]], len(self.entradas[clave]['nombre']), self.entradas[clave]['nombre']),
+            )
+            return [
+                {'tipo': self.entradas[clave]['tipo'], 'id': self.entradas[clave]['id'], 'nombre': self.entradas[clave]['nombre']}
+                for clave in ordenadas[:limite]
+            ]
+
+
+_indice = IndiceSugerencias()
+
+
+def version_sugerencias():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, int(time.time() * 1000), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def obtener_indice():
+    """Índice del worker, reconstruido si otro worker cambió el catálogo (como máximo cada pocos segundos)."""
+    version = version_sugerencias()
+    if _indice.version != version:
+        with _indice.lock:
+            desactualizado = _indice.version != version
+            reciente = time.monotonic() - _indice.construido_en < INTERVALO_MINIMO_RECONSTRUCCION
+            if desactualizado and (_indice.version is None or not reciente):
+                _indice.construir(version)
+    return _indice
+
+
+def registrar_cambio(tipo, pk, nombre=None, activo=False, completo=False):
+    """
+    Aplica un cambio de catálogo ya confirmado: incrementa la versión compartida y, si este worker
+    tenía el índice al día, lo actualiza en memoria sin reconstruirlo. Con `completo` solo se incrementa
+    la versión y el índice se reconstruye en la próxima consulta.
+    """
+    try:
+        version = cache.incr(CLAVE_VERSION)
+    except ValueError:
+        version = None
+    with _indice.lock:
+        if _indice.version is None:
+            return
+        if completo:
+            _indice.construido_en = 0
+            return
+        _indice.actualizar(tipo, pk, nombre, activo)
+        if version is not None and _indice.version == version - 1:
+            _indice.version = version
@@ -0,0 +1,116 @@
+"""
+Cola de tareas en segundo plano respaldada por la base de datos.
+
+`encolar(funcion, **argumentos)` inserta una fila Tarea en la transacción en curso, así la tarea solo
+existe si la escritura que la originó se confirma. El worker (`python manage.py procesar_tareas`)
+reclama tareas vencidas con un UPDATE condicional, importa la función por su ruta y la ejecuta; si
+falla se reintenta con espera exponencial hasta `max_intentos` y luego queda como 'fallida'.
+
+Las funciones se pueden decorar con `@tarea(max_intentos=..., al_fallar=...)`; `al_fallar` recibe los
+mismos argumentos cuando se agotan los reintentos.
+"""
+from datetime import timedelta
+import traceback
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Tarea
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 5
+ESPERA_BASE = 10  # segundos; se duplica en cada reintento
+DURACION_RESERVA = 300  # segundos que una tarea queda reservada antes de considerarse abandonada
+
+
+def tarea(max_intentos=MAX_INTENTOS, al_fallar=None):
+    """Declara opciones de reintento de una función que se ejecuta desde la cola."""
+    def decorador(funcion):
+        funcion.max_intentos = max_intentos
+        funcion.al_fallar = al_fallar
+        return funcion
+    return decorador
+
+
+def _ruta(funcion):
+    return funcion if isinstance(funcion, str) else f'{funcion.__module__}.{funcion.__qualname__}'
+
+
+def encolar(funcion, ejecutar_en=None, **argumentos):
+    """Agrega una tarea a la cola; los argumentos deben ser serializables a JSON."""
+    max_intentos = getattr(funcion, 'max_intentos', MAX_INTENTOS)
+    return Tarea.objects.create(
+        funcion=_ruta(funcion),
+        argumentos=argumentos,
+        max_intentos=max_intentos,
+        ejecutar_en=ejecutar_en or timezone.now(),
+    )
+
+
+def _reclamar(lote):
+    """Reserva hasta `lote` tareas vencidas; el UPDATE condicional evita que dos workers tomen la misma."""
+    ahora = timezone.now()
+    disponibles = Q(estado='pendiente', ejecutar_en__lte=ahora) | Q(estado='en_proceso', bloqueada_hasta__lt=ahora)
+    candidatas = Tarea.objects.filter(disponibles).order_by('ejecutar_en', 'id').values_list('id', 'estado', 'bloqueada_hasta')[:lote]
+    reclamadas = []
+    for tarea_id, estado, bloqueada_hasta in candidatas:
+        tomada = Tarea.objects.filter(pk=tarea_id, estado=estado, bloqueada_hasta=bloqueada_hasta).update(
+            estado='en_proceso',
+            bloqueada_hasta=ahora + timedelta(seconds=DURACION_RESERVA),
+            intentos=F('intentos') + 1,
+        )
+        if tomada:
+            reclamadas.append(tarea_id)
+    return list(Tarea.objects.filter(pk__in=reclamadas).order_by('ejecutar_en', 'id'))
+
+
+def ejecutar(tarea_obj):
+    """Ejecuta una tarea ya reservada y registra el resultado. Retorna True si terminó bien."""
+    try:
+        funcion = import_string(tarea_obj.funcion)
+        with transaction.atomic():
+            funcion(**tarea_obj.argumentos)
+    except Exception as e:
+        error = ''.join(traceback.format_exception(type(e), e, e.__traceback__))[-4000:]
+        if tarea_obj.intentos >= tarea_obj.max_intentos:
+            Tarea.objects.filter(pk=tarea_obj.pk).update(
+                estado='fallida', ultimo_error=error, bloqueada_hasta=None, finalizada=timezone.now()
+            )
+            logger.error(f"Tarea #{tarea_obj.pk} {tarea_obj.funcion} falló definitivamente tras {tarea_obj.intentos} intentos: {e}")
+            _notificar_fallo(tarea_obj)
+        else:
+            espera = ESPERA_BASE * 2 ** (tarea_obj.intentos - 1)
+            Tarea.objects.filter(pk=tarea_obj.pk).update(
+                estado='pendiente', ultimo_error=error, bloqueada_hasta=None,
+                ejecutar_en=timezone.now() + timedelta(seconds=espera),
+            )
+            logger.warning(f"Tarea #{tarea_obj.pk} {tarea_obj.funcion} falló (intento {tarea_obj.intentos}), reintento en {espera}s: {e}")
+        return False
+    Tarea.objects.filter(pk=tarea_obj.pk).update(estado='completada', bloqueada_hasta=None, finalizada=timezone.now())
+    logger.info(f"Tarea #{tarea_obj.pk} {tarea_obj.funcion} completada")
+    return True
+
+
+def _notificar_fallo(tarea_obj):
+    try:
+        al_fallar = getattr(import_string(tarea_obj.funcion), 'al_fallar', None)
+        if al_fallar:
+            al_fallar(**tarea_obj.argumentos)
+    except Exception as e:
+        logger.error(f"Error en al_fallar de la tarea #{tarea_obj.pk}: {e}")
+
+
+def procesar_pendientes(lote=10):
+    """Reserva y ejecuta un lote de tareas vencidas. Retorna cuántas se ejecutaron."""
+    tareas = _reclamar(lote)
+    for tarea_obj in tareas:
+        ejecutar(tarea_obj)
+    return len(tareas)
+
+
+def purgar_completadas(dias=7):
+    limite = timezone.now() - timedelta(days=dias)
+    borradas, _ = Tarea.objects.filter(estado='completada', finalizada__lt=limite).delete()
+    return borradas
@@ -1,3 +1,1582 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.models import Sum
+from django.forms import modelform_factory
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .models import (
+    Usuario, Categoria, Subcategoria, Producto, ImagenProducto, Comentario, Calificacion, Like, HistorialAccion,
+    Carrito, CarritoItem, Pedido, DetallePedido, EstadoVenta, Notificacion, Tarea, LikeComentario, LikePendiente, ReservaStock,
+    Compra, DetalleCompra, MovimientoInventario,
+)
+from .admin import ProductoAdmin
+from .cache_backends import SQLiteCache
+from .serializers import ProductoSerializer, NotificacionSerializer, HistorialAccionSerializer, ComentarioSerializer
+from .busqueda import tokenizar
+from . import sugerencias
+from .catalogo import arbol_categorias, version_catalogo, version_producto
+from .facetas import histograma_precios
+from . import resultados, lectura, likes, reservas, movimientos, analitica, rankings
+from .checkout import procesar_compra, CompraError
+from .tareas import tarea, encolar, procesar_pendientes
+from .utils_pdf import almacenar_factura
+from .contadores import recalcular_contadores, verificar_contadores
+from inventario.models import EstadisticaVenta, VentaDiariaProducto, VentaDiariaCliente, PosicionRanking
 
-# Create your tests here.
+
+# Hash rápido para que la creación de usuarios no domine el tiempo de las pruebas
+HASH_RAPIDO = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+
+def crear_usuario(numero, **extra):
+    return Usuario.objects.create_user(numero=numero, nombre='Cliente', apellido='Prueba', password='clave123', **extra)
+
+
+@HASH_RAPIDO
+class CatalogoBaseTestCase(TestCase):
+    """Datos mínimos de catálogo compartidos por las pruebas de la tienda."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.categoria = Categoria.objects.create(nombre='Maquillaje')
+        self.subcategoria = Subcategoria.objects.create(categoria=self.categoria, nombre='Labios')
+        self.usuarios = [crear_usuario(f'30000000{i:02d}') for i in range(3)]
+
+    def crear_productos(self, cantidad, inicio=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self._crear_productos(cantidad, inicio)
+
+    def _crear_productos(self, cantidad, inicio):
+        productos = []
+        for i in range(inicio, inicio + cantidad):
+            producto = Producto.objects.create(
+                subcategoria=self.subcategoria, nombre=f'Labial {i}', descripcion='Labial mate', precio='29.90', stock=10
+            )
+            ImagenProducto.objects.create(producto=producto, url_imagen=f'https://cdn.example.com/{i}.jpg', es_principal=True)
+            ImagenProducto.objects.create(producto=producto, url_imagen=f'https://cdn.example.com/{i}-b.jpg', orden=1)
+            for valor, usuario in enumerate(self.usuarios, start=3):
+                Comentario.objects.create(usuario=usuario, producto=producto, texto='Muy bueno')
+                Calificacion.objects.create(usuario=usuario, producto=producto, valor=valor)
+                Like.objects.create(usuario=usuario, producto=producto)
+            productos.append(producto)
+        recalcular_contadores([producto.pk for producto in productos])
+        return productos
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(contexto.captured_queries), response
+
+
+class CatalogoConsultasTests(CatalogoBaseTestCase):
+    """El costo en consultas de los listados del catálogo no debe crecer con el tamaño de la página."""
+
+    def assertConsultasConstantes(self, url):
+        self.crear_productos(2)
+        pocas, _ = self.contar_consultas(url)
+        self.crear_productos(48, inicio=2)
+        muchas, response = self.contar_consultas(url)
+        self.assertEqual(pocas, muchas)
+        return response
+
+    def test_all_productos_consultas_constantes(self):
+        response = self.assertConsultasConstantes('/api/cliente/productos/')
+        self.assertEqual(len(response.json()), 50)
+
+    def test_busqueda_consultas_constantes(self):
+        response = self.assertConsultasConstantes('/api/cliente/buscar/?q=Labial&page_size=50')
+        self.assertEqual(len(response.json()['results']), 50)
+
+    def test_admin_productos_consultas_constantes(self):
+        admin = Usuario.objects.create_superuser(numero='3999999999', nombre='Admin', apellido='Tienda', password='clave123')
+        self.client.force_authenticate(admin)
+        response = self.assertConsultasConstantes('/api/admin/productos/')
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_estadisticas_en_listado(self):
+        self.crear_productos(1)
+        _, response = self.contar_consultas('/api/cliente/productos/')
+        producto = response.json()[0]
+        self.assertEqual(producto['total_reseñas'], 3)
+        self.assertEqual(producto['total_likes'], 3)
+        self.assertEqual(producto['calificacion_promedio'], 4.0)
+        self.assertEqual(len(producto['imagenes']), 2)
+
+
+class ContadoresProductoTests(CatalogoBaseTestCase):
+    """Las escrituras de likes, calificaciones y comentarios mantienen los contadores de Producto."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        self.usuario = crear_usuario('3111111111')
+        self.client.force_authenticate(self.usuario)
+
+    def refrescar(self):
+        self.producto.refresh_from_db()
+        return self.producto
+
+    def test_like_crear_y_eliminar(self):
+        response = self.client.post('/api/cliente/likes/', {'usuario': self.usuario.pk, 'producto': self.producto.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.refrescar().likes_total, 4)
+        self.client.delete(f"/api/cliente/likes/{response.json()['id']}/")
+        self.assertEqual(self.refrescar().likes_total, 3)
+
+    def test_calificacion_crear_editar_eliminar(self):
+        response = self.client.post('/api/cliente/calificaciones/', {'usuario': self.usuario.pk, 'producto': self.producto.pk, 'valor': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        producto = self.refrescar()
+        self.assertEqual((producto.calificacion_suma, producto.calificacion_cantidad), (13, 4))
+        self.assertAlmostEqual(producto.calificacion_promedio, 3.25)
+        self.client.patch(f"/api/cliente/calificaciones/{response.json()['id']}/", {'valor': 5}, format='json')
+        self.assertAlmostEqual(self.refrescar().calificacion_promedio, 4.25)
+        self.client.delete(f"/api/cliente/calificaciones/{response.json()['id']}/")
+        self.assertAlmostEqual(self.refrescar().calificacion_promedio, 4.0)
+
+    def test_comentario_foro_crear_y_desactivar(self):
+        response = self.client.post('/api/cliente/comentarios/foro/', {'producto': self.producto.pk, 'texto': 'Me encanta'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.refrescar().resenas_total, 4)
+        self.client.delete('/api/cliente/comentarios/foro/', {'id': response.json()['id']}, format='json')
+        self.assertEqual(self.refrescar().resenas_total, 3)
+        self.assertEqual(verificar_contadores(), [])
+
+    def test_contador_desviado_no_baja_de_cero(self):
+        response = self.client.post('/api/cliente/likes/', {'usuario': self.usuario.pk, 'producto': self.producto.pk}, format='json')
+        Producto.objects.filter(pk=self.producto.pk).update(likes_total=0)
+        self.assertEqual(self.client.delete(f"/api/cliente/likes/{response.json()['id']}/").status_code, 204)
+        self.assertEqual(self.refrescar().likes_total, 0)
+        recalcular_contadores([self.producto.pk])
+        self.assertEqual(self.refrescar().likes_total, 3)
+
+    def test_verificar_y_recalcular(self):
+        Producto.objects.filter(pk=self.producto.pk).update(likes_total=99)
+        inconsistentes = verificar_contadores()
+        self.assertEqual(inconsistentes[0]['diferencias'], {'likes_total': {'actual': 99, 'esperado': 3}})
+        recalcular_contadores()
+        self.assertEqual(verificar_contadores(), [])
+
+
+class CacheCatalogoTests(CatalogoBaseTestCase):
+    """Respuestas públicas del catálogo servidas por versión con ETag estable y 304."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(2)[0]
+
+    def test_etag_estable_y_304_sin_consultas(self):
+        primera = self.client.get('/api/cliente/productos/')
+        segunda = self.client.get('/api/cliente/productos/')
+        self.assertEqual(primera['ETag'], segunda['ETag'])
+        self.assertEqual(primera.content, segunda.content)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cliente/productos/', HTTP_IF_NONE_MATCH=f'W/{primera["ETag"]}')
+        self.assertEqual(response.status_code, 304)
+
+    def test_respuesta_cacheada_sin_consultas(self):
+        self.client.get('/api/cliente/categorias/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cliente/categorias/')
+        self.assertEqual(response.json()[0]['nombre'], 'Maquillaje')
+
+    def test_escritura_invalida_version(self):
+        antes = self.client.get('/api/cliente/productos/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = 'Labial renombrado'
+            self.producto.save()
+        despues = self.client.get('/api/cliente/productos/', HTTP_IF_NONE_MATCH=antes['ETag'])
+        self.assertEqual(despues.status_code, 200)
+        self.assertNotEqual(antes['ETag'], despues['ETag'])
+        self.assertIn('Labial renombrado', [p['nombre'] for p in despues.json()])
+
+    def test_contadores_invalidan_solo_su_producto(self):
+        catalogo, producto = version_catalogo(), version_producto(self.producto.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            likes.like_producto(crear_usuario('3211111111').id, self.producto.pk)
+        self.assertEqual(version_catalogo(), catalogo)
+        self.assertNotEqual(version_producto(self.producto.pk), producto)
+
+    def test_parametros_forman_parte_de_la_clave(self):
+        self.assertNotEqual(
+            self.client.get('/api/cliente/productos/?a=1')['ETag'],
+            self.client.get('/api/cliente/productos/?a=2')['ETag'],
+        )
+
+
+@HASH_RAPIDO
+class CacheCompartidaTests(TestCase):
+    """Backend SQLite compartido: TTL por espacio de nombres, operaciones atómicas y métricas."""
+
+    def setUp(self):
+        cache.clear()
+        backend = caches['default']
+        if hasattr(backend, 'reiniciar_metricas'):
+            backend.reiniciar_metricas()
+
+    def test_backend_compartido_por_defecto(self):
+        self.assertIsInstance(caches['default'], SQLiteCache)
+
+    def test_ttl_por_espacio_de_nombres(self):
+        backend = caches['default']
+        self.assertEqual(backend._timeout_para('recuperar:3000000000', DEFAULT_TIMEOUT), 300)
+        self.assertEqual(backend._timeout_para('otro:clave', DEFAULT_TIMEOUT), DEFAULT_TIMEOUT)
+        self.assertEqual(backend._timeout_para('recuperar:3000000000', 10), 10)
+
+    def test_add_incr_y_expiracion(self):
+        self.assertTrue(cache.add('prueba:contador', 1))
+        self.assertFalse(cache.add('prueba:contador', 5))
+        self.assertEqual(cache.incr('prueba:contador', 4), 5)
+        cache.set('prueba:objeto', {'a': [1, 2]}, timeout=-1)
+        self.assertIsNone(cache.get('prueba:objeto'))
+        self.assertTrue(cache.add('prueba:objeto', 'nuevo'))
+        with self.assertRaises(ValueError):
+            cache.incr('prueba:inexistente')
+
+    def test_visible_desde_otra_instancia(self):
+        """Otro worker (otra instancia/conexión) ve las mismas claves, como los códigos de recuperación."""
+        cache.set('recuperar:3000000001', '123456')
+        otra = SQLiteCache(settings.CACHES['default']['LOCATION'], {})
+        self.assertEqual(otra.get('recuperar:3000000001'), '123456')
+
+    def test_metricas_para_admin(self):
+        cache.set('catalogo:x', b'{}')
+        cache.get('catalogo:x')
+        cache.get('catalogo:y')
+        admin = Usuario.objects.create_superuser(numero='3999999998', nombre='Admin', apellido='Tienda', password='clave123')
+        client = APIClient()
+        client.force_authenticate(admin)
+        datos = client.get('/api/admin/cache/').json()['espacios']['catalogo']
+        self.assertEqual((datos['aciertos'], datos['fallos'], datos['escrituras']), (1, 1, 1))
+        self.assertEqual(datos['ttl'], 3600)
+
+
+class BusquedaTests(CatalogoBaseTestCase):
+    """Índice invertido con normalización de tildes, stemming, ranking BM25 y filtros de la vista."""
+
+    def setUp(self):
+        super().setUp()
+        ojos = Subcategoria.objects.create(categoria=self.categoria, nombre='Ojos')
+        self.mascara = Producto.objects.create(subcategoria=ojos, nombre='Máscara de Pestañas Volumen', descripcion='Resistente al agua.', precio='34.90', stock=5)
+        self.labial = Producto.objects.create(subcategoria=self.subcategoria, nombre='Labial Mate Rojo', descripcion='Color intenso.', precio='29.90', stock=5)
+        self.brillo = Producto.objects.create(subcategoria=self.subcategoria, nombre='Brillo Labial', descripcion='Acabado brillante, ideal con labiales rojos.', precio='19.90', stock=5, destacado=True)
+        self.delineador = Producto.objects.create(subcategoria=ojos, nombre='Delineador', descripcion='Ideal para pestañas y ojos.', precio='15.00', stock=5)
+
+    def ids(self, url):
+        return [p['id'] for p in self.client.get(url).json()['results']]
+
+    def test_tokenizacion_sin_tildes_y_stemming(self):
+        self.assertEqual(tokenizar('Pestañas'), tokenizar('pestanas'))
+        self.assertEqual(tokenizar('labiales'), tokenizar('Labial'))
+        self.assertEqual(tokenizar('de la crema'), tokenizar('cremas'))
+
+    def test_ranking_prioriza_nombre_sobre_descripcion(self):
+        self.assertEqual(self.ids('/api/cliente/buscar/?q=pestanas'), [self.mascara.pk, self.delineador.pk])
+
+    def test_busca_en_categoria_y_subcategoria(self):
+        self.assertEqual(set(self.ids('/api/cliente/buscar/?q=ojos')), {self.mascara.pk, self.delineador.pk})
+
+    def test_prefijo_de_la_ultima_palabra(self):
+        self.assertIn(self.mascara.pk, self.ids('/api/cliente/buscar/?q=masc'))
+
+    def test_filtros_y_orden_sobre_el_indice(self):
+        self.assertEqual(self.ids('/api/cliente/buscar/?q=labiales&destacados=1'), [self.brillo.pk])
+        self.assertEqual(self.ids('/api/cliente/buscar/?q=labial&ordering=precio'), [self.brillo.pk, self.labial.pk])
+
+    def test_indice_incremental(self):
+        self.labial.nombre = 'Bálsamo Hidratante'
+        self.labial.save()
+        self.assertEqual(self.ids('/api/cliente/buscar/?q=balsamo'), [self.labial.pk])
+        self.subcategoria.nombre = 'Boca'
+        self.subcategoria.save()
+        self.assertEqual(set(self.ids('/api/cliente/buscar/?q=boca')), {self.labial.pk, self.brillo.pk})
+
+
+class SugerenciasTests(CatalogoBaseTestCase):
+    """Autocompletado con índice de prefijos en memoria, tolerante a errores de tipeo."""
+
+    def setUp(self):
+        super().setUp()
+        sugerencias._indice.version = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mascara = Producto.objects.create(subcategoria=self.subcategoria, nombre='Máscara de Pestañas', precio='34.90', stock=5)
+            self.labial = Producto.objects.create(subcategoria=self.subcategoria, nombre='Labial Mate Rojo', precio='29.90', stock=5)
+
+    def sugerir(self, q):
+        response = self.client.get('/api/cliente/buscar/sugerencias/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [(s['tipo'], s['nombre']) for s in response.json()['sugerencias']]
+
+    def test_prefijo_y_tipos(self):
+        self.assertEqual(self.sugerir('lab'), [('subcategoria', 'Labios'), ('producto', 'Labial Mate Rojo')])
+        self.assertEqual(self.sugerir('maq'), [('categoria', 'Maquillaje')])
+
+    def test_tolerancia_a_errores(self):
+        self.assertEqual(self.sugerir('mascra'), [('producto', 'Máscara de Pestañas')])
+        self.assertEqual(self.sugerir('pestanas masc'), [('producto', 'Máscara de Pestañas')])
+        self.assertEqual(self.sugerir('labail mate'), [('producto', 'Labial Mate Rojo')])
+
+    def test_actualizacion_incremental(self):
+        self.sugerir('lab')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.labial.nombre = 'Bálsamo Labial'
+            self.labial.save()
+            Producto.objects.create(subcategoria=self.subcategoria, nombre='Delineador Líquido', precio='15.00', stock=5)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.sugerir('balsamo'), [('producto', 'Bálsamo Labial')])
+            self.assertEqual(self.sugerir('delin'), [('producto', 'Delineador Líquido')])
+        self.assertEqual(len(consultas), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mascara.delete()
+        self.assertEqual(self.sugerir('mascara'), [])
+
+
+class PaginacionKeysetTests(CatalogoBaseTestCase):
+    """Paginación por cursor: recorrido completo sin saltos ni repetidos, retroceso y total opcional."""
+
+    def setUp(self):
+        super().setUp()
+        ahora = timezone.now()
+        self.productos = [
+            Producto.objects.create(subcategoria=self.subcategoria, nombre=f'Producto {i}', precio=10 + i % 3, stock=5, fecha_creacion=ahora)
+            for i in range(7)
+        ]
+
+    def recorrer(self, url):
+        ids, paginas = [], []
+        while url:
+            datos = self.client.get(url).json()
+            paginas.append(datos)
+            ids.extend(p['id'] for p in datos['results'])
+            url = datos['next']
+        return ids, paginas
+
+    def test_recorrido_con_empates(self):
+        # Todos comparten fecha_creacion: el id desempata
+        ids, paginas = self.recorrer('/api/cliente/buscar/?page_size=3')
+        self.assertEqual(ids, sorted((p.pk for p in self.productos), reverse=True))
+        self.assertNotIn('count', paginas[0])
+        self.assertIsNone(paginas[0]['previous'])
+        ids, _ = self.recorrer('/api/cliente/buscar/?page_size=2&ordering=precio')
+        esperado = sorted(self.productos, key=lambda p: (p.precio, p.pk))
+        self.assertEqual(ids, [p.pk for p in esperado])
+
+    def test_pagina_anterior_y_total(self):
+        primera = self.client.get('/api/cliente/buscar/?page_size=3&total=1').json()
+        self.assertEqual(primera['count'], 7)
+        segunda = self.client.get(primera['next']).json()
+        anterior = self.client.get(segunda['previous']).json()
+        self.assertEqual([p['id'] for p in anterior['results']], [p['id'] for p in primera['results']])
+        self.assertIsNone(anterior['previous'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get('/api/cliente/buscar/?cursor=no-valido').status_code, 404)
+
+    def test_historial_admin_sin_count(self):
+        admin = crear_usuario('3999999997', is_staff=True, is_superuser=True)
+        for i in range(5):
+            HistorialAccion.objects.create(usuario=admin, accion='prueba', detalle=str(i))
+        self.client.force_authenticate(admin)
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.client.get('/api/admin/acciones/?page_size=2').json()
+        self.assertFalse(any('COUNT(' in c['sql'] for c in consultas.captured_queries))
+        ids, _ = self.recorrer('/api/admin/acciones/?page_size=2')
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(datos['results']), 2)
+
+
+class CompraTests(CatalogoBaseTestCase):
+    """Servicio de compra: una transacción, stock descontado con UPDATE condicional y fallos por ítem."""
+
+    def setUp(self):
+        super().setUp()
+        self.cliente = crear_usuario('3222222222')
+        self.client.force_authenticate(self.cliente)
+        self.carrito = Carrito.objects.create(usuario=self.cliente)
+        EstadoVenta.objects.create(nombre='pendiente')
+
+    def agregar(self, nombre, precio, stock, cantidad):
+        producto = Producto.objects.create(subcategoria=self.subcategoria, nombre=nombre, precio=precio, stock=stock)
+        CarritoItem.objects.create(carrito=self.carrito, producto=producto, cantidad=cantidad)
+        return producto
+
+    def test_compra_exitosa(self):
+        labial = self.agregar('Labial', '10.50', 5, 2)
+        brillo = self.agregar('Brillo', '7.00', 3, 3)
+        response = self.client.post('/api/cliente/comprar/')
+        self.assertEqual(response.status_code, 200)
+        pedido = Pedido.objects.get(pk=response.json()['pedido_id'])
+        self.assertEqual(pedido.total, Decimal('42.00'))
+        self.assertEqual(pedido.estado.nombre, 'pendiente')
+        self.assertEqual(sorted(pedido.detalles.values_list('producto_id', 'cantidad')), sorted([(labial.pk, 2), (brillo.pk, 3)]))
+        labial.refresh_from_db()
+        brillo.refresh_from_db()
+        self.assertEqual((labial.stock, labial.activo), (3, True))
+        self.assertEqual((brillo.stock, brillo.activo), (0, False))
+        self.assertFalse(self.carrito.items.exists())
+
+    def test_consultas_constantes(self):
+        for i in range(2):
+            self.agregar(f'Producto {i}', '5.00', 10, 1)
+        # La primera venta del día desliza los rankings de ventana; no depende de la cantidad de ítems
+        rankings.deslizar()
+        with CaptureQueriesContext(connection) as pocas:
+            procesar_compra(self.cliente)
+        for i in range(20):
+            self.agregar(f'Otro {i}', '5.00', 10, 1)
+        with CaptureQueriesContext(connection) as muchas:
+            procesar_compra(self.cliente)
+        self.assertEqual(len(pocas), len(muchas))
+
+    def test_fallos_por_item_sin_cambios(self):
+        labial = self.agregar('Labial', '10.00', 5, 2)
+        brillo = self.agregar('Brillo', '7.00', 1, 3)
+        response = self.client.post('/api/cliente/comprar/')
+        self.assertEqual(response.status_code, 400)
+        fallos = response.json()['productos']
+        self.assertEqual([(f['producto_id'], f['motivo'], f['stock'], f['solicitado']) for f in fallos], [(brillo.pk, 'stock_insuficiente', 1, 3)])
+        labial.refresh_from_db()
+        self.assertEqual(labial.stock, 5)
+        self.assertEqual(self.carrito.items.count(), 2)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_carrito_vacio(self):
+        response = self.client.post('/api/cliente/comprar/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'El carrito está vacío.')
+
+
+@HASH_RAPIDO
+class CompraConcurrenteTests(TransactionTestCase):
+    """Muchos hilos comprando el mismo producto a la vez nunca venden más que el stock disponible."""
+
+    HILOS = 12
+    STOCK = 5
+
+    def test_sin_sobreventa(self):
+        categoria = Categoria.objects.create(nombre='Maquillaje')
+        subcategoria = Subcategoria.objects.create(categoria=categoria, nombre='Labios')
+        producto = Producto.objects.create(subcategoria=subcategoria, nombre='Labial', precio='10.00', stock=self.STOCK)
+        clientes = [crear_usuario(f'33300000{i:02d}') for i in range(self.HILOS)]
+        for cliente in clientes:
+            carrito = Carrito.objects.create(usuario=cliente)
+            CarritoItem.objects.create(carrito=carrito, producto=producto, cantidad=1)
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def comprar(cliente):
+            barrera.wait()
+            try:
+                # Reintentos como los de un cliente: SQLite rechaza escrituras concurrentes en vez de esperar
+                limite, espera = time.monotonic() + 30, 0.01
+                while time.monotonic() < limite:
+                    try:
+                        procesar_compra(cliente)
+                        resultados.append('ok')
+                        return
+                    except CompraError:
+                        resultados.append('sin_stock')
+                        return
+                    except OperationalError:
+                        # Espera creciente y aleatoria para que los reintentos no choquen siempre entre sí
+                        time.sleep(random.uniform(0, espera))
+                        espera = min(espera * 2, 0.2)
+                resultados.append('bloqueado')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(cliente,)) for cliente in clientes]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        producto.refresh_from_db()
+        self.assertEqual(resultados.count('ok'), self.STOCK)
+        self.assertEqual(resultados.count('sin_stock'), self.HILOS - self.STOCK)
+        self.assertEqual(producto.stock, 0)
+        self.assertEqual(DetallePedido.objects.filter(producto=producto).aggregate(total=Sum('cantidad'))['total'], self.STOCK)
+
+
+FALLOS_REGISTRADOS = []
+
+
+def registrar_fallo(valor):
+    FALLOS_REGISTRADOS.append(valor)
+
+
+@tarea(max_intentos=3, al_fallar=registrar_fallo)
+def tarea_que_falla(valor):
+    raise RuntimeError(f'falla {valor}')
+
+
+class MediaTemporalMixin:
+    """Archivos subidos/generados en un directorio temporal que se borra al terminar cada prueba."""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+@HASH_RAPIDO
+class ColaTareasTests(MediaTemporalMixin, TestCase):
+    """Cola de tareas en base de datos: factura PDF diferida, reintentos con espera y fallo definitivo."""
+
+    def test_compra_genera_factura_en_segundo_plano(self):
+        admin = crear_usuario('3999999996', es_admin=True)
+        cliente = crear_usuario('3444444444')
+        categoria = Categoria.objects.create(nombre='Maquillaje')
+        subcategoria = Subcategoria.objects.create(categoria=categoria, nombre='Labios')
+        producto = Producto.objects.create(subcategoria=subcategoria, nombre='Labial', precio='12.00', stock=3)
+        CarritoItem.objects.create(carrito=Carrito.objects.create(usuario=cliente), producto=producto, cantidad=2)
+        api = APIClient()
+        api.force_authenticate(cliente)
+        datos = api.post('/api/cliente/comprar/').json()
+        self.assertEqual(datos['factura_estado'], 'pendiente')
+        pedido = Pedido.objects.get(pk=datos['pedido_id'])
+        self.assertFalse(pedido.pdf)
+        self.assertEqual(Tarea.objects.filter(estado='pendiente').count(), 2)
+        call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.factura_estado, 'generada')
+        with pedido.pdf.open('rb') as archivo:
+            self.assertTrue(archivo.read().startswith(b'%PDF'))
+        self.assertEqual(Tarea.objects.filter(estado='completada').count(), 2)
+        self.assertTrue(Notificacion.objects.filter(usuario=cliente, tipo='factura').exists())
+        self.assertTrue(Notificacion.objects.filter(usuario=admin, tipo='pedido').exists())
+
+    def test_fallo_de_tarea_periodica_no_detiene_el_worker(self):
+        comando = 'tienda.management.commands.procesar_tareas'
+
+        def liberar_vencidas():
+            raise RuntimeError('sin base')
+
+        with mock.patch(f'{comando}.liberar_vencidas', liberar_vencidas), mock.patch(f'{comando}.deslizar') as deslizar:
+            salida = StringIO()
+            call_command('procesar_tareas', '--una-vez', stdout=salida)
+        deslizar.assert_called_once_with()
+        self.assertIn('0 tareas procesadas', salida.getvalue())
+
+    def test_reintentos_y_fallo_definitivo(self):
+        FALLOS_REGISTRADOS.clear()
+        encolada = encolar(tarea_que_falla, valor=7)
+        self.assertEqual(encolada.max_intentos, 3)
+        for intento in range(1, 4):
+            self.assertEqual(procesar_pendientes(), 1)
+            encolada.refresh_from_db()
+            self.assertEqual(encolada.intentos, intento)
+            self.assertIn('falla 7', encolada.ultimo_error)
+            if intento < 3:
+                self.assertEqual(encolada.estado, 'pendiente')
+                self.assertGreater(encolada.ejecutar_en, timezone.now())
+                # Sin esperar el backoff no se vuelve a tomar
+                self.assertEqual(procesar_pendientes(), 0)
+                Tarea.objects.filter(pk=encolada.pk).update(ejecutar_en=timezone.now())
+        self.assertEqual(encolada.estado, 'fallida')
+        self.assertEqual(FALLOS_REGISTRADOS, [7])
+
+    def test_recupera_tareas_abandonadas(self):
+        abandonada = Tarea.objects.create(
+            funcion='tienda.notificaciones.enviar_notificacion', argumentos={'usuario_id': None, 'mensaje': 'hola'},
+            estado='en_proceso', intentos=1, bloqueada_hasta=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(procesar_pendientes(), 1)
+        abandonada.refresh_from_db()
+        self.assertEqual((abandonada.estado, abandonada.intentos), ('completada', 2))
+
+
+class FacturaDescargaTests(MediaTemporalMixin, CatalogoBaseTestCase):
+    """Factura almacenada por huella del contenido y descarga con ETag, rangos y Content-Disposition."""
+
+    def setUp(self):
+        super().setUp()
+        self.cliente = crear_usuario('3555555555')
+        producto = Producto.objects.create(subcategoria=self.subcategoria, nombre='Labial', precio='12.00', stock=5)
+        CarritoItem.objects.create(carrito=Carrito.objects.create(usuario=self.cliente), producto=producto, cantidad=2)
+        self.pedido = procesar_compra(self.cliente)
+        procesar_pendientes()
+        self.pedido.refresh_from_db()
+        self.url = f'/api/cliente/pedidos/{self.pedido.id}/factura/'
+        self.client.force_authenticate(self.cliente)
+
+    def contenido(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_descarga_completa_y_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="factura_{self.pedido.id}.pdf"')
+        self.assertEqual(response['ETag'], f'"{self.pedido.factura_huella}"')
+        cuerpo = self.contenido(response)
+        self.assertTrue(cuerpo.startswith(b'%PDF'))
+        self.assertEqual(int(response['Content-Length']), len(cuerpo))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_rangos(self):
+        completo = self.contenido(self.client.get(self.url))
+        parcial = self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 0-3/{len(completo)}')
+        self.assertEqual(self.contenido(parcial), b'%PDF')
+        final = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.contenido(final), completo[-5:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(completo)}-').status_code, 416)
+
+    def test_reutiliza_pdf_y_regenera_si_cambia_el_pedido(self):
+        with mock.patch('tienda.utils_pdf._renderizar') as renderizar:
+            almacenar_factura(self.pedido)
+        renderizar.assert_not_called()
+        huella = self.pedido.factura_huella
+        self.pedido.detalles.update(cantidad=1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.client.get(self.url)
+        self.assertEqual(Tarea.objects.filter(estado='pendiente').count(), 1)
+        procesar_pendientes()
+        self.pedido.refresh_from_db()
+        self.assertNotEqual(self.pedido.factura_huella, huella)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_solo_el_propietario(self):
+        self.client.force_authenticate(crear_usuario('3666666666'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ArbolCategoriasTests(CatalogoBaseTestCase):
+    """Árbol categoría → subcategoría con conteos de productos disponibles, en dos consultas y cacheado."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            ojos = Subcategoria.objects.create(categoria=self.categoria, nombre='Ojos')
+            Subcategoria.objects.create(categoria=self.categoria, nombre='Oculta', activa=False)
+            Categoria.objects.create(nombre='Cabello')
+            Categoria.objects.create(nombre='Inactiva', activa=False)
+            Producto.objects.create(subcategoria=self.subcategoria, nombre='Labial', precio='10.00', stock=3)
+            Producto.objects.create(subcategoria=self.subcategoria, nombre='Agotado', precio='10.00', stock=0)
+            Producto.objects.create(subcategoria=ojos, nombre='Máscara', precio='10.00', stock=3)
+            self.inactivo = Producto.objects.create(subcategoria=ojos, nombre='Delineador', precio='10.00', stock=3, activo=False)
+
+    def arbol(self):
+        return {
+            c['nombre']: (c['productos_count'], [(s['nombre'], s['productos_count']) for s in c['subcategorias']])
+            for c in self.client.get('/api/cliente/categorias/arbol/').json()
+        }
+
+    def test_arbol_y_conteos(self):
+        with CaptureQueriesContext(connection) as consultas:
+            arbol = self.arbol()
+        self.assertEqual(arbol, {'Cabello': (0, []), 'Maquillaje': (2, [('Labios', 1), ('Ojos', 1)])})
+        self.assertEqual(len(consultas), 2)
+        with CaptureQueriesContext(connection) as consultas:
+            arbol_categorias()
+        self.assertEqual(len(consultas), 0)
+
+    def test_se_invalida_al_cambiar_productos(self):
+        self.arbol()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inactivo.activo = True
+            self.inactivo.save()
+        self.assertEqual(self.arbol()['Maquillaje'], (3, [('Labios', 1), ('Ojos', 2)]))
+
+    def test_listado_de_categorias_sin_n_mas_1(self):
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.client.get('/api/cliente/categorias/').json()
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual({c['nombre']: c['subcategorias_count'] for c in datos}, {'Cabello': 0, 'Maquillaje': 2})
+
+
+class FacetasBusquedaTests(CatalogoBaseTestCase):
+    """Facetas de búsqueda en una consulta agrupada y cacheadas por consulta normalizada."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            ojos = Subcategoria.objects.create(categoria=self.categoria, nombre='Ojos')
+            cabello = Subcategoria.objects.create(categoria=Categoria.objects.create(nombre='Cabello'), nombre='Tintes')
+            for nombre, subcategoria, precio, destacado in [
+                ('Labial Rojo', self.subcategoria, '10.00', True),
+                ('Labial Rosa', self.subcategoria, '12.00', False),
+                ('Sombra Rojo', ojos, '25.00', False),
+                ('Tinte Rojo', cabello, '58.00', True),
+                ('Tinte Negro', cabello, '40.00', False),
+            ]:
+                Producto.objects.create(subcategoria=subcategoria, nombre=nombre, precio=precio, stock=3, destacado=destacado)
+
+    def test_conteos_e_histograma(self):
+        facetas = self.client.get('/api/cliente/buscar/?q=rojo&facetas=1').json()['facetas']
+        self.assertEqual(facetas['total'], 3)
+        self.assertEqual([(c['nombre'], c['count']) for c in facetas['categorias']], [('Maquillaje', 2), ('Cabello', 1)])
+        self.assertEqual(sorted((s['nombre'], s['count']) for s in facetas['subcategorias']), [('Labios', 1), ('Ojos', 1), ('Tintes', 1)])
+        self.assertEqual(facetas['destacados'], 2)
+        precio = facetas['precio']
+        self.assertEqual((precio['min'], precio['max']), (10.0, 58.0))
+        self.assertEqual(sum(c['count'] for c in precio['histograma']), 3)
+        self.assertLessEqual(precio['histograma'][0]['desde'], 10.0)
+        self.assertGreater(precio['histograma'][-1]['hasta'], 58.0)
+
+    def test_filtros_y_cache_por_consulta_normalizada(self):
+        facetas = self.client.get('/api/cliente/buscar/?categoria=%d&facetas=1' % self.categoria.pk).json()['facetas']
+        self.assertEqual(facetas['total'], 3)
+        self.client.get('/api/cliente/buscar/?q=Rojo&facetas=1')
+        with CaptureQueriesContext(connection) as sin_facetas:
+            self.client.get('/api/cliente/buscar/?q=rojo&ordering=precio&page_size=1')
+        with CaptureQueriesContext(connection) as cacheadas:
+            self.client.get('/api/cliente/buscar/?q=rojo&facetas=1&ordering=precio&page_size=1')
+        self.assertEqual(len(cacheadas), len(sin_facetas))
+        self.assertNotIn('facetas', self.client.get('/api/cliente/buscar/?q=rojo').json())
+
+    def test_histograma_precio_unico(self):
+        self.assertEqual(histograma_precios([(Decimal('5.00'), 2)])['histograma'], [{'desde': 5.0, 'hasta': 5.0, 'count': 2}])
+
+
+class CacheResultadosTests(CatalogoBaseTestCase):
+    """Caché de resultados por consulta canónica con coalescencia y servicio de valores obsoletos."""
+
+    def setUp(self):
+        super().setUp()
+        self.crear_productos(3)
+        resultados.reiniciar_metricas()
+
+    def test_consultas_equivalentes_comparten_entrada(self):
+        primera = self.client.get('/api/cliente/buscar/?q=Labial&ordering=no-existe&page_size=2')
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        # Mismo texto normalizado, orden inválido → por defecto y parámetros en otro orden
+        with CaptureQueriesContext(connection) as contexto:
+            segunda = self.client.get('/api/cliente/buscar/?page_size=2&ordering=-fecha_creacion&q=labiál')
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(len(contexto), 0)
+        self.assertEqual(segunda.json()['results'], primera.json()['results'])
+        # Los enlaces salen de la consulta de cada solicitante, no de la que llenó la caché
+        self.assertIn('ordering=no-existe', primera.json()['next'])
+        self.assertIn('ordering=-fecha_creacion', segunda.json()['next'])
+        self.assertEqual(self.client.get(segunda.json()['next']).json()['results'][0]['nombre'], 'Labial 0')
+        self.assertEqual(self.client.get('/api/cliente/buscar/?q=labial&page_size=2')['X-Cache'], 'MISS')
+        fila = next(f for f in resultados.metricas() if 'ordering=-fecha_creacion' in f['clave'])
+        self.assertEqual((fila['aciertos'], fila['fallos'], fila['recalculos']), (1, 1, 1))
+
+    def test_cambio_de_catalogo_sirve_obsoleto_mientras_otro_recalcula(self):
+        url = '/api/cliente/productos/destacados/'
+        Producto.objects.update(destacado=True)
+        self.assertEqual(len(self.client.get(url).json()['results']), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(nombre='Labial 0').first().delete()
+        huella, _ = resultados.clave_canonica('destacados', {'ordering': '-fecha_creacion', 'page_size': 12})
+        cache.add(f'resultados:candado:{huella}', 1, 30)
+        obsoleta = self.client.get(url)
+        self.assertEqual((obsoleta['X-Cache'], len(obsoleta.json()['results'])), ('STALE', 3))
+        cache.delete(f'resultados:candado:{huella}')
+        fresca = self.client.get(url)
+        self.assertEqual((fresca['X-Cache'], len(fresca.json()['results'])), ('MISS', 2))
+
+    def test_un_solo_calculo_con_solicitudes_concurrentes(self):
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.3)
+            return {'valor': 42}
+
+        huella, descripcion = resultados.clave_canonica('prueba', {'x': '1'})
+        obtenidos = []
+        hilos = [threading.Thread(target=lambda: obtenidos.append(resultados.obtener(huella, descripcion, calcular)[0])) for _ in range(6)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(obtenidos, [{'valor': 42}] * 6)
+
+
+class CamposParcialesTests(CatalogoBaseTestCase):
+    """?fields= y ?vista= limitan columnas, consultas y salida; imagen principal precalculada."""
+
+    def setUp(self):
+        super().setUp()
+        self.productos = self.crear_productos(3)
+        Producto.objects.update(destacado=True)
+
+    def test_vista_lista(self):
+        consultas_completas, _ = self.contar_consultas('/api/cliente/productos/destacados/')
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get('/api/cliente/productos/destacados/?vista=lista')
+        resultados_ = response.json()['results']
+        self.assertEqual(set(resultados_[0]), {'id', 'nombre', 'precio', 'imagen_principal', 'calificacion_promedio', 'total_reseñas'})
+        self.assertEqual(resultados_[-1]['imagen_principal'], 'https://cdn.example.com/0.jpg')
+        self.assertLess(len(contexto), consultas_completas)
+        self.assertNotIn('descripcion', contexto.captured_queries[-1]['sql'])
+
+    def test_fields_en_busqueda_y_listado(self):
+        response = self.client.get('/api/cliente/buscar/?q=labial&fields=nombre,subcategoria_nombre&ordering=precio')
+        self.assertEqual(response.json()['results'][0], {'id': self.productos[0].pk, 'nombre': 'Labial 0', 'subcategoria_nombre': 'Labios'})
+        self.assertEqual(self.client.get('/api/cliente/productos/?fields=precio').json()[0], {'id': self.productos[2].pk, 'precio': '29.90'})
+        self.assertEqual(self.client.get('/api/cliente/buscar/?fields=nombre,clave').status_code, 400)
+        self.assertEqual(self.client.get('/api/cliente/productos/destacados/?vista=otra').status_code, 400)
+
+    def test_imagen_principal_sigue_a_las_imagenes(self):
+        producto = self.productos[0]
+        secundaria = producto.imagenes.get(es_principal=False)
+        secundaria.es_principal = True
+        secundaria.save()
+        producto.refresh_from_db()
+        self.assertEqual(producto.imagen_principal, 'https://cdn.example.com/0-b.jpg')
+        secundaria.delete()
+        producto.refresh_from_db()
+        self.assertEqual(producto.imagen_principal, 'https://cdn.example.com/0.jpg')
+
+
+class LecturaRapidaTests(CatalogoBaseTestCase):
+    """Los lectores de tienda.lectura producen el mismo JSON que los serializers DRF."""
+
+    def assertMismoJSON(self, drf, rapido):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(rapido), renderer.render(drf))
+
+    def test_productos(self):
+        productos = self.crear_productos(2)
+        Producto.objects.filter(pk=productos[0].pk).update(imagen='productos/local.jpg', calificacion_promedio=4.3333333, destacado=True)
+        ImagenProducto.objects.create(producto=productos[1], imagen='productos/imagenes/x.png', descripcion=None, orden=5)
+        Producto.objects.create(subcategoria=self.subcategoria, nombre='Sin imágenes', descripcion='', precio='7.5', stock=1)
+        queryset = Producto.objects.order_by('-fecha_creacion')
+        self.assertMismoJSON(ProductoSerializer(queryset.para_catalogo(), many=True).data, lectura.productos.convertir(lectura.productos.valores(queryset)))
+        campos = ('id', 'nombre', 'precio', 'subcategoria_nombre')
+        self.assertMismoJSON(
+            ProductoSerializer(queryset, many=True, campos=campos).data,
+            lectura.productos.convertir(lectura.productos.valores(queryset, campos), campos),
+        )
+
+    def test_notificaciones_e_historial(self):
+        usuario = self.usuarios[0]
+        Notificacion.objects.create(usuario=usuario, tipo='pedido', mensaje='Hola ñandú', leida=True)
+        HistorialAccion.objects.create(usuario=usuario, accion='login', detalle=None, ip=None)
+        HistorialAccion.objects.create(usuario=usuario, accion='compra', detalle='Pedido #1', ip='10.0.0.1')
+        notificaciones = Notificacion.objects.order_by('-creada')
+        historial = HistorialAccion.objects.order_by('-fecha')
+        self.assertMismoJSON(NotificacionSerializer(notificaciones, many=True).data, lectura.notificaciones.convertir(lectura.notificaciones.valores(notificaciones)))
+        self.assertMismoJSON(HistorialAccionSerializer(historial, many=True).data, lectura.historial.convertir(lectura.historial.valores(historial)))
+
+    def test_endpoints_usan_lectura_rapida(self):
+        self.crear_productos(2)
+        Producto.objects.update(destacado=True)
+        esperado = JSONRenderer().render(ProductoSerializer(Producto.objects.order_by('-fecha_creacion').para_catalogo(), many=True).data)
+        self.assertEqual(self.client.get('/api/cliente/productos/').content, esperado)
+        self.assertEqual(self.client.get('/api/cliente/productos/destacados/').json()['results'], json.loads(esperado))
+        self.client.force_authenticate(self.usuarios[0])
+        Notificacion.objects.create(usuario=self.usuarios[0], tipo='pedido', mensaje='Listo')
+        self.assertEqual(self.client.get('/api/cliente/notificaciones/').json()['results'][0]['mensaje'], 'Listo')
+
+
+class FichaProductoTests(CatalogoBaseTestCase):
+    """Ficha de producto en consultas acotadas, cacheada y reconstruida al cambiar cualquiera de sus partes."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto, *self.otros = self.crear_productos(4)
+        self.url = f'/api/cliente/productos/{self.producto.pk}/'
+
+    def test_documento_y_consultas_acotadas(self):
+        raiz = Comentario.objects.filter(producto=self.producto).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = Comentario.objects.create(usuario=self.usuarios[1], producto=self.producto, texto='Gracias', comentario_padre=raiz)
+            likes.like_comentario(self.usuarios[2].id, respuesta, True)
+        consultas, response = self.contar_consultas(self.url)
+        self.assertLessEqual(consultas, 5)
+        ficha = response.json()
+        self.assertEqual(ficha['producto']['nombre'], 'Labial 0')
+        self.assertEqual(len(ficha['producto']['imagenes']), 2)
+        self.assertEqual(ficha['agregados']['calificacion']['distribucion'], {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1})
+        self.assertEqual(ficha['comentarios']['count'], 3)
+        hilo = next(h for h in ficha['comentarios']['results'] if h['id'] == raiz.pk)
+        self.assertEqual([(r['texto'], r['likes_count']) for r in hilo['respuestas']], [('Gracias', 1)])
+        self.assertEqual(len(ficha['relacionados']), 3)
+        self.assertNotIn('descripcion', ficha['relacionados'][0])
+        consultas, _ = self.contar_consultas(self.url)
+        self.assertEqual(consultas, 0)
+
+    def test_se_reconstruye_al_cambiar_una_parte(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comentario.objects.create(usuario=self.usuarios[0], producto=self.producto, texto='Nuevo')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comentarios']['count'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.otros[0].nombre = 'Labial renombrado'
+            self.otros[0].save()
+        nombres = [p['nombre'] for p in self.client.get(self.url).json()['relacionados']]
+        self.assertIn('Labial renombrado', nombres)
+
+    def test_producto_inexistente_o_inactivo(self):
+        Producto.objects.filter(pk=self.otros[0].pk).update(activo=False)
+        self.assertEqual(self.client.get(f'/api/cliente/productos/{self.otros[0].pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/cliente/productos/999999/').status_code, 404)
+
+
+class HilosForoTests(CatalogoBaseTestCase):
+    """Hilos del foro: una consulta por producto, paginación por raíz y profundidad limitada con 'cargar más'."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        usuario = self.usuarios[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.raiz = Comentario.objects.filter(producto=self.producto).order_by('id').first()
+            padre = self.raiz
+            self.cadena = []
+            for nivel in range(5):
+                padre = Comentario.objects.create(usuario=usuario, producto=self.producto, texto=f'Nivel {nivel + 1}', comentario_padre=padre)
+                self.cadena.append(padre)
+            likes.like_comentario(self.usuarios[1].id, self.cadena[0], True)
+            Comentario.objects.create(usuario=usuario, producto=self.producto, texto='Oculta', comentario_padre=self.raiz, activo=False)
+
+    def test_hilos_de_producto_en_una_consulta(self):
+        consultas, response = self.contar_consultas(f'/api/cliente/comentarios/foro/?producto={self.producto.pk}&page_size=2')
+        self.assertLessEqual(consultas, 1)
+        datos = response.json()
+        self.assertEqual(len(datos['results']), 2)
+        self.assertIsNotNone(datos['next'])
+        siguiente = self.client.get(datos['next']).json()
+        self.assertEqual(len(siguiente['results']), 1)
+        hilo = siguiente['results'][0]
+        self.assertEqual(hilo['id'], self.raiz.pk)
+        self.assertEqual(hilo['respuestas_total'], 1)
+        nivel = hilo['respuestas'][0]
+        self.assertEqual(nivel['likes_count'], 1)
+        profundidad = 1
+        while nivel['respuestas']:
+            nivel = nivel['respuestas'][0]
+            profundidad += 1
+        self.assertEqual(profundidad, 3)
+        self.assertEqual(nivel['texto'], 'Nivel 3')
+        mas = self.client.get(nivel['mas_respuestas']).json()
+        self.assertEqual([mas['id'], mas['respuestas'][0]['texto']], [self.cadena[2].pk, 'Nivel 4'])
+
+    def test_foro_general_paginado_y_acotado(self):
+        self.crear_productos(3, inicio=1)
+        with CaptureQueriesContext(connection) as contexto:
+            datos = self.client.get('/api/cliente/comentarios/foro/?page_size=5').json()
+        self.assertEqual(len(datos['results']), 5)
+        self.assertIsNotNone(datos['next'])
+        self.assertLessEqual(len(contexto), 5)
+        serializado = ComentarioSerializer(self.raiz).data
+        self.assertEqual(serializado['respuestas'][0]['respuestas'][0]['respuestas'][0]['mas_respuestas'], f'/api/cliente/comentarios/foro/?hilo={self.cadena[2].pk}')
+
+    def test_serializador_en_lista_carga_respuestas_por_nivel(self):
+        comentarios = Comentario.objects.filter(producto=self.producto, activo=True).select_related('usuario').order_by('id')
+        with CaptureQueriesContext(connection) as contexto:
+            datos = ComentarioSerializer(comentarios, many=True).data
+        # Comentarios + un nivel de respuestas por profundidad + las ocultas, sin importar cuántos sean
+        self.assertLessEqual(len(contexto), 5)
+        self.assertEqual(len(datos), 8)
+        self.assertEqual([fila['respuestas'] for fila in datos], [ComentarioSerializer(c).data['respuestas'] for c in comentarios])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/api/cliente/comentarios/foro/?producto=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/cliente/comentarios/foro/?hilo=999999').status_code, 404)
+
+
+class LikesTests(CatalogoBaseTestCase):
+    """Likes con una sola sentencia por cambio: idempotentes, alternables y con contadores exactos."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        self.comentario = Comentario.objects.filter(producto=self.producto).first()
+        self.cliente = crear_usuario('3555555555')
+        self.client.force_authenticate(self.cliente)
+
+    def test_fijar_es_idempotente_y_sin_cuerpo_alterna(self):
+        url = f'/api/cliente/productos/{self.producto.pk}/like/'
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                self.assertTrue(self.client.post(url, {'like': True}, format='json').json()['like'])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.likes_total, 4)
+        self.assertFalse(self.client.post(url).json()['like'])
+        self.assertTrue(self.client.post(url).json()['like'])
+        self.assertEqual(self.client.post(url, {'like': False}, format='json').json()['success'], 'Like eliminado.')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.likes_total, 3)
+        url = f'/api/cliente/comentarios/{self.comentario.pk}/like/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.client.post(url).json()['like'])
+            self.client.post(url, {'like': True}, format='json')
+        self.assertEqual(Comentario.objects.get(pk=self.comentario.pk).likes_total, 1)
+        ficha = self.client.get(f'/api/cliente/productos/{self.producto.pk}/').json()
+        self.assertEqual(sum(c['likes_count'] for c in ficha['comentarios']['results']), 1)
+        self.assertEqual(self.client.post('/api/cliente/productos/999999/like/').status_code, 404)
+
+    @override_settings(LIKES_CONTADORES_EN_CACHE=True)
+    def test_contadores_acumulados_en_cache_se_vuelcan_en_lote(self):
+        otros = [crear_usuario(f'35555555{i:02d}') for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for usuario in otros:
+                likes.like_producto(usuario.id, self.producto.pk)
+                likes.like_comentario(usuario.id, self.comentario)
+            likes.like_producto(otros[0].id, self.producto.pk)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.likes_total, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.volcar_contadores(), 2)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.likes_total, 5)
+        self.assertEqual(Comentario.objects.get(pk=self.comentario.pk).likes_total, 3)
+        self.assertEqual(likes.volcar_contadores(), 0)
+        self.assertEqual(verificar_contadores(), [])
+
+    @override_settings(LIKES_CONTADORES_EN_CACHE=True)
+    def test_volcado_no_avanza_sin_el_candado(self):
+        otros = [crear_usuario(f'35555556{i:02d}') for i in range(2)]
+        cache.set(likes.CANDADO, 'otro-proceso', 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            for usuario in otros:
+                likes.like_producto(usuario.id, self.producto.pk)
+        # El candado ajeno sigue tomado tras la espera: no se vuelca ni se libera
+        self.assertEqual(likes.volcar_contadores(espera=0.05), 0)
+        self.assertEqual(cache.get(likes.CANDADO), 'otro-proceso')
+        self.assertEqual(LikePendiente.objects.filter(tipo='producto', objeto_id=self.producto.pk).count(), 1)
+        cache.delete(likes.CANDADO)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.volcar_contadores(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.likes_total, 5)
+        self.assertFalse(LikePendiente.objects.exists())
+        self.assertIsNone(cache.get(likes.CANDADO))
+
+    @override_settings(LIKES_CONTADORES_EN_CACHE=True)
+    def test_fallo_de_un_objeto_no_pierde_los_demas_deltas(self):
+        otro = self.crear_productos(1, inicio=1)[0]
+        usuario = crear_usuario('3555555700')
+        with self.captureOnCommitCallbacks(execute=True):
+            likes.like_producto(usuario.id, self.producto.pk)
+            likes.like_producto(usuario.id, otro.pk)
+        aplicar = likes._aplicar
+
+        def fallar_con_otro(tipo, modelo, deltas):
+            if otro.pk in deltas:
+                raise IntegrityError('CHECK constraint failed')
+            return aplicar(tipo, modelo, deltas)
+
+        with mock.patch.object(likes, '_aplicar', fallar_con_otro), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.volcar_contadores(), 1)
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).likes_total, 4)
+        self.assertEqual(Producto.objects.get(pk=otro.pk).likes_total, 3)
+        self.assertTrue(LikePendiente.objects.filter(tipo='producto', objeto_id=otro.pk).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(likes.volcar_contadores(), 1)
+        self.assertEqual(Producto.objects.get(pk=otro.pk).likes_total, 4)
+        self.assertEqual(verificar_contadores(), [])
+
+    def test_marca_de_pendiente_solo_tras_confirmar(self):
+        with self.assertRaises(IntegrityError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                likes._registrar('producto', [self.producto.pk])
+                raise IntegrityError('rollback')
+        self.assertIsNone(cache.get(likes._clave_marca('producto', self.producto.pk)))
+        self.assertFalse(LikePendiente.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            likes._registrar('producto', [self.producto.pk])
+        self.assertTrue(LikePendiente.objects.filter(objeto_id=self.producto.pk).exists())
+        self.assertEqual(cache.get(likes._clave_marca('producto', self.producto.pk)), 1)
+
+
+@HASH_RAPIDO
+class LikesConcurrentesTests(TransactionTestCase):
+    """Muchos usuarios cambiando likes del mismo producto y comentario a la vez no desvían los contadores."""
+
+    HILOS = 8
+    CAMBIOS = 15
+
+    def test_contadores_coinciden_con_las_filas(self):
+        categoria = Categoria.objects.create(nombre='Maquillaje')
+        subcategoria = Subcategoria.objects.create(categoria=categoria, nombre='Labios')
+        producto = Producto.objects.create(subcategoria=subcategoria, nombre='Labial', precio='10.00', stock=5)
+        usuarios = [crear_usuario(f'35600000{i:02d}') for i in range(self.HILOS)]
+        comentario = Comentario.objects.create(usuario=usuarios[0], producto=producto, texto='Muy bueno')
+        barrera = threading.Barrier(self.HILOS)
+
+        def cambiar(usuario, indice):
+            barrera.wait()
+            try:
+                for paso in range(self.CAMBIOS):
+                    # Estado explícito: reintentar tras un OperationalError no altera el resultado
+                    quiere_like = (paso + indice) % 3 != 0
+                    for _ in range(200):
+                        try:
+                            likes.like_producto(usuario.id, producto.pk, quiere_like)
+                            likes.like_comentario(usuario.id, comentario, not quiere_like)
+                            break
+                        except OperationalError:
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=cambiar, args=(usuario, i)) for i, usuario in enumerate(usuarios)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        producto.refresh_from_db()
+        comentario.refresh_from_db()
+        self.assertEqual(producto.likes_total, Like.objects.filter(producto=producto).count())
+        self.assertEqual(comentario.likes_total, LikeComentario.objects.filter(comentario=comentario).count())
+        self.assertGreater(producto.likes_total, 0)
+
+
+class CarritoTests(CatalogoBaseTestCase):
+    """Carrito persistente: lectura en una consulta con totales en SQL y resumen en caché."""
+
+    def setUp(self):
+        super().setUp()
+        self.productos = self.crear_productos(2)
+        Producto.objects.filter(pk=self.productos[1].pk).update(precio='10.05')
+        self.cliente = crear_usuario('3666666666')
+        self.client.force_authenticate(self.cliente)
+
+    def agregar(self, producto, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/cliente/carrito/', {'producto_id': producto.pk, 'cantidad': cantidad}, format='json')
+
+    def test_lectura_en_una_consulta_con_totales(self):
+        consultas, response = self.contar_consultas('/api/cliente/carrito/')
+        self.assertEqual(response.json()['items'], [])
+        self.assertFalse(Carrito.objects.filter(usuario=self.cliente).exists())
+        self.agregar(self.productos[0], 2)
+        self.agregar(self.productos[1], 1)
+        self.agregar(self.productos[1], 2)
+        consultas, response = self.contar_consultas('/api/cliente/carrito/')
+        self.assertEqual(consultas, 1)
+        datos = response.json()
+        self.assertEqual([(i['producto']['id'], i['cantidad'], i['subtotal']) for i in datos['items']],
+                         [(self.productos[0].pk, 2, '59.80'), (self.productos[1].pk, 3, '30.15')])
+        self.assertEqual(datos['items'][0]['producto']['imagen_principal'], 'https://cdn.example.com/0.jpg')
+        self.assertEqual((datos['lineas'], datos['unidades'], datos['total']), (2, 5, '89.95'))
+        self.assertEqual(self.agregar(self.productos[0], 50).status_code, 400)
+        self.assertEqual(self.agregar(Producto(pk=999999), 1).status_code, 404)
+
+    def test_resumen_en_cache_e_invalidado_al_cambiar(self):
+        self.agregar(self.productos[0], 1)
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json(), {'lineas': 1, 'unidades': 1, 'total': '29.90'})
+        consultas, response = self.contar_consultas('/api/cliente/carrito/resumen/')
+        self.assertEqual(consultas, 0)
+        self.agregar(self.productos[1], 2)
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json()['total'], '50.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/cliente/carrito/', {'producto_id': self.productos[0].pk}, format='json')
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json()['lineas'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/cliente/carrito/limpiar/')
+        self.assertFalse(CarritoItem.objects.filter(carrito__usuario=self.cliente).exists())
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json(), {'lineas': 0, 'unidades': 0, 'total': '0.00'})
+
+    def test_resumen_sigue_los_cambios_de_precio(self):
+        self.agregar(self.productos[0], 2)
+        self.client.get('/api/cliente/carrito/')
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json()['total'], '59.80')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[0].precio = Decimal('20.00')
+            self.productos[0].save()
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json()['total'], '40.00')
+
+    def test_operaciones_en_lote_con_errores_por_linea(self):
+        self.agregar(self.productos[0], 1)
+        otros = self.crear_productos(3, inicio=2)
+        operaciones = [
+            {'producto_id': self.productos[0].pk, 'cantidad': 2, 'modo': 'add'},
+            {'producto_id': self.productos[1].pk, 'cantidad': 4, 'modo': 'set'},
+            {'producto_id': otros[0].pk, 'cantidad': 11, 'modo': 'set'},
+            {'producto_id': 999999, 'cantidad': 1},
+            {'producto_id': otros[1].pk, 'modo': 'borrar'},
+            {'producto_id': otros[2].pk, 'cantidad': 1},
+            {'producto_id': otros[2].pk, 'modo': 'remove'},
+            {'producto_id': self.productos[1].pk, 'cantidad': 1, 'modo': 'add'},
+        ]
+        with CaptureQueriesContext(connection) as contexto, self.captureOnCommitCallbacks(execute=True):
+            datos = self.client.post('/api/cliente/carrito/lote/', {'operaciones': operaciones}, format='json').json()
+        self.assertLessEqual(len(contexto), 10)
+        self.assertEqual([(e['indice'], e['motivo']) for e in datos['errores']],
+                         [(2, 'stock_insuficiente'), (3, 'no_existe'), (4, 'invalida')])
+        self.assertEqual({i['producto']['id']: i['cantidad'] for i in datos['carrito']['items']},
+                         {self.productos[0].pk: 3, self.productos[1].pk: 5})
+        self.assertEqual(self.client.get('/api/cliente/carrito/resumen/').json()['unidades'], 8)
+        datos = self.client.post('/api/cliente/carrito/lote/', {'operaciones': [
+            {'producto_id': self.productos[0].pk, 'cantidad': 0, 'modo': 'set'},
+        ]}, format='json').json()
+        self.assertEqual([i['producto']['id'] for i in datos['carrito']['items']], [self.productos[1].pk])
+
+    def test_migrar_desde_localstorage(self):
+        self.agregar(self.productos[0], 1)
+        items = [{'producto_id': self.productos[0].pk, 'cantidad': 2}, {'producto_id': self.productos[1].pk}, {'producto_id': 999999}]
+        datos = self.client.post('/api/cliente/carrito/migrar/', {'items': items}, format='json').json()
+        self.assertEqual([e['producto_id'] for e in datos['errores']], [999999])
+        self.assertEqual([(i['producto']['id'], i['cantidad']) for i in datos['carrito']['items']],
+                         [(self.productos[0].pk, 3), (self.productos[1].pk, 1)])
+
+
+@override_settings(RESERVA_CARRITO_SEGUNDOS=600)
+class ReservasStockTests(CatalogoBaseTestCase):
+    """Las líneas del carrito apartan unidades: el stock disponible descuenta las reservas vigentes de otros."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        self.clientes = [crear_usuario(f'37777777{i:02d}') for i in range(2)]
+
+    def lote(self, cliente, cantidad, modo='set'):
+        self.client.force_authenticate(cliente)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/cliente/carrito/lote/', {'operaciones': [
+                {'producto_id': self.producto.pk, 'cantidad': cantidad, 'modo': modo},
+            ]}, format='json').json()
+
+    def test_reservas_limitan_el_disponible_y_vencen(self):
+        self.assertEqual(self.lote(self.clientes[0], 7)['errores'], [])
+        reserva = ReservaStock.objects.get(usuario=self.clientes[0], producto=self.producto)
+        self.assertEqual(reserva.cantidad, 7)
+        self.assertEqual(self.lote(self.clientes[1], 4)['errores'][0]['motivo'], 'stock_insuficiente')
+        datos = self.lote(self.clientes[1], 3)
+        self.assertEqual(datos['errores'], [])
+        self.assertEqual(datos['carrito']['items'][0]['producto']['disponible'], 3)
+        ReservaStock.objects.filter(pk=reserva.pk).update(expira=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.lote(self.clientes[1], 8)['errores'], [])
+        self.assertEqual(reservas.liberar_vencidas(), 1)
+        self.assertEqual(list(ReservaStock.objects.values_list('usuario_id', 'cantidad')), [(self.clientes[1].pk, 8)])
+        self.lote(self.clientes[1], 0)
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_compra_consume_reservas(self):
+        self.lote(self.clientes[0], 6)
+        self.lote(self.clientes[1], 4)
+        # Sin reserva vigente el segundo cliente compite por el disponible: 10 − 6 reservadas
+        ReservaStock.objects.filter(usuario=self.clientes[1]).delete()
+        CarritoItem.objects.filter(carrito__usuario=self.clientes[1]).update(cantidad=5)
+        with self.assertRaises(CompraError) as error:
+            procesar_compra(self.clientes[1])
+        self.assertEqual(error.exception.fallos[0]['stock'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = procesar_compra(self.clientes[0])
+        self.assertEqual(pedido.total, Decimal('179.40'))
+        self.assertFalse(ReservaStock.objects.filter(usuario=self.clientes[0]).exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 4)
+
+    def test_linea_reservada_de_producto_inactivo_falla_por_item(self):
+        self.lote(self.clientes[0], 3)
+        Producto.objects.filter(pk=self.producto.pk).update(activo=False)
+        with self.assertRaises(CompraError) as error:
+            procesar_compra(self.clientes[0])
+        self.assertEqual([fallo['motivo'] for fallo in error.exception.fallos], ['inactivo'])
+
+    @override_settings(RESERVA_CARRITO_SEGUNDOS=0)
+    def test_sin_reservas(self):
+        self.lote(self.clientes[0], 7)
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertEqual(self.lote(self.clientes[1], 8)['errores'], [])
+
+
+class LibroInventarioTests(CatalogoBaseTestCase):
+    """El stock solo cambia mediante movimientos del libro; las fotos permiten consultar el stock a una fecha."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        self.admin = crear_usuario('3888888888', is_staff=True, es_admin=True)
+        self.client.force_authenticate(self.admin)
+
+    def stock(self):
+        return Producto.objects.get(pk=self.producto.pk).stock
+
+    def test_compras_ventas_y_anulaciones_quedan_en_el_libro(self):
+        compra = Compra.objects.create(usuario=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            detalle = self.client.post('/api/admin/detalles-compra/', {
+                'compra': compra.pk, 'producto': self.producto.pk, 'cantidad': 5, 'precio_unitario': '12.00',
+            }, format='json').json()
+        self.assertEqual(self.stock(), 15)
+        self.client.patch(f"/api/admin/detalles-compra/{detalle['id']}/", {'cantidad': 8}, format='json')
+        self.assertEqual(self.stock(), 18)
+        CarritoItem.objects.create(carrito=Carrito.objects.create(usuario=self.usuarios[0]), producto=self.producto, cantidad=16)
+        with self.captureOnCommitCallbacks(execute=True):
+            procesar_compra(self.usuarios[0])
+        self.assertEqual(self.stock(), 2)
+        # Anular la compra retiraría 8 unidades de las 2 que quedan: se rechaza sin tocar nada
+        self.assertEqual(self.client.delete(f'/api/admin/compras/{compra.pk}/').status_code, 400)
+        self.assertTrue(Compra.objects.get(pk=compra.pk).activo)
+        self.assertEqual(list(MovimientoInventario.objects.order_by('id').values_list('tipo', 'cantidad')),
+                         [('ajuste', 10), ('compra', 5), ('compra', -5), ('compra', 8), ('venta', -16)])
+        self.assertEqual(movimientos.verificar(), [])
+
+    def test_fotos_y_stock_a_una_fecha(self):
+        inicio = timezone.now()
+        movimientos.ajuste(self.producto.pk, 4, nota='Conteo')
+        self.assertEqual(movimientos.tomar_fotos(timezone.now()), 1)
+        movimientos.ajuste(self.producto.pk, -6, nota='Merma')
+        with self.assertRaises(movimientos.StockInsuficiente):
+            movimientos.ajuste(self.producto.pk, -9)
+        self.assertEqual(self.stock(), 8)
+        self.assertEqual(movimientos.stock_en(self.producto.pk, inicio), 10)
+        self.assertEqual(movimientos.stock_en(self.producto.pk, timezone.now()), 8)
+
+    def test_foto_no_pierde_movimientos_confirmados_tarde(self):
+        # Un movimiento fechado al crearse pero confirmado después de la foto sigue contando
+        movimientos.tomar_fotos()
+        movimientos.registrar([MovimientoInventario(producto_id=self.producto.pk, tipo='ajuste', cantidad=3, fecha=timezone.now() - timedelta(minutes=1))])
+        self.assertEqual(movimientos.stock_en(self.producto.pk, timezone.now()), 13)
+        self.assertEqual(movimientos.verificar(), [])
+
+    def test_edicion_de_stock_en_el_admin_queda_en_el_libro(self):
+        producto = Producto.objects.get(pk=self.producto.pk)
+        formulario = modelform_factory(Producto, fields=['stock'])({'stock': 13}, instance=producto)
+        self.assertTrue(formulario.is_valid())
+        ProductoAdmin(Producto, admin.site).save_model(mock.Mock(user=self.admin), formulario.save(commit=False), formulario, True)
+        self.assertEqual(self.stock(), 13)
+        self.assertEqual(MovimientoInventario.objects.filter(tipo='ajuste').latest('id').cantidad, 3)
+        self.assertEqual(movimientos.verificar(), [])
+
+    def test_detalle_que_agota_el_producto_lo_retira_de_las_sugerencias(self):
+        pedido = Pedido.objects.create(usuario=self.usuarios[0], estado=EstadoVenta.objects.create(nombre='pendiente'), total='299.00')
+        self.client.force_authenticate(self.usuarios[0])
+        with mock.patch('tienda.sugerencias.registrar_cambio') as registrar, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/cliente/detalles-pedido/', {
+                'pedido': pedido.pk, 'producto': self.producto.pk, 'cantidad': 10, 'precio_unitario': '29.90',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Producto.objects.get(pk=self.producto.pk).activo)
+        registrar.assert_called_once_with('producto', self.producto.pk, self.producto.nombre, False)
+
+    def test_reconstruir_desde_el_historial(self):
+        compra = Compra.objects.create(usuario=self.admin)
+        DetalleCompra.objects.create(compra=compra, producto=self.producto, cantidad=7, precio_unitario='5.00')
+        pedido = Pedido.objects.create(usuario=self.usuarios[0], estado=EstadoVenta.objects.create(nombre='pendiente'), total='29.90')
+        DetallePedido.objects.create(pedido=pedido, producto=self.producto, cantidad=3, precio_unitario='29.90')
+        Producto.objects.filter(pk=self.producto.pk).update(stock=14)
+        self.assertEqual(len(movimientos.verificar()), 1)
+        salida = StringIO()
+        call_command('reconstruir_inventario', stdout=salida)
+        self.assertEqual(sorted(MovimientoInventario.objects.values_list('tipo', 'cantidad')), [('ajuste', 10), ('compra', 7), ('venta', -3)])
+        call_command('reconstruir_inventario', '--verificar', stdout=salida)
+        self.assertIn('coincide', salida.getvalue())
+
+
+class AcumuladosVentasTests(CatalogoBaseTestCase):
+    """Los acumulados diarios siguen cada pedido y coinciden con la reconstrucción desde el historial."""
+
+    def setUp(self):
+        super().setUp()
+        self.productos = self.crear_productos(2)
+        self.pendiente = EstadoVenta.objects.create(nombre='pendiente')
+        self.cancelado = EstadoVenta.objects.create(nombre='Cancelado')
+
+    def acumulados(self):
+        return (
+            sorted(EstadisticaVenta.objects.filter(total_ventas__gt=0).values_list('fecha', 'total_ventas', 'total_ingresos', 'unidades')),
+            sorted(VentaDiariaProducto.objects.filter(unidades__gt=0).values_list('fecha', 'producto_id', 'unidades', 'ingresos')),
+            sorted(VentaDiariaCliente.objects.filter(pedidos__gt=0).values_list('fecha', 'usuario_id', 'pedidos', 'total')),
+        )
+
+    def assertIgualAReconstruir(self):
+        incremental = self.acumulados()
+        call_command('recalcular_estadisticas', stdout=StringIO())
+        self.assertEqual(self.acumulados(), incremental)
+
+    def test_compra_cancelacion_y_reactivacion(self):
+        carrito_usuario = Carrito.objects.create(usuario=self.usuarios[0])
+        CarritoItem.objects.create(carrito=carrito_usuario, producto=self.productos[0], cantidad=2)
+        CarritoItem.objects.create(carrito=carrito_usuario, producto=self.productos[1], cantidad=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = procesar_compra(self.usuarios[0])
+        hoy = timezone.localdate()
+        self.assertEqual(self.acumulados(), (
+            [(hoy, 1, Decimal('89.70'), 3)],
+            [(hoy, self.productos[0].pk, 2, Decimal('59.80')), (hoy, self.productos[1].pk, 1, Decimal('29.90'))],
+            [(hoy, self.usuarios[0].pk, 1, Decimal('89.70'))],
+        ))
+        self.assertIgualAReconstruir()
+        pedido.estado = self.cancelado
+        pedido.save()
+        self.assertEqual(self.acumulados(), ([], [], []))
+        self.assertIgualAReconstruir()
+        pedido.estado = self.pendiente
+        pedido.save()
+        self.assertEqual(self.acumulados()[0], [(hoy, 1, Decimal('89.70'), 3)])
+        self.assertIgualAReconstruir()
+
+    def test_dia_local_cambios_de_lineas_y_borrado(self):
+        # 03:00 UTC del 2 de enero son las 22:00 del 1 de enero en Bogotá
+        pedido = Pedido.objects.create(usuario=self.usuarios[1], estado=self.pendiente, total='50.00',
+                                       creado=timezone.datetime(2024, 1, 2, 3, 0, tzinfo=timezone.utc))
+        detalle = DetallePedido.objects.create(pedido=pedido, producto=self.productos[0], cantidad=2, precio_unitario='25.00')
+        primero = timezone.datetime(2024, 1, 1).date()
+        self.assertEqual(self.acumulados()[0], [(primero, 1, Decimal('50.00'), 2)])
+        detalle.cantidad = 3
+        detalle.save()
+        self.assertEqual(self.acumulados()[1], [(primero, self.productos[0].pk, 3, Decimal('75.00'))])
+        pedido.creado = timezone.datetime(2024, 1, 2, 12, 0, tzinfo=timezone.utc)
+        pedido.save()
+        segundo = timezone.datetime(2024, 1, 2).date()
+        self.assertEqual(self.acumulados()[0], [(segundo, 1, Decimal('50.00'), 3)])
+        self.assertIgualAReconstruir()
+        pedido.delete()
+        self.assertEqual(self.acumulados(), ([], [], []))
+
+    def test_endpoints_de_estadisticas(self):
+        pedido = Pedido.objects.create(usuario=self.usuarios[0], estado=self.pendiente, total='29.90')
+        DetallePedido.objects.create(pedido=pedido, producto=self.productos[1], cantidad=1, precio_unitario='29.90')
+        admin = crear_usuario('3777777777', is_staff=True, es_admin=True)
+        self.client.force_authenticate(admin)
+        datos = self.client.get('/api/admin/stats/').json()
+        self.assertEqual(datos['hoy']['pedidos'], 1)
+        self.assertEqual(datos['ventas_por_dia'][str(timezone.localdate())], 29.9)
+        self.assertEqual(datos['productos_mas_vendidos'][0]['producto_id'], self.productos[1].pk)
+        self.assertEqual(datos['mejores_clientes'][0]['numero'], self.usuarios[0].numero)
+        self.client.force_authenticate(self.usuarios[0])
+        datos = self.client.get('/api/cliente/stats/').json()
+        self.assertEqual((datos['cantidad_pedidos'], datos['total_gastado']), (1, 29.9))
+        self.assertEqual(datos['historial'][0]['estado'], 'pendiente')
+
+
+class AnaliticaVentasTests(CatalogoBaseTestCase):
+    """Series por día, semana y mes en fechas de Bogotá; los períodos cerrados se sirven desde la caché."""
+
+    def setUp(self):
+        super().setUp()
+        self.producto = self.crear_productos(1)[0]
+        self.estado = EstadoVenta.objects.create(nombre='pendiente')
+        self.admin = crear_usuario('3777777777', is_staff=True, es_admin=True)
+        self.client.force_authenticate(self.admin)
+
+    def pedido(self, creado, total='10.00', cantidad=1):
+        pedido = Pedido.objects.create(usuario=self.usuarios[0], estado=self.estado, total=total, creado=creado)
+        DetallePedido.objects.create(pedido=pedido, producto=self.producto, cantidad=cantidad, precio_unitario=total)
+        return pedido
+
+    def test_semanas_en_hora_local(self):
+        # Lunes 8 de enero 04:00 UTC es aún el domingo 7 en Bogotá: cae en la semana del 1 de enero
+        self.pedido(timezone.datetime(2024, 1, 8, 4, 0, tzinfo=timezone.utc), cantidad=2)
+        self.pedido(timezone.datetime(2024, 1, 8, 6, 0, tzinfo=timezone.utc), total='5.00')
+        datos = self.client.get('/api/admin/analitica/ventas/?desde=2024-01-01&hasta=2024-01-14&periodo=semana').json()
+        self.assertEqual(datos['zona_horaria'], 'America/Bogota')
+        self.assertEqual([(fila['inicio'], fila['pedidos'], fila['ingresos'], fila['unidades']) for fila in datos['resultados']],
+                         [('2024-01-01', 1, 10.0, 2), ('2024-01-08', 1, 5.0, 1)])
+        self.assertEqual(datos['totales'], {'pedidos': 2, 'ingresos': 15.0, 'unidades': 3})
+        # Mes recortado al rango pedido
+        datos = self.client.get('/api/admin/analitica/ventas/?desde=2024-01-08&hasta=2024-02-10&periodo=mes').json()
+        self.assertEqual([(fila['inicio'], fila['pedidos']) for fila in datos['resultados']], [('2024-01-01', 1), ('2024-02-01', 0)])
+
+    def test_periodos_cerrados_en_cache_y_correcciones(self):
+        pedido = self.pedido(timezone.datetime(2024, 3, 5, 15, 0, tzinfo=timezone.utc))
+        desde, hasta = timezone.datetime(2024, 3, 1).date(), timezone.datetime(2024, 3, 31).date()
+        self.assertEqual(analitica.serie(desde, hasta, 'mes')[0]['pedidos'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(analitica.serie(desde, hasta, 'mes')[0]['pedidos'], 1)
+        # Cancelar el pedido tiempo después descarta los períodos de su día
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido.estado = EstadoVenta.objects.create(nombre='cancelado')
+            pedido.save()
+        self.assertEqual(analitica.serie(desde, hasta, 'mes')[0]['pedidos'], 0)
+        # El período en curso siempre se recalcula
+        hoy = timezone.localdate()
+        analitica.serie(hoy, hoy)
+        self.pedido(timezone.now())
+        self.assertEqual(analitica.serie(hoy, hoy)[0]['pedidos'], 1)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/api/admin/analitica/ventas/?periodo=anio').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/analitica/ventas/?desde=2024-02-01&hasta=2024-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/analitica/ventas/?desde=ayer').status_code, 400)
+        self.assertEqual(len(self.client.get('/api/admin/analitica/ventas/').json()['resultados']), 30)
+
+
+class RankingsVentasTests(CatalogoBaseTestCase):
+    """Los tableros se actualizan con cada pedido, sus ventanas se deslizan por día y coinciden con recalcular."""
+
+    def setUp(self):
+        super().setUp()
+        self.productos = self.crear_productos(3)
+        self.estado = EstadoVenta.objects.create(nombre='pendiente')
+        self.admin = crear_usuario('3777777777', is_staff=True, es_admin=True)
+        self.client.force_authenticate(self.admin)
+
+    def pedido(self, usuario, cantidades, creado=None):
+        pedido = Pedido.objects.create(usuario=usuario, estado=self.estado, total=sum(cantidades.values()) * Decimal('10.00'),
+                                       creado=creado or timezone.now())
+        for producto, cantidad in cantidades.items():
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad, precio_unitario='10.00')
+        return pedido
+
+    def tablero(self, nombre):
+        return [(fila.get('producto_id') or fila.get('usuario_id'), fila.get('unidades') or fila.get('total')) for fila in rankings.top(nombre)]
+
+    def posiciones(self):
+        return sorted(PosicionRanking.objects.filter(valor__gt=0).values_list('tablero', 'objeto_id', 'valor'))
+
+    def test_tableros_por_pedido_y_cancelacion(self):
+        a, b, c = self.productos
+        self.pedido(self.usuarios[0], {a: 2, b: 5})
+        cancelado = self.pedido(self.usuarios[1], {c: 9})
+        # Hace 10 días: entra en el histórico y en 30 días, no en 7
+        self.pedido(self.usuarios[1], {a: 4}, creado=timezone.now() - timedelta(days=10))
+        self.assertEqual(self.tablero('productos'), [(c.pk, 9), (a.pk, 6), (b.pk, 5)])
+        self.assertEqual(self.tablero('productos:7'), [(c.pk, 9), (b.pk, 5), (a.pk, 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelado.estado = EstadoVenta.objects.create(nombre='cancelado')
+            cancelado.save()
+        self.assertEqual(self.tablero('productos:30'), [(a.pk, 6), (b.pk, 5)])
+        self.assertEqual(self.tablero(f'categoria:{self.categoria.pk}'), [(a.pk, 6), (b.pk, 5)])
+        self.assertEqual(self.tablero('clientes'), [(self.usuarios[0].pk, 70.0), (self.usuarios[1].pk, 40.0)])
+        self.assertEqual(self.tablero('clientes:7'), [(self.usuarios[0].pk, 70.0)])
+        incremental = self.posiciones()
+        rankings.recalcular()
+        self.assertEqual(self.posiciones(), incremental)
+        # Top-k: k filas por el índice más una consulta de nombres
+        with self.assertNumQueries(2):
+            rankings.top(f'categoria:{self.categoria.pk}', 2)
+
+    def test_ventanas_se_deslizan_con_los_acumulados(self):
+        a, b, _ = self.productos
+        hoy = timezone.localdate()
+        self.pedido(self.usuarios[0], {a: 3}, creado=timezone.now() - timedelta(days=5))
+        self.pedido(self.usuarios[0], {b: 1})
+        self.assertEqual(self.tablero('productos:7'), [(a.pk, 3), (b.pk, 1)])
+        # Tres días después el pedido de hace 5 días sale de la ventana de 7 (se consulta la tabla: top() desliza a hoy)
+        rankings.deslizar(hoy + timedelta(days=3))
+        self.assertEqual(sorted(PosicionRanking.objects.filter(tablero='productos:7').values_list('objeto_id', 'valor')), [(b.pk, 1)])
+        self.assertEqual(sorted(PosicionRanking.objects.filter(tablero='productos:30').values_list('objeto_id', 'valor')), [(a.pk, 3), (b.pk, 1)])
+        rankings.deslizar(hoy + timedelta(days=40))
+        self.assertFalse(PosicionRanking.objects.filter(tablero__in=['productos:30', 'clientes:30']).exists())
+
+    def test_endpoint_y_orden_mas_vendidos_del_catalogo(self):
+        a, b, c = self.productos
+        self.pedido(self.usuarios[0], {b: 4, c: 1})
+        datos = self.client.get('/api/admin/rankings/?tablero=productos:30&limite=1').json()
+        self.assertEqual([fila['producto_id'] for fila in datos['resultados']], [b.pk])
+        self.assertEqual(self.client.get('/api/admin/rankings/?tablero=ventas').status_code, 400)
+        self.client.force_authenticate(None)
+        datos = self.client.get('/api/cliente/buscar/?ordering=-vendidos_total').json()
+        self.assertEqual([producto['id'] for producto in datos['results']], [b.pk, c.pk, a.pk])
+        self.assertNotIn('vendidos_total', datos['results'][0])
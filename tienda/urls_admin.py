@@ -4,7 +4,8 @@ from .views_admin import (
     CategoriaViewSet, SubcategoriaViewSet, ProductoViewSet,
     EstadoVentaViewSet, CompraViewSet, DetalleCompraViewSet,
     ComprasAdminView, AdminStatsView, DestacarProductoView, ReordenarImagenesView, SubirImagenesProductoView,
-    HistorialAccionAdminView, AccionesDisponiblesView, ImagenProductoViewSet
+    HistorialAccionAdminView, AccionesDisponiblesView, ImagenProductoViewSet,
+    CacheMetricasAdminView, AnaliticaVentasView, RankingsVentasView
 )
 
 # =========================
@@ -27,6 +28,10 @@ urlpatterns = [
     path('compras/', ComprasAdminView.as_view(), name='compras-admin'),
     # Estadísticas globales
     path('stats/', AdminStatsView.as_view(), name='stats-admin'),
+    path('analitica/ventas/', AnaliticaVentasView.as_view(), name='analitica-ventas'),
+    path('rankings/', RankingsVentasView.as_view(), name='rankings-ventas'),
+    # Métricas de la caché compartida
+    path('cache/', CacheMetricasAdminView.as_view(), name='cache-admin'),
     # Destacar productos
     path('productos/<int:pk>/destacar/', DestacarProductoView.as_view(), name='destacar-producto'),
     # Gestión avanzada de imágenes de productos
@@ -6,15 +6,15 @@ from rest_framework_simplejwt.views import (
 )
 from .views_cliente import (
     CustomTokenObtainPairView, RegistroUsuarioView, LoginView, LogoutView,
-    CartView, CartClearView, CarritoMigrarView, ComprarView,
-    PerfilUsuarioView, BusquedaProductoView, ProductosDestacadosView,
-    ComentarioForoView, LikeComentarioView, NotificacionListView, NotificacionDeleteView, NotificacionMarkReadView,
-    ComprasUsuarioView, ClienteStatsView,
+    CartView, CartClearView, CarritoMigrarView, CarritoResumenView, CarritoLoteView, ComprarView,
+    PerfilUsuarioView, BusquedaProductoView, SugerenciasBusquedaView, ProductosDestacadosView,
+    ComentarioForoView, LikeComentarioView, LikeProductoView, NotificacionListView, NotificacionDeleteView, NotificacionMarkReadView,
+    ComprasUsuarioView, FacturaPedidoView, ClienteStatsView,
     PedidoViewSet, DetallePedidoViewSet, ComentarioViewSet, CalificacionViewSet, LikeViewSet,
-    ImagenesProductoView,
+    ImagenesProductoView, ProductoDetalleView,
     RecuperarPasswordView, ResetPasswordView, CambiarPasswordView,
     HistorialAccionClienteView,
-    CategoriaPublicaListView, SubcategoriaPublicaListView, AllProductosView
+    CategoriaPublicaListView, CategoriaArbolView, SubcategoriaPublicaListView, AllProductosView
 )
 
 router = DefaultRouter()
@@ -37,6 +37,7 @@ urlpatterns = [
     path('acciones/', HistorialAccionClienteView.as_view(), name='acciones-cliente'),
     path('perfil/', PerfilUsuarioView.as_view(), name='perfil-usuario'),
     path('buscar/', BusquedaProductoView.as_view(), name='buscar-productos'),
+    path('buscar/sugerencias/', SugerenciasBusquedaView.as_view(), name='buscar-sugerencias'),
     path('productos/destacados/', ProductosDestacadosView.as_view(), name='productos-destacados'),
     path('comentarios/foro/', ComentarioForoView.as_view(), name='comentarios-foro'),
     path('comentarios/<int:comentario_id>/like/', LikeComentarioView.as_view(), name='like-comentario'),
@@ -44,17 +45,23 @@ urlpatterns = [
     path('notificaciones/<int:pk>/eliminar/', NotificacionDeleteView.as_view(), name='notificacion-eliminar'),
     path('notificaciones/<int:pk>/leer/', NotificacionMarkReadView.as_view(), name='notificacion-leer'),
     path('carrito/', CartView.as_view(), name='carrito'),
+    path('carrito/resumen/', CarritoResumenView.as_view(), name='carrito-resumen'),
     path('carrito/limpiar/', CartClearView.as_view(), name='carrito-limpiar'),
+    path('carrito/lote/', CarritoLoteView.as_view(), name='carrito-lote'),
     path('carrito/migrar/', CarritoMigrarView.as_view(), name='carrito-migrar'),
     path('comprar/', ComprarView.as_view(), name='comprar'),
     path('compras/', ComprasUsuarioView.as_view(), name='compras-usuario'),
+    path('pedidos/<int:pedido_id>/factura/', FacturaPedidoView.as_view(), name='factura-pedido'),
     path('stats/', ClienteStatsView.as_view(), name='stats-cliente'),
     path('productos/', AllProductosView.as_view(), name='productos-publicos'),
+    path('productos/<int:producto_id>/', ProductoDetalleView.as_view(), name='producto-detalle'),
+    path('productos/<int:producto_id>/like/', LikeProductoView.as_view(), name='like-producto'),
     path('productos/<int:producto_id>/imagenes/', ImagenesProductoView.as_view(), name='imagenes-producto'),
     path('', include(router.urls)),
 ]
 
 urlpatterns += [
     path('categorias/', CategoriaPublicaListView.as_view(), name='categorias-publicas'),
+    path('categorias/arbol/', CategoriaArbolView.as_view(), name='categorias-arbol'),
     path('categorias/<int:categoria_id>/subcategorias/', SubcategoriaPublicaListView.as_view(), name='subcategorias-publicas'),
 ]
\ No newline at end of file
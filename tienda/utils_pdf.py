@@ -1,25 +1,59 @@
+from hashlib import sha256
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+import json
+from django.core.files import File
+from django.db import transaction
 from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from tienda.models import Pedido, DetallePedido
+from tienda.models import Pedido, DetallePedido, Tarea
+from tienda.tareas import tarea, encolar
+from tienda.notificaciones import notificar_usuario
 import logging
 
 logger = logging.getLogger(__name__)
 
-def generar_pdf_pedido(pedido: Pedido):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
+# Cambiar al modificar el diseño del PDF: invalida todas las facturas almacenadas
+VERSION_FACTURA = 1
+CARPETA_FACTURAS = 'pedidos/pdf'
+
+
+def detalles_pedido(pedido):
+    """Detalles del pedido con su producto, en una sola consulta."""
+    return list(DetallePedido.objects.filter(pedido=pedido).select_related('producto').order_by('id'))
+
+
+def huella_pedido(pedido, detalles):
+    """Hash del contenido que aparece en la factura; identifica cada revisión del pedido."""
+    contenido = {
+        'version': VERSION_FACTURA,
+        'pedido': pedido.id,
+        'cliente': [pedido.usuario.nombre, pedido.usuario.apellido, pedido.usuario.numero],
+        'fecha': pedido.creado.isoformat(),
+        'detalles': [[d.producto.nombre, d.cantidad, str(d.precio_unitario)] for d in detalles],
+    }
+    return sha256(json.dumps(contenido, sort_keys=True).encode()).hexdigest()
+
+
+def ruta_factura(huella):
+    return f'{CARPETA_FACTURAS}/{huella[:2]}/{huella}.pdf'
+
+
+def _renderizar(pedido, detalles, destino):
+    p = canvas.Canvas(destino, pagesize=letter)
     width, height = letter
     y = height - 50
-    
+
     p.setFont("Helvetica-Bold", 16)
     p.drawString(50, y, f"Detalle del Pedido #{pedido.id}")
     y -= 30
     p.setFont("Helvetica", 12)
     p.drawString(50, y, f"Cliente: {pedido.usuario.nombre} {pedido.usuario.apellido} ({pedido.usuario.numero})")
     y -= 20
-    p.drawString(50, y, f"Fecha: {pedido.fecha}")
+    p.drawString(50, y, f"Fecha: {timezone.localtime(pedido.creado):%Y-%m-%d %H:%M}")
     y -= 30
     p.setFont("Helvetica-Bold", 12)
     p.drawString(50, y, "Producto")
@@ -29,14 +63,14 @@ def generar_pdf_pedido(pedido: Pedido):
     y -= 20
     p.setFont("Helvetica", 11)
     total = 0
-    for detalle in DetallePedido.objects.filter(pedido=pedido):
+    for detalle in detalles:
         if y < 100:
             p.showPage()
             y = height - 50
         p.drawString(50, y, detalle.producto.nombre)
         p.drawString(250, y, str(detalle.cantidad))
-        p.drawString(350, y, f"${detalle.precio:.2f}")
-        subtotal = detalle.precio * detalle.cantidad
+        p.drawString(350, y, f"${detalle.precio_unitario:.2f}")
+        subtotal = detalle.precio_unitario * detalle.cantidad
         p.drawString(450, y, f"${subtotal:.2f}")
         total += subtotal
         y -= 20
@@ -46,7 +80,72 @@ def generar_pdf_pedido(pedido: Pedido):
     p.drawString(450, y, f"${total:.2f}")
     p.showPage()
     p.save()
+    logger.info(f"PDF generado para pedido #{pedido.id}")
+
+
+def generar_pdf_pedido(pedido: Pedido):
+    buffer = BytesIO()
+    _renderizar(pedido, detalles_pedido(pedido), buffer)
     pdf = buffer.getvalue()
     buffer.close()
-    logger.info(f"PDF generado para pedido #{pedido.id}")
     return pdf
+
+
+def almacenar_factura(pedido):
+    """
+    Guarda la factura bajo la huella del contenido del pedido y la asigna a Pedido.pdf.
+    Si ya existe un PDF para esa huella no se vuelve a renderizar. Retorna la huella.
+    """
+    detalles = detalles_pedido(pedido)
+    huella = huella_pedido(pedido, detalles)
+    storage = pedido.pdf.storage
+    ruta = ruta_factura(huella)
+    if not storage.exists(ruta):
+        # El PDF se escribe a un temporal que pasa a disco si crece, sin copiar el buffer completo
+        with SpooledTemporaryFile(max_size=1024 * 1024) as temporal:
+            _renderizar(pedido, detalles, temporal)
+            temporal.seek(0)
+            ruta = storage.save(ruta, File(temporal))
+    # update() para no pisar cambios concurrentes del pedido (p. ej. el estado)
+    Pedido.objects.filter(pk=pedido.pk).update(pdf=ruta, factura_huella=huella, factura_estado='generada')
+    return huella
+
+
+def marcar_factura_fallida(pedido_id):
+    Pedido.objects.filter(pk=pedido_id).update(factura_estado='fallida')
+
+
+@tarea(max_intentos=5, al_fallar=marcar_factura_fallida)
+def generar_factura(pedido_id, notificar=True):
+    """Tarea en segundo plano: almacena la factura del pedido y avisa al cliente."""
+    pedido = Pedido.objects.select_related('usuario').get(pk=pedido_id)
+    almacenar_factura(pedido)
+    if notificar:
+        notificar_usuario(pedido.usuario, f'La factura de tu pedido #{pedido.id} está lista.', tipo='factura')
+
+
+def factura_vigente(pedido):
+    """True si el PDF almacenado corresponde al contenido actual del pedido (una consulta de detalles)."""
+    if pedido.factura_estado != 'generada' or not pedido.pdf:
+        return False
+    return pedido.factura_huella == huella_pedido(pedido, detalles_pedido(pedido)) and pedido.pdf.storage.exists(pedido.pdf.name)
+
+
+def solicitar_factura(pedido):
+    """Marca la factura como pendiente y la encola si no hay ya una tarea en curso para el pedido."""
+    with transaction.atomic():
+        Pedido.objects.filter(pk=pedido.pk).update(factura_estado='pendiente')
+        en_curso = Tarea.objects.filter(
+            funcion=f'{generar_factura.__module__}.{generar_factura.__qualname__}',
+            argumentos__pedido_id=pedido.pk,
+            estado__in=['pendiente', 'en_proceso'],
+        )
+        if not en_curso.exists():
+            encolar(generar_factura, pedido_id=pedido.pk, notificar=False)
+
+
+def url_factura(request, pedido):
+    """URL del endpoint de descarga (solo cuando la factura ya está generada)."""
+    if pedido.factura_estado != 'generada':
+        return None
+    return request.build_absolute_uri(reverse('factura-pedido', args=[pedido.id]))
@@ -1,12 +1,18 @@
 from rest_framework import generics, status, permissions, viewsets, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from .models import Usuario, Categoria, Subcategoria, Producto, EstadoVenta, Compra, DetalleCompra, Pedido, DetallePedido, Notificacion, HistorialAccion, ImagenProducto
+from .models import Usuario, Categoria, Subcategoria, Producto, EstadoVenta, Compra, DetalleCompra, Pedido, Notificacion, HistorialAccion, ImagenProducto, MovimientoInventario
 from .serializers import CategoriaSerializer, SubcategoriaSerializer, ProductoSerializer, EstadoVentaSerializer, CompraSerializer, DetalleCompraSerializer, PedidoSerializer, DetallePedidoSerializer, NotificacionSerializer, HistorialAccionSerializer, ImagenProductoSerializer
-from .utils_pdf import generar_pdf_pedido
+from .utils_pdf import generar_pdf_pedido, url_factura
+from .catalogo import invalidar_catalogo
+from .paginacion import KeysetPagination
+from .campos import actualizar_imagen_principal
+from . import resultados, lectura, movimientos, stats, analitica, rankings
+from django.db import models, transaction
+from django.core.cache import caches
 from django.http import HttpResponse
 from django.utils import timezone
+from datetime import date, timedelta
 import logging
 logger = logging.getLogger(__name__)
 from django.core.exceptions import PermissionDenied
@@ -42,7 +48,9 @@ class ProductoViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAdminUser]
     queryset = Producto.objects.all()
     def get_queryset(self):
-        return Producto.objects.filter(activo=True, stock__gt=0, categoria__activo=True, subcategoria__activo=True)
+        return Producto.objects.filter(
+            activo=True, stock__gt=0, subcategoria__activa=True, subcategoria__categoria__activa=True
+        ).para_catalogo().order_by('-fecha_creacion')
     def perform_create(self, serializer):
         serializer.save(usuario=self.request.user)
         logger.info(f"Producto creado por usuario {self.request.user.numero}")
@@ -51,7 +59,11 @@ class ProductoViewSet(viewsets.ModelViewSet):
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó editar producto ajeno #{instance.id}")
             raise PermissionDenied("Solo puedes editar tus propios productos.")
-        serializer.save()
+        stock_anterior = instance.stock
+        with transaction.atomic():
+            producto = serializer.save()
+            # La edición directa del stock queda en el libro como ajuste
+            movimientos.ajuste(producto.pk, producto.stock - stock_anterior, self.request.user, 'Edición de producto', actualizar_stock=False)
     def perform_destroy(self, instance):
         if instance.usuario != self.request.user and not getattr(self.request.user, 'es_admin', False):
             logger.warning(f"Usuario {self.request.user.numero} intentó eliminar pedido ajeno #{instance.id}")
@@ -112,13 +124,29 @@ class CompraViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         if not getattr(self.request.user, 'es_admin', False):
             raise PermissionDenied("Solo el administrador puede eliminar compras.")
-        instance.activo = False
-        instance.save()
+        with transaction.atomic():
+            instance.activo = False
+            instance.save()
+            # Anular la compra retira del inventario lo que había ingresado
+            try:
+                movimientos.compra(instance.detalles.all(), -1, self.request.user, f'Compra #{instance.id} anulada')
+            except movimientos.StockInsuficiente as e:
+                raise serializers.ValidationError({'error': f'No hay stock suficiente para anular la compra (productos {sorted(e.productos)}).'})
         logger.info(f"Compra desactivada por admin {self.request.user.numero}")
 class DetalleCompraViewSet(viewsets.ModelViewSet):
     serializer_class = DetalleCompraSerializer
     queryset = DetalleCompra.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    def _registrar(self, cambios, nota):
+        """Registra en el libro (detalle, signo) de compras activas en un solo ajuste de stock."""
+        try:
+            movimientos.registrar([
+                MovimientoInventario(producto_id=detalle.producto_id, tipo='compra', cantidad=signo * detalle.cantidad,
+                                     detalle_compra=detalle, usuario=self.request.user, nota=nota)
+                for detalle, signo in cambios if detalle.compra.activo
+            ])
+        except movimientos.StockInsuficiente:
+            raise serializers.ValidationError({'error': 'No hay stock suficiente para retirar las unidades de esta compra.'})
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [permissions.IsAuthenticated()]
@@ -132,23 +160,32 @@ class DetalleCompraViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         if not getattr(self.request.user, 'es_admin', False):
             raise PermissionDenied("Solo el administrador puede añadir detalles de compra.")
-        serializer.save()
+        with transaction.atomic():
+            self._registrar([(serializer.save(), 1)], '')
         logger.info(f"Detalle de compra registrado por admin {self.request.user.numero}")
     def perform_update(self, serializer):
         if not getattr(self.request.user, 'es_admin', False):
             raise PermissionDenied("Solo el administrador puede editar detalles de compra.")
-        serializer.save()
+        with transaction.atomic():
+            anterior = DetalleCompra.objects.select_for_update().select_related('compra').get(pk=serializer.instance.pk)
+            detalle = serializer.save()
+            cambio = (anterior.producto_id, anterior.cantidad, anterior.compra.activo) != (detalle.producto_id, detalle.cantidad, detalle.compra.activo)
+            if cambio:
+                # El libro no se edita: se revierte la entrada anterior y se registra la nueva
+                self._registrar([(anterior, -1), (detalle, 1)], 'Corrección de detalle de compra')
         logger.info(f"Detalle de compra actualizado por admin {self.request.user.numero}")
     def perform_destroy(self, instance):
         if not getattr(self.request.user, 'es_admin', False):
             raise PermissionDenied("Solo el administrador puede eliminar detalles de compra.")
-        instance.delete()
+        with transaction.atomic():
+            self._registrar([(instance, -1)], f'Detalle de compra #{instance.id} eliminado')
+            instance.delete()
         logger.info(f"Detalle de compra eliminado por admin {self.request.user.numero}")
 # Stats y gestión global admin
 class ComprasAdminView(APIView):
     permission_classes = [permissions.IsAdminUser]
     def get(self, request):
-        pedidos = Pedido.objects.all().order_by('-fecha')
+        pedidos = Pedido.objects.select_related('usuario', 'estado').prefetch_related('detalles__producto').order_by('-creado')
         usuario = request.query_params.get('usuario')
         estado = request.query_params.get('estado')
         fecha_inicio = request.query_params.get('fecha_inicio')
@@ -158,22 +195,22 @@ class ComprasAdminView(APIView):
         if estado:
             pedidos = pedidos.filter(estado=estado)
         if fecha_inicio:
-            pedidos = pedidos.filter(fecha__gte=fecha_inicio)
+            pedidos = pedidos.filter(creado__gte=fecha_inicio)
         if fecha_fin:
-            pedidos = pedidos.filter(fecha__lte=fecha_fin)
-        paginator = PageNumberPagination()
-        paginator.page_size = 20
+            pedidos = pedidos.filter(creado__lte=fecha_fin)
+        paginator = KeysetPagination()
         page = paginator.paginate_queryset(pedidos, request)
         data = []
         for pedido in page:
-            detalles = DetallePedido.objects.filter(pedido=pedido)
+            detalles = pedido.detalles.all()
             data.append({
                 'id': pedido.id,
                 'usuario': pedido.usuario.numero,
-                'fecha': pedido.fecha,
-                'estado': pedido.estado,
+                'fecha': pedido.creado,
+                'estado': pedido.estado.nombre,
                 'total': float(pedido.total),
-                'factura_url': pedido.factura.url if pedido.factura else None,
+                'factura_estado': pedido.factura_estado,
+                'factura_url': url_factura(request, pedido),
                 'detalles': [
                     {
                         'producto': d.producto.nombre,
@@ -186,8 +223,77 @@ class ComprasAdminView(APIView):
 class AdminStatsView(APIView):
     permission_classes = [permissions.IsAdminUser]
     def get(self, request):
-        # Implementa tu lógica de stats globales aquí
-        return Response({'stats': 'Estadísticas globales'})
+        # Todo sale de los acumulados diarios (tienda.acumulados): el costo no crece con el historial de pedidos
+        return Response({
+            'hoy': stats.resumen_dia(),
+            'ventas_por_dia': stats.ventas_por_dia(),
+            'productos_mas_vendidos': stats.productos_mas_vendidos(),
+            'mejores_clientes': stats.mejores_clientes(),
+        })
+class AnaliticaVentasView(APIView):
+    """
+    Ingresos, pedidos y unidades por período en fechas locales de la tienda.
+    Parámetros: desde, hasta (AAAA-MM-DD; por defecto los últimos 30 días) y periodo (dia, semana o mes).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    def get(self, request):
+        hoy = timezone.localdate()
+        try:
+            hasta = date.fromisoformat(request.query_params['hasta']) if request.query_params.get('hasta') else hoy
+            desde = date.fromisoformat(request.query_params['desde']) if request.query_params.get('desde') else hasta - timedelta(days=29)
+        except ValueError:
+            return Response({'error': 'Las fechas deben tener el formato AAAA-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        periodo = request.query_params.get('periodo', 'dia')
+        try:
+            filas = analitica.serie(desde, hasta, periodo)
+        except analitica.AnaliticaError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        def formato(fila):
+            return {**fila, 'ingresos': float(fila['ingresos'])}
+        return Response({
+            'periodo': periodo,
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'zona_horaria': timezone.get_current_timezone_name(),
+            'resultados': [formato(fila) for fila in filas],
+            'totales': formato(analitica.totales(filas)),
+        })
+class RankingsVentasView(APIView):
+    """
+    Top-k de un tablero de ventas: productos, productos:7, productos:30, categoria:<id>, clientes,
+    clientes:7 o clientes:30 (parámetros tablero y limite).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    def get(self, request):
+        tablero = request.query_params.get('tablero', 'productos')
+        try:
+            limite = int(request.query_params.get('limite', 10))
+            return Response({'tablero': tablero, 'resultados': rankings.top(tablero, limite)})
+        except ValueError:
+            return Response({'error': 'limite debe ser un entero.'}, status=status.HTTP_400_BAD_REQUEST)
+        except rankings.RankingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+class CacheMetricasAdminView(APIView):
+    """
+    Backend de caché en uso, contadores de aciertos/fallos/escrituras/desalojos por espacio de nombres y
+    contadores por consulta normalizada de la caché de resultados (búsqueda y destacados).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    def get(self, request):
+        backend = caches['default']
+        metricas = backend.metricas() if hasattr(backend, 'metricas') else {}
+        return Response({
+            'backend': f'{type(backend).__module__}.{type(backend).__name__}',
+            'espacios': metricas,
+            'consultas': resultados.metricas(),
+        })
+    def delete(self, request):
+        backend = caches['default']
+        if hasattr(backend, 'reiniciar_metricas'):
+            backend.reiniciar_metricas()
+        resultados.reiniciar_metricas()
+        logger.info(f"Métricas de caché reiniciadas por admin {request.user.numero}")
+        return Response({'success': 'Métricas de caché reiniciadas.'})
 class DestacarProductoView(APIView):
     permission_classes = [permissions.IsAdminUser]
     def patch(self, request, pk):
@@ -248,8 +354,11 @@ class ReordenarImagenesView(APIView):
         ids_solicitados = set(orden_imagenes)
         if not ids_solicitados.issubset(ids_existentes):
             return Response({'error': 'Algunos IDs de imágenes no existen o no pertenecen al producto.'}, status=status.HTTP_400_BAD_REQUEST)
-        for orden, imagen_id in enumerate(orden_imagenes):
-            ImagenProducto.objects.filter(id=imagen_id, producto=producto).update(orden=orden)
+        with transaction.atomic():
+            for orden, imagen_id in enumerate(orden_imagenes):
+                ImagenProducto.objects.filter(id=imagen_id, producto=producto).update(orden=orden)
+            actualizar_imagen_principal([producto.pk])
+            invalidar_catalogo()
         logger.info(f"Imágenes del producto {producto.nombre} reordenadas por {request.user.numero}")
         imagenes_actualizadas = ImagenProducto.objects.filter(producto=producto).order_by('orden')
         serializer = ImagenProductoSerializer(imagenes_actualizadas, many=True)
@@ -297,7 +406,7 @@ class SubirImagenesProductoView(APIView):
 class HistorialAccionAdminView(generics.ListAPIView):
     serializer_class = HistorialAccionSerializer
     permission_classes = [permissions.IsAdminUser]
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     def get_queryset(self):
         qs = HistorialAccion.objects.all().order_by('-fecha')
         usuario = self.request.query_params.get('usuario')
@@ -307,6 +416,9 @@ class HistorialAccionAdminView(generics.ListAPIView):
         if accion:
             qs = qs.filter(accion=accion)
         return qs
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(lectura.historial.valores(self.get_queryset()))
+        return self.get_paginated_response(lectura.historial.convertir(page))
     
 class AccionesDisponiblesView(APIView):
     permission_classes = [permissions.IsAdminUser]
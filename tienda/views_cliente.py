@@ -1,23 +1,28 @@
 from rest_framework import generics, status, permissions, viewsets, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .models import Usuario, Producto, Pedido, DetallePedido, Comentario, Calificacion, Like, Carrito, CarritoItem, LikeComentario, Notificacion, HistorialAccion, ImagenProducto, Categoria, Subcategoria
+from .models import Usuario, Producto, Pedido, DetallePedido, Comentario, Calificacion, Like, Notificacion, HistorialAccion, ImagenProducto, Categoria, Subcategoria
 from .serializers import (
     UsuarioSerializer, UsuarioPerfilSerializer, RegistroUsuarioSerializer, 
     LoginSerializer, ProductoSerializer, PedidoSerializer, DetallePedidoSerializer, 
     ComentarioSerializer, CalificacionSerializer, LikeSerializer, NotificacionSerializer, 
-    HistorialAccionSerializer, CarritoSerializer, ImagenProductoSerializer, 
+    HistorialAccionSerializer, ImagenProductoSerializer, 
     CategoriaSerializer, SubcategoriaSerializer, CustomTokenObtainPairSerializer,
     CategoriaPublicaSerializer,
 )
-from .cart import Cart
-from .utils_pdf import generar_pdf_pedido
+from . import contadores, busqueda, sugerencias, facetas, resultados, lectura, ficha, foro, likes, carrito, movimientos, stats
+from .catalogo import respuesta_catalogo, arbol_categorias, version_producto, invalidar_producto
+from .paginacion import KeysetPagination, reenlazar
+from .campos import campos_solicitados, aplicar_campos
+from .checkout import procesar_compra, CompraError
+from .utils_pdf import factura_vigente, solicitar_factura, url_factura
+from .descargas import respuesta_archivo
 from django.contrib.auth import login, logout
 from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
 import random
 import logging
 from django.core.exceptions import PermissionDenied
@@ -25,8 +30,8 @@ logger = logging.getLogger(__name__)
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 from django.http import HttpResponse
-from django.db.models import Count, Avg
-from django.db import models
+from django.db.models import Count
+from django.db import models, transaction
 
 # Vista personalizada para JWT
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -98,7 +103,7 @@ class RecuperarPasswordView(APIView):
         except Usuario.DoesNotExist:
             return Response({'error': 'Usuario no encontrado.'}, status=404)
         codigo = str(random.randint(100000, 999999))
-        cache.set(f"recuperar_{numero}", codigo, timeout=300)
+        cache.set(f"recuperar:{numero}", codigo)
         logger.info(f"[RECUPERACIÓN] Código para {numero}: {codigo}")
         HistorialAccion.objects.create(usuario=user, accion='solicitud recuperación', detalle=f'Código: {codigo}', ip=request.META.get('REMOTE_ADDR'))
         return Response({'success': 'Código enviado (simulado en log/servidor).'})
@@ -109,7 +114,7 @@ class ResetPasswordView(APIView):
         numero = request.data.get('numero')
         codigo = request.data.get('codigo')
         nueva = request.data.get('nueva_password')
-        real = cache.get(f"recuperar_{numero}")
+        real = cache.get(f"recuperar:{numero}")
         try:
             user = Usuario.objects.get(numero=numero)
         except Usuario.DoesNotExist:
@@ -118,7 +123,7 @@ class ResetPasswordView(APIView):
             return Response({'error': 'Código inválido o expirado.'}, status=400)
         user.set_password(nueva)
         user.save()
-        cache.delete(f"recuperar_{numero}")
+        cache.delete(f"recuperar:{numero}")
         HistorialAccion.objects.create(usuario=user, accion='reset password', ip=request.META.get('REMOTE_ADDR'))
         return Response({'success': 'Contraseña restablecida correctamente.'})
 
@@ -161,77 +166,70 @@ class PerfilUsuarioView(APIView):
         logger.info(f"Usuario {request.user.numero} desactivó su cuenta.")
         return Response({'success': 'Cuenta desactivada.'})
 
-# Carrito de compras en sesión
+# Carrito de compras persistente (ver tienda.carrito)
 class CartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request):
-        carrito, _ = Carrito.objects.get_or_create(usuario=request.user)
-        serializer = CarritoSerializer(carrito)
         logger.info(f"Usuario {request.user.numero} consultó su carrito persistente.")
-        return Response(serializer.data)
+        return Response(carrito.leer(request.user.id))
     def post(self, request):
         producto_id = request.data.get('producto_id')
-        cantidad = int(request.data.get('cantidad', 1))
-        carrito, _ = Carrito.objects.get_or_create(usuario=request.user)
         try:
-            producto = Producto.objects.get(pk=producto_id, activo=True)
-            if producto.stock < cantidad:
-                return Response({'error': f'Solo hay {producto.stock} unidades disponibles.'}, status=400)
-            item, created = CarritoItem.objects.get_or_create(carrito=carrito, producto=producto)
-            if not created:
-                item.cantidad += cantidad
-            else:
-                item.cantidad = cantidad
-            item.save()
-            logger.info(f"Producto {producto_id} añadido al carrito persistente de {request.user.numero}")
-            return Response({'success': 'Producto añadido al carrito.'})
-        except Producto.DoesNotExist:
-            logger.error(f"Producto {producto_id} no existe o está inactivo.")
-            return Response({'error': 'Producto no encontrado.'}, status=404)
+            cantidad = int(request.data.get('cantidad', 1))
+            carrito.agregar(request.user, producto_id, cantidad)
+        except carrito.CarritoError as e:
+            logger.error(f"Producto {producto_id} no añadido al carrito de {request.user.numero}: {e.mensaje}")
+            return Response({'error': e.mensaje}, status=e.estado)
         except Exception as e:
             logger.error(f"Error añadiendo producto al carrito persistente: {e}")
             return Response({'error': str(e)}, status=400)
+        logger.info(f"Producto {producto_id} añadido al carrito persistente de {request.user.numero}")
+        return Response({'success': 'Producto añadido al carrito.'})
     def delete(self, request):
         producto_id = request.data.get('producto_id')
-        carrito, _ = Carrito.objects.get_or_create(usuario=request.user)
-        try:
-            item = CarritoItem.objects.get(carrito=carrito, producto_id=producto_id)
-            item.delete()
-            logger.info(f"Producto {producto_id} eliminado del carrito persistente de {request.user.numero}")
-            return Response({'success': 'Producto eliminado del carrito.'})
-        except CarritoItem.DoesNotExist:
+        if not carrito.quitar(request.user, producto_id):
             return Response({'error': 'Producto no encontrado en el carrito.'}, status=404)
+        logger.info(f"Producto {producto_id} eliminado del carrito persistente de {request.user.numero}")
+        return Response({'success': 'Producto eliminado del carrito.'})
+
+class CarritoResumenView(APIView):
+    """Líneas, unidades y total para el contador del encabezado (desde caché)."""
+    permission_classes = [permissions.IsAuthenticated]
+    def get(self, request):
+        return Response(carrito.resumen(request.user.id))
+
+class CarritoLoteView(APIView):
+    """Varios cambios de carrito en una solicitud: {"operaciones": [{producto_id, cantidad, modo: add|set|remove}]}."""
+    permission_classes = [permissions.IsAuthenticated]
+    def post(self, request):
+        operaciones = request.data.get('operaciones', [])
+        if not isinstance(operaciones, list):
+            return Response({'error': 'operaciones debe ser una lista.'}, status=400)
+        try:
+            errores = carrito.aplicar(request.user, operaciones)
+        except carrito.CarritoError as e:
+            return Response({'error': e.mensaje}, status=e.estado)
+        return Response({'carrito': carrito.leer(request.user.id), 'errores': errores})
 
 class CarritoMigrarView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
         items = request.data.get('items', [])
-        carrito, _ = Carrito.objects.get_or_create(usuario=request.user)
-        errores = []
-        for entry in items:
-            producto_id = entry.get('producto_id')
-            cantidad = int(entry.get('cantidad', 1))
-            try:
-                producto = Producto.objects.get(pk=producto_id, activo=True)
-                if producto.stock < cantidad:
-                    errores.append({'producto_id': producto_id, 'error': f'Solo hay {producto.stock} disponibles.'})
-                    continue
-                item, created = CarritoItem.objects.get_or_create(carrito=carrito, producto=producto)
-                if not created:
-                    item.cantidad += cantidad
-                else:
-                    item.cantidad = cantidad
-                item.save()
-            except Producto.DoesNotExist:
-                errores.append({'producto_id': producto_id, 'error': 'Producto no encontrado o inactivo.'})
-        serializer = CarritoSerializer(carrito)
+        if not isinstance(items, list):
+            return Response({'error': 'items debe ser una lista.'}, status=400)
+        # Cada ítem de LocalStorage se suma a lo que ya tenga el carrito persistente
+        operaciones = [dict(entry, modo='add') if isinstance(entry, dict) else entry for entry in items]
+        try:
+            errores = carrito.aplicar(request.user, operaciones)
+        except carrito.CarritoError as e:
+            return Response({'error': e.mensaje}, status=e.estado)
         logger.info(f"Carrito migrado desde LocalStorage para usuario {request.user.numero}")
-        return Response({'carrito': serializer.data, 'errores': errores})
+        return Response({'carrito': carrito.leer(request.user.id), 'errores': errores})
 
 class CartClearView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
-        Cart(request).clear()
+        carrito.vaciar(request.user)
         logger.info(f"Carrito limpiado por {request.user.numero}")
         return Response({'success': 'Carrito limpiado.'})
 
@@ -239,7 +237,7 @@ class CartClearView(APIView):
 class NotificacionListView(generics.ListAPIView):
     serializer_class = NotificacionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     def get_queryset(self):
         qs = Notificacion.objects.filter(usuario=self.request.user, eliminada=False).order_by('-creada')
         leida = self.request.query_params.get('leida')
@@ -249,6 +247,10 @@ class NotificacionListView(generics.ListAPIView):
         if tipo:
             qs = qs.filter(tipo=tipo)
         return qs
+    def list(self, request, *args, **kwargs):
+        # Lectura rápida (values + conversores); NotificacionSerializer queda para las escrituras
+        page = self.paginate_queryset(lectura.notificaciones.valores(self.get_queryset()))
+        return self.get_paginated_response(lectura.notificaciones.convertir(page))
 class NotificacionDeleteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def delete(self, request, pk):
@@ -268,22 +270,52 @@ class NotificacionMarkReadView(APIView):
         noti.save()
         return Response({'success': 'Notificación marcada como leída.'})
 
+def _ajustar_resenas_por_cambio(anterior, comentario):
+    """Ajusta el contador de reseñas activas tras editar un comentario (puede cambiar de producto o de estado)."""
+    producto_anterior, activo_anterior = anterior
+    if activo_anterior:
+        contadores.ajustar_resenas(producto_anterior, -1)
+    if comentario.activo:
+        contadores.ajustar_resenas(comentario.producto_id, 1)
+
 # Foro de comentarios (comentarios, respuestas, edición, eliminación, likes)
+class ForoPagination(KeysetPagination):
+    page_size = foro.HILOS_POR_PAGINA
+    max_page_size = 50
+
 class ComentarioForoView(APIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     def get(self, request):
-        producto_id = request.query_params.get('producto')
+        """
+        ?producto=<id>: hilos del producto paginados por comentario raíz.
+        ?hilo=<id>: continuación de un hilo a partir de un comentario (enlace `mas_respuestas`).
+        Sin parámetros: hilos más recientes de toda la tienda.
+        """
+        try:
+            producto_id = int(request.query_params['producto']) if request.query_params.get('producto') else None
+            hilo_id = int(request.query_params['hilo']) if request.query_params.get('hilo') else None
+        except ValueError:
+            return Response({'error': 'Parámetros inválidos.'}, status=400)
+        if hilo_id:
+            nodo = foro.hilo(hilo_id)
+            if nodo is None:
+                return Response({'error': 'Comentario no encontrado'}, status=404)
+            return Response(nodo)
+        paginator = ForoPagination()
         if producto_id:
-            comentarios = Comentario.objects.filter(producto_id=producto_id, comentario_padre=None, activo=True)
+            page = paginator.paginate_list(foro.hilos_producto(producto_id), request)
         else:
-            comentarios = Comentario.objects.filter(comentario_padre=None, activo=True)
-        return Response(ComentarioSerializer(comentarios, many=True).data)
+            page = foro.cargar_respuestas(foro.nodos(paginator.paginate_queryset(foro.comentarios_raiz(), request)))
+        return paginator.get_paginated_response(page)
     def post(self, request):
         data = request.data.copy()
         data['usuario'] = request.user.id
         serializer = ComentarioSerializer(data=data)
         if serializer.is_valid():
-            comentario = serializer.save()
+            with transaction.atomic():
+                comentario = serializer.save()
+                if comentario.activo:
+                    contadores.ajustar_resenas(comentario.producto_id, 1)
             return Response(ComentarioSerializer(comentario).data, status=201)
         return Response(serializer.errors, status=400)
     def put(self, request):
@@ -293,7 +325,10 @@ class ComentarioForoView(APIView):
             return Response({'error': 'No autorizado o comentario no existe.'}, status=403)
         serializer = ComentarioSerializer(comentario, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                anterior = (comentario.producto_id, comentario.activo)
+                comentario = serializer.save()
+                _ajustar_resenas_por_cambio(anterior, comentario)
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
     def delete(self, request):
@@ -301,21 +336,34 @@ class ComentarioForoView(APIView):
         comentario = Comentario.objects.filter(id=comentario_id, usuario=request.user, activo=True).first()
         if not comentario:
             return Response({'error': 'No autorizado o comentario no existe.'}, status=403)
-        comentario.activo = False
-        comentario.save()
+        with transaction.atomic():
+            comentario.activo = False
+            comentario.save()
+            contadores.ajustar_resenas(comentario.producto_id, -1)
         return Response({'success': 'Comentario eliminado.'})
+def _estado_like(request):
+    valor = request.data.get('like')
+    if valor is None:
+        return None
+    return valor in (True, 1, '1', 'true', 'True')
+
 class LikeComentarioView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request, comentario_id):
         comentario = Comentario.objects.filter(id=comentario_id, activo=True).first()
         if not comentario:
             return Response({'error': 'Comentario no encontrado'}, status=404)
-        like, created = LikeComentario.objects.get_or_create(usuario=request.user, comentario=comentario)
-        if created:
-            return Response({'success': 'Like agregado.'})
-        else:
-            like.delete()
-            return Response({'success': 'Like eliminado.'})
+        # Sin `like` en el cuerpo alterna; con like=true/false fija el estado (idempotente)
+        tiene_like = likes.like_comentario(request.user.id, comentario, _estado_like(request))
+        return Response({'success': 'Like agregado.' if tiene_like else 'Like eliminado.', 'like': tiene_like})
+
+class LikeProductoView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    def post(self, request, producto_id):
+        if not Producto.objects.filter(id=producto_id, activo=True).exists():
+            return Response({'error': 'Producto no encontrado'}, status=404)
+        tiene_like = likes.like_producto(request.user.id, producto_id, _estado_like(request))
+        return Response({'success': 'Like agregado.' if tiene_like else 'Like eliminado.', 'like': tiene_like})
 
 # CRUD de comentarios, calificaciones y likes (solo propios)
 class ComentarioViewSet(viewsets.ModelViewSet):
@@ -324,20 +372,35 @@ class ComentarioViewSet(viewsets.ModelViewSet):
     queryset = Comentario.objects.all()
     def get_queryset(self):
         return Comentario.objects.filter(producto__activo=True)
+    def list(self, request, *args, **kwargs):
+        # Mismo armado que el foro: respuestas de toda la página nivel por nivel
+        queryset = self.get_queryset().order_by('-creado', '-id')
+        page = self.paginate_queryset(lectura.comentarios.valores(queryset))
+        return self.get_paginated_response(foro.cargar_respuestas(foro.nodos(page)))
     def perform_create(self, serializer):
-        comentario = serializer.save(usuario=self.request.user)
+        with transaction.atomic():
+            comentario = serializer.save(usuario=self.request.user)
+            if comentario.activo:
+                contadores.ajustar_resenas(comentario.producto_id, 1)
         logger.info(f"Comentario creado por usuario {self.request.user.numero}")
     def perform_update(self, serializer):
         instance = self.get_object()
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó editar comentario ajeno #{instance.id}")
             raise PermissionDenied("Solo puedes editar tus propios comentarios.")
-        serializer.save()
+        with transaction.atomic():
+            anterior = (instance.producto_id, instance.activo)
+            comentario = serializer.save()
+            _ajustar_resenas_por_cambio(anterior, comentario)
     def perform_destroy(self, instance):
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó eliminar comentario ajeno #{instance.id}")
             raise PermissionDenied("Solo puedes eliminar tus propios comentarios.")
-        instance.delete()
+        with transaction.atomic():
+            producto_id = instance.producto_id
+            instance.delete()
+            # El borrado arrastra las respuestas en cascada: se recuenta el producto completo
+            contadores.recalcular_contadores([producto_id])
 class CalificacionViewSet(viewsets.ModelViewSet):
     serializer_class = CalificacionSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -345,19 +408,30 @@ class CalificacionViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Calificacion.objects.filter(producto__activo=True)
     def perform_create(self, serializer):
-        calificacion = serializer.save(usuario=self.request.user)
+        with transaction.atomic():
+            calificacion = serializer.save(usuario=self.request.user)
+            contadores.ajustar_calificaciones(calificacion.producto_id, calificacion.valor, 1)
         logger.info(f"Calificación creada por usuario {self.request.user.numero}")
     def perform_update(self, serializer):
         instance = self.get_object()
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó editar calificación ajena #{instance.id}")
             raise PermissionDenied("Solo puedes editar tus propias calificaciones.")
-        serializer.save()
+        with transaction.atomic():
+            producto_anterior, valor_anterior = instance.producto_id, instance.valor
+            calificacion = serializer.save()
+            if calificacion.producto_id == producto_anterior:
+                contadores.ajustar_calificaciones(producto_anterior, calificacion.valor - valor_anterior)
+            else:
+                contadores.ajustar_calificaciones(producto_anterior, -valor_anterior, -1)
+                contadores.ajustar_calificaciones(calificacion.producto_id, calificacion.valor, 1)
     def perform_destroy(self, instance):
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó eliminar calificación ajena #{instance.id}")
             raise PermissionDenied("Solo puedes eliminar tus propias calificaciones.")
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            contadores.ajustar_calificaciones(instance.producto_id, -instance.valor, -1)
 class LikeViewSet(viewsets.ModelViewSet):
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -365,64 +439,45 @@ class LikeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Like.objects.filter(producto__activo=True)
     def perform_create(self, serializer):
-        like = serializer.save(usuario=self.request.user)
+        producto = serializer.validated_data['producto']
+        likes.like_producto(self.request.user.id, producto.id, True)
+        serializer.instance = Like.objects.get(usuario=self.request.user, producto=producto)
         logger.info(f"Like creado por usuario {self.request.user.numero}")
     def perform_update(self, serializer):
         instance = self.get_object()
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó editar like ajeno #{instance.id}")
             raise PermissionDenied("Solo puedes editar tus propios likes.")
-        serializer.save()
+        with transaction.atomic():
+            producto_anterior = instance.producto_id
+            like = serializer.save()
+            if like.producto_id != producto_anterior:
+                contadores.ajustar_likes(producto_anterior, -1)
+                contadores.ajustar_likes(like.producto_id, 1)
     def perform_destroy(self, instance):
         if instance.usuario != self.request.user:
             logger.warning(f"Usuario {self.request.user.numero} intentó eliminar like ajeno #{instance.id}")
             raise PermissionDenied("Solo puedes eliminar tus propios likes.")
-        instance.delete()
+        likes.like_producto(instance.usuario_id, instance.producto_id, False)
 
 # Compras y pedidos del usuario
 class ComprarView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
-        usuario = request.user
-        carrito = getattr(usuario, 'carrito', None)
-        if not carrito or not carrito.items.exists():
-            return Response({'error': 'El carrito está vacío.'}, status=400)
-        productos_sin_stock = []
-        for item in carrito.items.select_related('producto'):
-            if not item.producto.activo or item.producto.stock < item.cantidad:
-                productos_sin_stock.append({
-                    'producto_id': item.producto.id,
-                    'nombre': item.producto.nombre,
-                    'stock': item.producto.stock,
-                    'solicitado': item.cantidad
-                })
-        if productos_sin_stock:
-            return Response({'error': 'Algunos productos no tienen stock suficiente.', 'productos': productos_sin_stock}, status=400)
-        pedido = Pedido.objects.create(
-            usuario=usuario,
-            total=sum(item.producto.precio * item.cantidad for item in carrito.items.all()),
-            estado='pendiente',
-        )
-        for item in carrito.items.select_related('producto'):
-            DetallePedido.objects.create(
-                pedido=pedido,
-                producto=item.producto,
-                cantidad=item.cantidad,
-                precio_unitario=item.producto.precio,
-            )
-            item.producto.stock -= item.cantidad
-            if item.producto.stock == 0:
-                item.producto.activo = False
-            item.producto.save()
-        carrito.items.all().delete()
-        pdf_content = generar_pdf_pedido(pedido)
-        pdf_filename = f'factura_{pedido.id}.pdf'
-        pedido.factura.save(pdf_filename, pdf_content)
-        pedido.save()
+        try:
+            pedido = procesar_compra(request.user)
+        except CompraError as e:
+            respuesta = {'error': e.mensaje}
+            if e.fallos:
+                respuesta['productos'] = e.fallos
+            return Response(respuesta, status=400)
+        # La factura se genera en segundo plano; el cliente consulta factura_estado en sus compras
         return Response({
             'success': f'Compra realizada correctamente. Pedido #{pedido.id}',
             'pedido_id': pedido.id,
-            'factura_url': pedido.factura.url,
+            'total': float(pedido.total),
+            'factura_estado': pedido.factura_estado,
+            'factura_url': None,
         })
 class ComprasUsuarioView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -430,7 +485,7 @@ class ComprasUsuarioView(APIView):
         if not request.user or not request.user.is_authenticated:
             return Response({'detail': 'Authentication credentials were not provided.'}, status=401)
         usuario = request.user
-        pedidos = Pedido.objects.filter(usuario=usuario).order_by('-creado')
+        pedidos = Pedido.objects.filter(usuario=usuario).select_related('estado').prefetch_related('detalles__producto').order_by('-creado')
         estado = request.query_params.get('estado')
         fecha_inicio = request.query_params.get('fecha_inicio')
         fecha_fin = request.query_params.get('fecha_fin')
@@ -440,18 +495,19 @@ class ComprasUsuarioView(APIView):
             pedidos = pedidos.filter(creado__gte=fecha_inicio)
         if fecha_fin:
             pedidos = pedidos.filter(creado__lte=fecha_fin)
-        paginator = PageNumberPagination()
+        paginator = KeysetPagination()
         paginator.page_size = 10
         page = paginator.paginate_queryset(pedidos, request)
         data = []
         for pedido in page:
-            detalles = DetallePedido.objects.filter(pedido=pedido)
+            detalles = pedido.detalles.all()
             data.append({
                 'id': pedido.id,
                 'creado': pedido.creado,
                 'estado': pedido.estado.nombre if pedido.estado else None,
                 'total': float(pedido.total),
-                'factura_url': pedido.pdf.url if pedido.pdf else None,
+                'factura_estado': pedido.factura_estado,
+                'factura_url': url_factura(request, pedido),
                 'detalles': [
                     {
                         'producto': d.producto.nombre,
@@ -462,11 +518,30 @@ class ComprasUsuarioView(APIView):
             })
         return paginator.get_paginated_response(data)
 
+# Descarga de la factura PDF del pedido (propietario o admin)
+class FacturaPedidoView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    def get(self, request, pedido_id):
+        pedidos = Pedido.objects.select_related('usuario')
+        if not request.user.is_staff:
+            pedidos = pedidos.filter(usuario=request.user)
+        pedido = pedidos.filter(pk=pedido_id).first()
+        if not pedido:
+            return Response({'error': 'Pedido no encontrado.'}, status=404)
+        if not factura_vigente(pedido):
+            # Pedido modificado, archivo ausente o aún sin generar: se (re)genera en segundo plano
+            solicitar_factura(pedido)
+            return Response({'factura_estado': 'pendiente', 'detail': 'La factura se está generando.'}, status=202)
+        return respuesta_archivo(
+            request, pedido.pdf.storage, pedido.pdf.name, f'"{pedido.factura_huella}"',
+            f'factura_{pedido.id}.pdf', 'application/pdf', adjunto=request.query_params.get('inline') != '1',
+        )
+
 # Historial de acciones del cliente
 class HistorialAccionClienteView(generics.ListAPIView):
     serializer_class = HistorialAccionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     def get_queryset(self):
         qs = self.request.user.historial_acciones.all().order_by('-fecha')
         accion = self.request.query_params.get('accion')
@@ -478,15 +553,20 @@ class HistorialAccionClienteView(generics.ListAPIView):
 class ClienteStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request):
-        # Implementa tu lógica de stats aquí
-        return Response({'stats': 'Estadísticas de cliente'})
+        return Response(stats.historial_compras(request.user))
 
 # Búsqueda avanzada de productos y destacados
-class ProductoPagination(PageNumberPagination):
+class ProductoPagination(KeysetPagination):
     page_size = 12
-    page_size_query_param = 'page_size'
     max_page_size = 50
 
+# Órdenes públicos del catálogo; cada uno tiene su índice compuesto (campo, id) en Producto
+# vendidos_total es el ranking histórico de más vendidos (ver tienda.rankings)
+ORDENES_PRODUCTO = ['nombre', 'precio', 'stock', 'fecha_creacion', 'likes_total', 'resenas_total', 'calificacion_promedio', 'vendidos_total']
+
+def orden_producto(ordering):
+    return ordering if ordering and ordering.lstrip('-') in ORDENES_PRODUCTO else '-fecha_creacion'
+
 # Vistas públicas para categorías y productos
 class CategoriaPublicaListView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -495,20 +575,28 @@ class CategoriaPublicaListView(APIView):
     def get(self, request):
         logger.info(f"[API] CategoriaPublicaListView GET consumido desde {request.META.get('REMOTE_ADDR')}")
         try:
-            queryset = Categoria.objects.filter(activa=True).order_by('nombre')
-            serializer = CategoriaPublicaSerializer(queryset, many=True)
-            response = Response(serializer.data)
-            
-            # Headers de caché profesionales
-            response['Cache-Control'] = 'public, max-age=3600, stale-while-revalidate=1800'
-            response['ETag'] = f'"categorias-{queryset.count()}-{timezone.now().timestamp()}"'
-            response['Vary'] = 'Accept-Encoding'
-            
-            return response
+            def construir():
+                queryset = Categoria.objects.filter(activa=True).annotate(
+                    subcategorias_activas=Count('subcategorias', filter=models.Q(subcategorias__activa=True))
+                ).order_by('nombre')
+                return CategoriaPublicaSerializer(queryset, many=True).data
+            return respuesta_catalogo(request, 'categorias', construir, 'public, max-age=3600, stale-while-revalidate=1800')
         except Exception as e:
             logger.error(f"[API] Error en CategoriaPublicaListView: {e}")
             return Response({'error': 'Error interno del servidor'}, status=500)
 
+# Menú completo: categorías → subcategorías con conteo de productos disponibles
+class CategoriaArbolView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        try:
+            return respuesta_catalogo(request, 'categorias-arbol', arbol_categorias, 'public, max-age=3600, stale-while-revalidate=1800')
+        except Exception as e:
+            logger.error(f"[API] Error en CategoriaArbolView: {e}")
+            return Response({'error': 'Error interno del servidor'}, status=500)
+
 class SubcategoriaPublicaListView(APIView):
     permission_classes = [permissions.AllowAny]
     authentication_classes = []
@@ -516,16 +604,10 @@ class SubcategoriaPublicaListView(APIView):
     def get(self, request, categoria_id):
         logger.info(f"[API] SubcategoriaPublicaListView GET para categoría {categoria_id}")
         try:
-            queryset = Subcategoria.objects.filter(activa=True, categoria_id=categoria_id).order_by('nombre')
-            serializer = SubcategoriaSerializer(queryset, many=True)
-            response = Response(serializer.data)
-            
-            # Headers de caché profesionales
-            response['Cache-Control'] = 'public, max-age=1800, stale-while-revalidate=900'
-            response['ETag'] = f'"subcategorias-{categoria_id}-{queryset.count()}-{timezone.now().timestamp()}"'
-            response['Vary'] = 'Accept-Encoding'
-            
-            return response
+            def construir():
+                queryset = Subcategoria.objects.filter(activa=True, categoria_id=categoria_id).order_by('nombre')
+                return SubcategoriaSerializer(queryset, many=True).data
+            return respuesta_catalogo(request, f'subcategorias-{categoria_id}', construir, 'public, max-age=1800, stale-while-revalidate=900')
         except Exception as e:
             logger.error(f"[API] Error en SubcategoriaPublicaListView: {e}")
             return Response({'error': 'Error interno del servidor'}, status=500)
@@ -536,17 +618,12 @@ class AllProductosView(APIView):
     
     def get(self, request):
         logger.info(f"[API] AllProductosView GET consumido desde {request.META.get('REMOTE_ADDR')}")
+        campos = campos_solicitados(request)
         try:
-            queryset = Producto.objects.filter(activo=True, stock__gt=0).order_by('-fecha_creacion')
-            serializer = ProductoSerializer(queryset, many=True)
-            response = Response(serializer.data)
-            
-            # Headers de caché profesionales
-            response['Cache-Control'] = 'public, max-age=1800, stale-while-revalidate=900'
-            response['ETag'] = f'"productos-{queryset.count()}-{timezone.now().timestamp()}"'
-            response['Vary'] = 'Accept-Encoding'
-            
-            return response
+            def construir():
+                queryset = Producto.objects.filter(activo=True, stock__gt=0).order_by('-fecha_creacion')
+                return lectura.productos.convertir(lectura.productos.valores(queryset, campos), campos)
+            return respuesta_catalogo(request, 'productos', construir, 'public, max-age=300, stale-while-revalidate=900', con_contadores=True)
         except Exception as e:
             logger.error(f"[API] Error en AllProductosView: {e}")
             return Response({'error': 'Error interno del servidor'}, status=500)
@@ -554,60 +631,125 @@ class AllProductosView(APIView):
 class BusquedaProductoView(APIView):
     permission_classes = [permissions.AllowAny]
     authentication_classes = []
+
+    @staticmethod
+    def parametros(request):
+        """Parámetros canonizados: texto normalizado, números parseados, orden validado y valores por defecto aplicados."""
+        params = request.query_params
+        q = ' '.join(busqueda.palabras(params.get('q', '')))
+        if q and 'ordering' not in params:
+            ordering = 'relevancia'
+        else:
+            ordering = orden_producto(params.get('ordering'))
+        canonicos = {
+            'q': q,
+            'ordering': ordering,
+            'page_size': ProductoPagination().get_page_size(request),
+            'cursor': params.get('cursor'),
+            'total': '1' if params.get('total') in ('1', 'true') else None,
+            'destacados': '1' if params.get('destacados') == '1' else None,
+            'facetas': '1' if params.get('facetas') == '1' else None,
+            'fields': ','.join(campos_solicitados(request) or ()),
+        }
+        for nombre, tipo in (('categoria', int), ('subcategoria', int), ('precio_min', Decimal), ('precio_max', Decimal), ('stock_min', int), ('stock_max', int)):
+            valor = params.get(nombre)
+            if valor:
+                try:
+                    valor = format(Decimal(valor).normalize(), 'f') if tipo is Decimal else str(int(valor))
+                except (ValueError, ArithmeticError):
+                    pass
+            canonicos[nombre] = valor
+        return canonicos
+
     def get(self, request):
-        q = request.query_params.get('q', '')
-        categoria = request.query_params.get('categoria')
-        subcategoria = request.query_params.get('subcategoria')
-        destacados = request.query_params.get('destacados')
-        precio_min = request.query_params.get('precio_min')
-        precio_max = request.query_params.get('precio_max')
-        stock_min = request.query_params.get('stock_min')
-        stock_max = request.query_params.get('stock_max')
-        ordering = request.query_params.get('ordering', '-fecha_creacion')
-        queryset = Producto.objects.filter(activo=True, stock__gt=0)
-        if q:
-            queryset = queryset.filter(nombre__icontains=q)
-        if categoria:
-            queryset = queryset.filter(subcategoria__categoria_id=categoria)
-        if subcategoria:
-            queryset = queryset.filter(subcategoria_id=subcategoria)
-        if destacados == '1':
-            queryset = queryset.filter(destacado=True)
-        if precio_min:
-            queryset = queryset.filter(precio__gte=precio_min)
-        if precio_max:
-            queryset = queryset.filter(precio__lte=precio_max)
-        if stock_min:
-            queryset = queryset.filter(stock__gte=stock_min)
-        if stock_max:
-            queryset = queryset.filter(stock__lte=stock_max)
-        ordering_fields = ['nombre', 'precio', 'stock', 'fecha_creacion']
-        if ordering.lstrip('-') not in ordering_fields:
-            ordering = '-fecha_creacion'
-        queryset = queryset.order_by(ordering)
-        paginator = ProductoPagination()
-        page = paginator.paginate_queryset(queryset, request)
-        logger.info(f"Busqueda avanzada realizada. Params: {request.query_params}")
-        return paginator.get_paginated_response(ProductoSerializer(page, many=True).data)
+        p = self.parametros(request)
+        huella, descripcion = resultados.clave_canonica('busqueda', p)
+
+        campos = tuple(p['fields'].split(',')) if p['fields'] else None
+
+        def calcular():
+            q = p['q']
+            queryset = Producto.objects.filter(activo=True, stock__gt=0)
+            if p['categoria']:
+                queryset = queryset.filter(subcategoria__categoria_id=p['categoria'])
+            if p['subcategoria']:
+                queryset = queryset.filter(subcategoria_id=p['subcategoria'])
+            if p['destacados']:
+                queryset = queryset.filter(destacado=True)
+            if p['precio_min']:
+                queryset = queryset.filter(precio__gte=p['precio_min'])
+            if p['precio_max']:
+                queryset = queryset.filter(precio__lte=p['precio_max'])
+            if p['stock_min']:
+                queryset = queryset.filter(stock__gte=p['stock_min'])
+            if p['stock_max']:
+                queryset = queryset.filter(stock__lte=p['stock_max'])
+            paginator = ProductoPagination()
+            con_texto = bool(q and busqueda.tokenizar(q))
+            if con_texto and p['ordering'] == 'relevancia':
+                # Orden por relevancia: se pagina la lista de ids del índice y solo se cargan los productos de la página
+                pagina_ids = paginator.paginate_list(busqueda.buscar(q, queryset), request)
+                productos = aplicar_campos(Producto.objects.all(), campos).in_bulk(pagina_ids)
+                data = paginator.get_paginated_response(ProductoSerializer([productos[pk] for pk in pagina_ids], many=True, campos=campos).data).data
+            else:
+                filtrado = busqueda.filtrar(q, queryset) if con_texto else queryset
+                orden = orden_producto(p['ordering'])
+                page = paginator.paginate_queryset(aplicar_campos(filtrado, campos, [orden]).order_by(orden), request)
+                data = paginator.get_paginated_response(ProductoSerializer(page, many=True, campos=campos).data).data
+            if p['facetas']:
+                data['facetas'] = facetas.facetas(request, lambda: busqueda.filtrar(q, queryset) if con_texto else queryset)
+            return data
+
+        data, estado = resultados.obtener(huella, descripcion, calcular)
+        logger.info(f"Busqueda avanzada realizada ({estado}). Params: {descripcion}")
+        # Los enlaces guardados se armaron con la consulta de quien llenó la caché
+        response = Response(reenlazar(data, request))
+        response['X-Cache'] = estado
+        return response
+
+# Autocompletado del buscador (tolerante a errores de tipeo)
+class SugerenciasBusquedaView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    def get(self, request):
+        q = request.query_params.get('q', '')[:100]
+        try:
+            limite = min(max(int(request.query_params.get('limite', 10)), 1), 20)
+        except ValueError:
+            limite = 10
+        resultados = sugerencias.obtener_indice().sugerir(q, limite) if len(q.strip()) >= 2 else []
+        response = Response({'q': q, 'sugerencias': resultados})
+        response['Cache-Control'] = 'public, max-age=60'
+        return response
+
 class ProductosDestacadosView(APIView):
     permission_classes = [permissions.AllowAny]
     authentication_classes = []
     def get(self, request):
         logger.info(f"[API] ProductosDestacadosView GET consumido desde {request.META.get('REMOTE_ADDR')} | User-Agent: {request.META.get('HTTP_USER_AGENT', '')}")
+        campos = campos_solicitados(request)
         try:
-            ordering = request.query_params.get('ordering', '-fecha_creacion')
-            queryset = Producto.objects.filter(activo=True, destacado=True, stock__gt=0)
-            queryset = queryset.select_related('subcategoria') \
-                .prefetch_related('imagenes') \
-                .annotate(
-                    total_reseñas=Count('comentarios', filter=models.Q(comentarios__activo=True), distinct=True),
-                    total_likes=Count('likes', distinct=True),
-                    calificacion_promedio=Avg('calificaciones__valor')
-                ).order_by(ordering if ordering else '-fecha_creacion')
-            paginator = ProductoPagination()
-            page = paginator.paginate_queryset(queryset, request)
-            logger.info(f"Busqueda avanzada realizada. Params: {request.query_params}")
-            return paginator.get_paginated_response(ProductoSerializer(page, many=True).data)
+            params = request.query_params
+            ordering = orden_producto(params.get('ordering'))
+            huella, descripcion = resultados.clave_canonica('destacados', {
+                'ordering': ordering,
+                'fields': ','.join(campos or ()),
+                'page_size': ProductoPagination().get_page_size(request),
+                'cursor': params.get('cursor'),
+                'total': '1' if params.get('total') in ('1', 'true') else None,
+            })
+
+            def calcular():
+                queryset = Producto.objects.filter(activo=True, destacado=True, stock__gt=0)
+                queryset = lectura.productos.valores(queryset.order_by(ordering), campos, [ordering])
+                paginator = ProductoPagination()
+                page = paginator.paginate_queryset(queryset, request)
+                return paginator.get_paginated_response(lectura.productos.convertir(page, campos)).data
+
+            data, estado = resultados.obtener(huella, descripcion, calcular)
+            response = Response(reenlazar(data, request))
+            response['X-Cache'] = estado
+            return response
         except Exception as e:
             logger.error(f"[API] Error en ProductosDestacadosView: {e}")
             return Response({'error': 'Error interno del servidor'}, status=500)
@@ -640,18 +782,31 @@ class DetallePedidoViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return DetallePedido.objects.filter(pedido__usuario=self.request.user)
     def perform_create(self, serializer):
-        detalle = serializer.save(usuario=self.request.user)
-        producto = detalle.producto
-        cantidad = detalle.cantidad
-        if producto.stock < cantidad:
-            logger.error(f"Stock insuficiente para producto {producto.nombre}. Stock: {producto.stock}, solicitado: {cantidad}")
-            raise PermissionDenied(f"Stock insuficiente para {producto.nombre}.")
-        producto.stock -= cantidad
-        if producto.stock == 0:
-            producto.activo = False
-        producto.save()
+        if serializer.validated_data['pedido'].usuario_id != self.request.user.id:
+            raise PermissionDenied("Solo puedes agregar detalles a tus propios pedidos.")
+        with transaction.atomic():
+            detalle = serializer.save()
+            try:
+                # Salida en el libro de inventario y descuento condicional del stock en la misma transacción
+                movimientos.venta([detalle], usuario=self.request.user)
+            except movimientos.StockInsuficiente:
+                logger.error(f"Stock insuficiente para producto {detalle.producto_id}, solicitado: {detalle.cantidad}")
+                raise PermissionDenied(f"Stock insuficiente para {detalle.producto.nombre}.")
+            if Producto.objects.filter(pk=detalle.producto_id, stock=0).update(activo=False):
+                # update() no emite post_save: se hace lo mismo que la compra del carrito al agotar un producto
+                producto = detalle.producto
+                transaction.on_commit(lambda: sugerencias.registrar_cambio('producto', producto.pk, producto.nombre, False))
+                invalidar_producto(producto.pk)
         logger.info(f"Detalle de pedido creado y stock actualizado por usuario {self.request.user.numero}")
 
+# Ficha de producto: producto, imágenes, agregados, primeros hilos del foro y relacionados
+class ProductoDetalleView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    def get(self, request, producto_id):
+        nombre = f'producto-{producto_id}-{version_producto(producto_id)}'
+        return respuesta_catalogo(request, nombre, lambda: ficha.construir_ficha(producto_id), 'public, max-age=300, stale-while-revalidate=600')
+
 # Imágenes de productos (solo consulta)
 class ImagenesProductoView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -45,7 +45,7 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.gzip.GZipMiddleware",  # Compresión GZIP
+    "tienda.middleware.GZipMiddleware",  # Compresión GZIP (omite descargas con rangos)
     "tienda.middleware.CSRFMiddleware",  # Middleware personalizado para CSRF
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -227,25 +227,66 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
-# Configuración de caché para optimización de rendimiento
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5 minutos
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+# Configuración de caché compartida entre workers de gunicorn
+# CACHE_BACKEND=sqlite (por defecto, archivo local compartido por todos los procesos, sin servicios externos)
+# CACHE_BACKEND=redis  (requiere el paquete redis y REDIS_URL)
+# CACHE_BACKEND=memoria (LocMem por proceso, solo desarrollo)
+CACHE_BACKEND = env('CACHE_BACKEND', default='sqlite')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'tienda.cache_backends.MetricasRedisCache',
+            'LOCATION': env('REDIS_URL', default='redis://127.0.0.1:6379/0'),
+            'TIMEOUT': 300,  # 5 minutos
         }
     }
+elif CACHE_BACKEND == 'memoria':
+    CACHES = {
+        'default': {
+            'BACKEND': 'tienda.cache_backends.MetricasLocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 300,  # 5 minutos
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+            }
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'tienda.cache_backends.SQLiteCache',
+            'LOCATION': env('CACHE_SQLITE_PATH', default=str(BASE_DIR / 'cache' / 'yecy_cache.sqlite3')),
+            'TIMEOUT': 300,  # 5 minutos
+            'OPTIONS': {
+                'MAX_ENTRIES': 20000,
+                'CULL_FREQUENCY': 4,
+            }
+        }
+    }
+
+# TTL por espacio de nombres (prefijo de la clave antes de ':'), aplicado cuando no se indica timeout explícito
+CACHE_TTL_NAMESPACES = {
+    'recuperar': 300,  # códigos de recuperación de contraseña
+    'catalogo': 60 * 60,  # respuestas renderizadas del catálogo
 }
 
+# Likes: con True los contadores se acumulan en la caché y el worker procesar_tareas los vuelca en lote
+# (para picos de likes sobre un mismo producto); requiere una caché compartida entre procesos
+LIKES_CONTADORES_EN_CACHE = env.bool('LIKES_CONTADORES_EN_CACHE', default=False)
+
+# Segundos que el carrito aparta las unidades de cada línea que se agrega o cambia (0 desactiva las reservas)
+RESERVA_CARRITO_SEGUNDOS = env.int('RESERVA_CARRITO_SEGUNDOS', default=900)
+
+# Cada cuántas horas el worker guarda una foto del stock de todos los productos (ver tienda.movimientos)
+INVENTARIO_FOTOS_HORAS = env.int('INVENTARIO_FOTOS_HORAS', default=24)
+
 # Configuración de compresión para respuestas HTTP
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.gzip.GZipMiddleware",  # Compresión GZIP
+    "tienda.middleware.GZipMiddleware",  # Compresión GZIP (omite descargas con rangos)
     "tienda.middleware.CSRFMiddleware",  # Middleware personalizado para CSRF
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -338,5 +379,3 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-# Carrito de compras
-CART_SESSION_ID = 'cart'